@@ -0,0 +1,158 @@
+import hashlib
+import marshal
+import os
+import threading
+from collections import OrderedDict
+from dsl.program import COMPILER_VERSION, Program, compile_script
+
+# 编译缓存文件的魔数
+CACHE_MAGIC = b'DSLC'
+
+# 默认的缓存目录名，位于脚本所在目录下
+CACHE_DIR_NAME = '__dslcache__'
+
+
+def source_hash(code):
+    """ 计算脚本源码和编译器版本的哈希值，作为编译缓存的键 """
+    digest = hashlib.sha256(f'{COMPILER_VERSION}:'.encode('utf-8'))
+    digest.update(code.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """ 基于内容哈希的磁盘编译缓存，命中时跳过词法分析、语法分析和编译 """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir  # 为 None 时缓存文件放在脚本旁边的 __dslcache__ 目录中
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, script_path):
+        """ 返回脚本对应的缓存文件路径 """
+        script_path = os.path.abspath(script_path)
+        cache_dir = self.cache_dir or os.path.join(os.path.dirname(script_path), CACHE_DIR_NAME)
+        return os.path.join(cache_dir, os.path.basename(script_path) + 'c')
+
+    def load(self, script_path, code):
+        """ 读取缓存的程序，缓存不存在、已损坏或与源码不一致时返回 None """
+        try:
+            with open(self.path_for(script_path), 'rb') as file:
+                if file.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                    return None
+                version, digest, program = marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if version != COMPILER_VERSION or digest != source_hash(code):
+            return None
+        return Program(program)
+
+    def store(self, script_path, code, program):
+        """ 写入缓存文件，先写临时文件再替换，避免读到写了一半的缓存 """
+        path = self.path_for(script_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(CACHE_MAGIC)
+            marshal.dump((COMPILER_VERSION, source_hash(code), program.data), file)
+        os.replace(temp_path, path)
+
+    def compile(self, script_path, code=None):
+        """ 返回脚本编译后的程序，缓存失效时自动重新编译并更新缓存 """
+        if code is None:
+            with open(script_path, 'r', encoding='utf-8') as file:
+                code = file.read()
+
+        program = self.load(script_path, code)
+        if program is not None:
+            self.hits += 1
+            return program
+
+        self.misses += 1
+        program = Program(compile_script(code))
+        try:
+            self.store(script_path, code, program)
+        except OSError:
+            # 缓存目录不可写时只是失去缓存，不影响运行
+            pass
+        return program
+
+
+class CompileCache:
+    """ 进程内的LRU编译缓存，同一份脚本的所有会话共享一个编译结果 """
+
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries  # 最多缓存的程序数量
+        self.max_bytes = max_bytes  # 所有缓存程序序列化后的总字节数上限
+        self.entries = OrderedDict()  # 源码哈希 -> (程序, 字节数)，按最近使用排序
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, code):
+        """ 返回脚本编译后的程序，未命中时编译并放入缓存 """
+        key = source_hash(code)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # 编译过程不持有锁，其他脚本的查询不会被阻塞
+        data = compile_script(code)
+        size = len(marshal.dumps(data))
+        program = Program(data)
+
+        with self.lock:
+            if key not in self.entries and size <= self.max_bytes:
+                self.entries[key] = (program, size)
+                self.total_bytes += size
+                self.evict()
+        return program
+
+    def evict(self):
+        """ 淘汰最久未使用的程序，直到数量和字节数都在限制之内 """
+        while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            _, (_, size) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def invalidate(self, code=None):
+        """ 使某个脚本的缓存失效，不传参数时清空整个缓存 """
+        with self.lock:
+            if code is None:
+                self.entries.clear()
+                self.total_bytes = 0
+                return
+            entry = self.entries.pop(source_hash(code), None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+
+    def stats(self):
+        """ 返回缓存的命中、未命中和淘汰统计 """
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+# 进程内共享的编译缓存
+COMPILE_CACHE = CompileCache()
+
+
+# 接口方法
+def load_program(script_path, cache_dir=None):
+    cache = DiskCache(cache_dir)
+    return cache.compile(script_path)
+
+def compile_cached(code):
+    return COMPILE_CACHE.get(code)
@@ -0,0 +1,108 @@
+# 代码生成后端：把每个模式编译成一个专用的 Python 函数。
+# 分支条件、回复常量和 go/set 操作都直接写进生成的源码，运行时不再查找分支对象或按操作类型分派。
+
+from dsl.program import Program, GO, SET_ADD
+from dsl.matcher import first_match
+
+# 分支数量不超过该值时直接生成 `in` 判断链，超过时改用模式的 Aho-Corasick 自动机选择分支
+INLINE_BRANCH_LIMIT = 16
+
+
+def generate_mode(program, mode_id):
+    """ 生成一个模式的处理函数的源码 """
+    mode = program.modes[mode_id]
+    keyword_groups = [condition['condition'] for condition in program.data[mode.name]['branches']]
+
+    lines = [f"def mode_{mode_id}(session, user_input):", f"    # {mode.name}"]
+    if len(mode.branches) <= INLINE_BRANCH_LIMIT:
+        for index, (branch, keywords) in enumerate(zip(mode.branches, keyword_groups)):
+            test = ' or '.join(f"{keyword!r} in user_input" for keyword in keywords)
+            lines.append(f"    {'if' if index == 0 else 'elif'} {test}:")
+            lines.extend(generate_branch(program, branch, '        '))
+        if mode.else_branch is not None and mode.branches:
+            lines.append("    else:")
+            lines.extend(generate_branch(program, mode.else_branch, '        '))
+        elif mode.else_branch is not None:
+            lines.extend(generate_branch(program, mode.else_branch, '    '))
+    else:
+        lines.append(f"    index = first_match(matcher_{mode_id}, user_input)")
+        for index, branch in enumerate(mode.branches):
+            lines.append(f"    {'if' if index == 0 else 'elif'} index == {index}:")
+            lines.extend(generate_branch(program, branch, '        '))
+        if mode.else_branch is not None:
+            lines.append("    else:")
+            lines.extend(generate_branch(program, mode.else_branch, '        '))
+    lines.append("    return None")
+    return '\n'.join(lines)
+
+
+def generate_branch(program, branch, indent):
+    """ 生成命中一个分支后执行的语句：go/set 操作，然后返回回复 """
+    lines = []
+    for effect in branch.effects:
+        if effect[0] == GO:
+            lines.append(f"session.mode = {effect[1]}  # go {effect[2]}")
+        elif effect[0] == SET_ADD:
+            _, variable, left = effect
+            left_value = "session.balance" if left == 'balance' else f"session.get({left!r})"
+            lines.append("try:")
+            lines.append("    right = float(user_input)")
+            if variable == 'balance':
+                lines.append(f"    session.balance = {left_value} + right")
+            else:
+                lines.append(f"    session.assign({variable!r}, {left_value} + right)")
+            lines.append("except ValueError:")
+            lines.append("    report_invalid_number(user_input)")
+
+    lines.append("if '充值' in user_input:")
+    lines.append("    return prompt_for_recharge(session)")
+    if branch.template is not None:
+        format_string, names = branch.template
+        values = ', '.join("session.balance" if name == 'balance' else f"session.get({name!r})" for name in names)
+        lines.append(f"return {format_string!r}.format({values})")
+    else:
+        lines.append(f"return {branch.response!r}")
+    return [indent + line for line in lines]
+
+
+def generate_source(program):
+    """ 生成整个程序的源码，每个模式一个函数 """
+    return '\n\n'.join(generate_mode(program, mode_id) for mode_id in range(len(program.modes))) + '\n'
+
+
+class GeneratedProgram:
+    """ 使用生成代码运行的程序，与 Program 共享会话格式，结果与 Program.step 一致 """
+
+    def __init__(self, program):
+        if not isinstance(program, Program):
+            program = Program(program)
+        self.program = program
+        self.normalizer = program.normalizer  # 生成的代码中的关键字已经规范化，输入在 step 中规范化
+        self.source = generate_source(program)
+
+        namespace = {
+            'first_match': first_match,
+            'prompt_for_recharge': program.prompt_for_recharge,
+            'report_invalid_number': program.report_invalid_number,
+        }
+        for mode_id, mode in enumerate(program.modes):
+            namespace[f'matcher_{mode_id}'] = mode.matcher
+        exec(compile(self.source, '<dsl generated>', 'exec'), namespace)
+        self.functions = tuple(namespace[f'mode_{mode_id}'] for mode_id in range(len(program.modes)))
+
+    @classmethod
+    def from_source(cls, code):
+        """ 编译脚本源码 """
+        return cls(Program.from_source(code))
+
+    def new_session(self, balance=0.0):
+        """ 创建一个处于 INIT 模式的新会话 """
+        return self.program.new_session(balance)
+
+    def step(self, session, user_input):
+        """ 处理会话的一条用户输入，更新会话状态并返回回复 """
+        if self.normalizer is not None:
+            user_input = self.normalizer(user_input)
+        if session.pending is not None:
+            return self.program.pending_handlers[session.pending](self.program, session, user_input)
+        return self.functions[session.mode](session, user_input)
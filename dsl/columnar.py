@@ -0,0 +1,173 @@
+try:
+    import numpy as np
+except ImportError:  # numpy 是可选依赖，只有列式会话存储需要它
+    np = None
+
+from dsl.program import GO, SET_ADD, RECHARGE, Session
+
+# pending 列中的编码，0 表示没有等待中的输入
+PENDING_CODES = {None: 0, RECHARGE: 1}
+PENDING_KINDS = {code: kind for kind, code in PENDING_CODES.items()}
+
+
+class ColumnarSessionStore:
+    """ 列式会话存储：每个会话是一行，模式编号、余额和自定义变量分别存放在 NumPy 数组中 """
+
+    def __init__(self, program, capacity=1024):
+        if np is None:
+            raise ImportError("ColumnarSessionStore requires numpy")
+
+        self.program = program
+        self.size = 0  # 已创建的会话数量
+        self.modes = np.zeros(capacity, dtype=np.int32)  # 当前模式编号
+        self.balance = np.zeros(capacity, dtype=np.float64)
+        self.pending = np.zeros(capacity, dtype=np.int8)  # 等待中的输入，编码见 PENDING_CODES
+
+        # 脚本中所有 set 语句赋值的变量，各占一列
+        self.variables = {}
+        for mode in program.modes:
+            for branch in mode.branches + ((mode.else_branch,) if mode.else_branch else ()):
+                for effect in branch.effects:
+                    if effect[0] == SET_ADD and effect[1] != 'balance':
+                        self.variables.setdefault(effect[1], np.zeros(capacity, dtype=np.float64))
+
+    def column(self, name):
+        """ 返回变量对应的列，未被赋值过的变量返回 None（值恒为0.0） """
+        if name == 'balance':
+            return self.balance
+        return self.variables.get(name)
+
+    def add_sessions(self, count, balance=0.0):
+        """ 批量创建处于 INIT 模式的新会话，返回它们的编号数组 """
+        start = self.size
+        self.size += count
+        if self.size > len(self.modes):
+            self.grow(max(self.size, 2 * len(self.modes)))
+
+        self.modes[start:self.size] = self.program.init_mode
+        self.balance[start:self.size] = balance
+        self.pending[start:self.size] = 0
+        for column in self.variables.values():
+            column[start:self.size] = 0
+        return np.arange(start, self.size)
+
+    def grow(self, capacity):
+        """ 扩大所有列的容量 """
+        def resized(column):
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            return grown
+
+        self.modes = resized(self.modes)
+        self.balance = resized(self.balance)
+        self.pending = resized(self.pending)
+        self.variables = {name: resized(column) for name, column in self.variables.items()}
+
+    def get_session(self, session_id):
+        """ 把一行取出为 Session 对象（副本），用于查看或逐条处理 """
+        variables = {name: float(column[session_id]) for name, column in self.variables.items() if column[session_id]}
+        return Session(int(self.modes[session_id]), float(self.balance[session_id]),
+                       variables or None, PENDING_KINDS[int(self.pending[session_id])])
+
+    def put_session(self, session_id, session):
+        """ 把 Session 对象写回对应的行 """
+        self.modes[session_id] = session.mode
+        self.balance[session_id] = session.balance
+        self.pending[session_id] = PENDING_CODES[session.pending]
+        for name, column in self.variables.items():
+            column[session_id] = session.get(name)
+
+    def process_batch(self, session_ids, inputs):
+        """ 批量处理消息，返回与输入顺序一致的回复列表 """
+        session_ids = np.asarray(session_ids, dtype=np.int64)
+        inputs = self.program.normalize_inputs(inputs)
+        responses = [None] * len(inputs)
+
+        # 同一个会话的多条消息必须依次处理，每一轮中每个会话最多处理一条消息
+        remaining = np.arange(len(inputs))
+        while len(remaining):
+            _, first = np.unique(session_ids[remaining], return_index=True)
+            current = np.zeros(len(remaining), dtype=bool)
+            current[first] = True
+            self.step_group(session_ids, inputs, remaining[current], responses)
+            remaining = remaining[~current]
+
+        return responses
+
+    def step_group(self, session_ids, inputs, positions, responses):
+        """ 处理一轮消息，每个会话在本轮中只出现一次 """
+        program = self.program
+        rows = session_ids[positions]
+
+        # 等待输入的会话逐条处理
+        waiting = self.pending[rows] != 0
+        for position in positions[waiting]:
+            session_id = session_ids[position]
+            session = self.get_session(session_id)
+            responses[position] = program.pending_handlers[session.pending](program, session, inputs[position])
+            self.put_session(session_id, session)
+        positions = positions[~waiting]
+        rows = rows[~waiting]
+
+        # 按当前模式分组
+        modes = self.modes[rows]
+        order = np.argsort(modes, kind='stable')
+        boundaries = np.flatnonzero(np.diff(modes[order])) + 1
+        for group in np.split(order, boundaries):
+            if not len(group):
+                continue
+            mode = program.modes[modes[group[0]]]
+
+            # 相同的输入只匹配一次，再按命中的分支分组
+            selected = {}
+            taken = {}
+            for position in positions[group]:
+                user_input = inputs[position]
+                if user_input in selected:
+                    branch = selected[user_input]
+                else:
+                    branch = selected[user_input] = mode.select(user_input)
+                if branch is not None:
+                    taken.setdefault(branch, []).append(position)
+
+            for branch, members in taken.items():
+                self.respond_group(session_ids, inputs, branch, np.array(members), responses)
+
+    def respond_group(self, session_ids, inputs, branch, positions, responses):
+        """ 对命中同一分支的会话用向量化的写入执行 go 和 set 操作，并生成回复 """
+        program = self.program
+        rows = session_ids[positions]
+
+        for effect in branch.effects:
+            if effect[0] == GO:
+                self.modes[rows] = effect[1]
+            else:
+                _, variable, left = effect
+                values = np.empty(len(positions), dtype=np.float64)
+                valid = np.ones(len(positions), dtype=bool)
+                for i, position in enumerate(positions):
+                    try:
+                        values[i] = float(inputs[position])  # 这里是需要用户输入数字的地方
+                    except ValueError:
+                        valid[i] = False
+                        program.report_invalid_number(inputs[position])
+
+                targets = rows[valid]
+                left_column = self.column(left)
+                left_values = 0.0 if left_column is None else left_column[targets]
+                self.column(variable)[targets] = left_values + values[valid]
+
+        response = branch.response
+        if branch.template is not None:
+            format_string, names = branch.template
+            columns = [self.column(name) for name in names]
+        for position, session_id in zip(positions, rows):
+            if '充值' in inputs[position]:
+                session = self.get_session(session_id)
+                responses[position] = program.prompt_for_recharge(session)
+                self.put_session(session_id, session)
+            elif branch.template is not None:
+                # 列中的值是 numpy 标量，转换为 float 后 !r 和格式说明的结果才与逐条处理一致
+                responses[position] = format_string.format(*[0.0 if column is None else float(column[session_id]) for column in columns])
+            else:
+                responses[position] = response
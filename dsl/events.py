@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from collections import deque
+
+# 运行时诊断事件的接收器。处理消息时只调用 emit 把事件放入内存，
+# 不在处理消息的过程中向控制台或文件写入。
+#
+# 每个事件是一个字典：{'time': 时间戳, 'kind': 事件类型, ...附加字段}
+
+
+class NullSink:
+    """ 丢弃所有事件，用于性能测试 """
+
+    def emit(self, kind, **fields):
+        pass
+
+    def close(self):
+        pass
+
+
+class RingBufferSink:
+    """ 默认的接收器：只在内存中保留最近的若干个事件 """
+
+    def __init__(self, capacity=1024):
+        self.events = deque(maxlen=capacity)
+        self.dropped = 0  # 因缓冲区已满被丢弃的旧事件数量
+
+    def emit(self, kind, **fields):
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        fields['time'] = time.time()
+        fields['kind'] = kind
+        self.events.append(fields)
+
+    def drain(self):
+        """ 取出并清空缓冲区中的所有事件 """
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+        return events
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink:
+    """ 把事件成批写入 JSON-lines 文件，写入由后台线程完成 """
+
+    def __init__(self, path, batch_size=256, flush_interval=1.0, max_buffer=65536):
+        self.path = path
+        self.batch_size = batch_size  # 缓冲的事件达到该数量时唤醒写入线程
+        self.flush_interval = flush_interval  # 写入线程至少每隔这么多秒写入一次
+        self.max_buffer = max_buffer  # 写入一直失败时最多缓冲的事件数量，缓冲区已满时丢弃新的事件
+        self.buffer = []
+        self.lock = threading.Lock()  # 保护缓冲区
+        self.write_lock = threading.Lock()  # 保证各批事件按顺序写入文件
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.written = 0
+        self.failures = 0  # 写入文件失败的次数
+        self.last_error = None
+        self.dropped = 0  # 因写入失败、缓冲区超出上限而丢弃的事件数量
+        self.writer = threading.Thread(target=self.write_loop, name='dsl-event-writer', daemon=True)
+        self.writer.start()
+
+    def emit(self, kind, **fields):
+        fields['time'] = time.time()
+        fields['kind'] = kind
+        with self.lock:
+            if len(self.buffer) >= self.max_buffer:  # 写入线程跟不上或一直失败，不再占用更多内存
+                self.dropped += 1
+                return
+            self.buffer.append(fields)
+            full = len(self.buffer) >= self.batch_size
+        if full:
+            self.wakeup.set()
+
+    def write_loop(self):
+        """ 后台线程：定时或在缓冲区满时把事件追加到文件，写入失败时在下一个间隔重试 """
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:  # 已记录在 failures 和 last_error 中，写入线程继续运行
+                pass
+
+    def flush(self):
+        """ 把缓冲的事件写入文件，写入失败时事件放回缓冲区 """
+        with self.write_lock:
+            with self.lock:
+                batch, self.buffer = self.buffer, []
+            if not batch:
+                return
+            lines = ''.join(json.dumps(event, ensure_ascii=False, default=repr) + '\n' for event in batch)
+            try:
+                with open(self.path, 'a', encoding='utf-8') as file:
+                    file.write(lines)
+            except Exception as error:
+                # 接收器自己写入失败，无法再通过事件报告，只记录失败次数和最近的错误
+                with self.lock:
+                    self.buffer[:0] = batch  # 写入期间新缓冲的事件可能使总数超出上限，丢弃最旧的
+                    overflow = len(self.buffer) - self.max_buffer
+                    if overflow > 0:
+                        del self.buffer[:overflow]
+                        self.dropped += overflow
+                self.failures += 1
+                self.last_error = error
+                raise
+            self.written += len(batch)
+
+    def close(self):
+        """ 停止写入线程，并写入剩余的事件；最后一次写入失败时只记录在 failures 和 last_error 中 """
+        self.closed = True
+        self.wakeup.set()
+        self.writer.join()
+        try:
+            self.flush()
+        except Exception:  # 已在 flush 中记录，关闭接收器不应使调用者的清理过程失败
+            pass
@@ -0,0 +1,109 @@
+import re
+from dsl.lexer import Lexer
+from dsl.parser import Parser
+
+# 只包含一个模式名的行（可以带注释）是一个模式块的开头，对应 Parser.mode_statement
+MODE_HEADER_REGEX = re.compile(r'^[ \t]*[A-Z]+[ \t]*(?:#.*)?$', re.MULTILINE)
+
+# 追加在每个模式块末尾的哨兵token，用来判断模式块是否恰好在语句边界结束
+BLOCK_END = ('END', 'end')
+
+
+class BlockFragment:
+    """ 一个模式块的解析结果：语句列表、定义的模式，以及是否包含脚本结尾的 'end' """
+
+    def __init__(self, statements, modes, is_last):
+        self.statements = statements
+        self.modes = modes
+        self.is_last = is_last
+
+
+class IncrementalParser:
+    """ 增量前端：按模式块缓存解析结果，脚本修改后只重新词法分析和解析发生变化的模式块 """
+
+    def __init__(self):
+        self.blocks = {}  # 模式块源码 -> BlockFragment
+        self.reused_blocks = 0  # 最近一次解析中直接复用的模式块数量
+        self.parsed_blocks = 0  # 最近一次解析中重新解析的模式块数量
+
+    def parse(self, code):
+        """ 解析整个脚本，返回与 Parser.parse() 相同的AST """
+        self.reused_blocks = 0
+        self.parsed_blocks = 0
+
+        ast = self.parse_blocks(code)
+        if ast is None:
+            # 无法按模式块拆分（或脚本本身有错误）时退回完整解析，保证结果和报错与 Parser 一致
+            self.blocks = {}
+            return Parser(Lexer(code).iter_tokens()).parse()
+        return ast
+
+    def parse_blocks(self, code):
+        """ 按模式块拼装AST，任何一个模式块无法独立解析时返回 None """
+        offsets = [match.start() for match in MODE_HEADER_REGEX.finditer(code)]
+        if not offsets:
+            return None
+
+        # 第一个模式块之前只能有 'start'
+        prologue = list(Lexer(code[:offsets[0]]).iter_tokens())
+        if prologue != [('START', 'start')]:
+            return None
+
+        blocks = {}
+        statements = []
+        modes = set()
+        offsets.append(len(code))
+
+        for start, end in zip(offsets, offsets[1:]):
+            text = code[start:end]
+            fragment = blocks.get(text) or self.blocks.get(text)
+            if fragment is None:
+                fragment = self.parse_block(text)
+                if fragment is None:
+                    return None
+                self.parsed_blocks += 1
+            else:
+                self.reused_blocks += 1
+            blocks[text] = fragment
+
+            # 模式不能在不同的模式块中重复定义
+            if not modes.isdisjoint(fragment.modes):
+                return None
+            modes.update(fragment.modes)
+            statements.extend(fragment.statements)
+
+            if fragment.is_last:
+                break
+        else:
+            # 没有找到 'end'
+            return None
+
+        if 'INIT' not in modes:
+            return None
+
+        # 只保留当前版本脚本中的模式块，避免缓存无限增长
+        self.blocks = blocks
+        return {'type': 'program', 'statements': statements}
+
+    def parse_block(self, text):
+        """ 词法分析并解析单个模式块 """
+        tokens = list(Lexer(text).iter_tokens())
+
+        # 跨模式块的字符串或无法识别的字符只能交给完整解析处理
+        if any(type_ in ('QUOTE', 'MISMATCH') for type_, _ in tokens):
+            return None
+
+        tokens.append(BLOCK_END)
+        parser = Parser(tokens)
+        try:
+            statements = parser.statement_list()
+        except (SyntaxError, TypeError):
+            return None
+
+        if parser.token is BLOCK_END:
+            return BlockFragment(statements, parser.modes, False)
+        if parser.token is not None and parser.token[0] == 'END':
+            # 脚本真正的 'end'，其后的内容与 Parser 一样被忽略
+            return BlockFragment(statements, parser.modes, True)
+        # 哨兵被某条语句当作值读走，说明该模式块没有在语句边界结束
+        return None
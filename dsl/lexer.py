@@ -1,23 +1,13 @@
 import re
+import sys
+from array import array
 
 # 定义不同的词法记号（tokens）
 TOKEN_SPECIFICATIONS = [
     ('NUMBER', r'\d+'),  # 整数
     ('STRING', r'"([^"]*)"'),  # 双引号中的字符串
-    ('IF', r'if'),  # 'if' 关键字
-    ('ELIF', r'elif'),  # 'elif' 关键字
-    ('THEN', r'then'),  # 'then' 关键字
-    ('ELSE', r'else'),  # 'else' 关键字
-    ('RESPONSE', r'response'),  # 'response' 关键字
-    ('START', r'start'),  # 'start' 关键字
-    ('END', r'end'),  # 'end' 关键字
-    ('USER_INPUT', r'user_input'),  # 'user_input' 变量
-    ('GO', r'go'),  # 'go' 关键字
     ('QUOTE', r'"'),  # 双引号字符
-    ('IN', r'in'),  # 'in' 关键字，用于检查是否包含在列表或字符串中
-    ('SET', r'set'),  # 'set' 关键字，用于赋值
-    ('MODE', r'[A-Z][A-Z]*'),  # 大写字母的单词，作为模式（MODE）
-    ('ID', r'[a-zA-Z_][a-zA-Z0-9_]*'),  # 标识符（例如：'account'、'payment'）
+    ('NAME', r'[a-zA-Z_][a-zA-Z0-9_]*'),  # 完整的单词，扫描后查表区分关键字、模式（MODE）和标识符（ID）
     ('NEWLINE', r'\n'),  # 换行符
     ('SKIP', r'[ \t]+'),  # 跳过空格和制表符
     ('COMMENT', r'#.*'),  # 注释，单行注释以'#'开头
@@ -26,44 +16,198 @@ TOKEN_SPECIFICATIONS = [
     ('MISMATCH', r'.'),  # 任何其他字符（错误）
 ]
 
+# 关键字表，单词扫描完成后通过一次字典查找得到其token类型
+KEYWORDS = {
+    'if': 'IF',  # 'if' 关键字
+    'elif': 'ELIF',  # 'elif' 关键字
+    'then': 'THEN',  # 'then' 关键字
+    'else': 'ELSE',  # 'else' 关键字
+    'response': 'RESPONSE',  # 'response' 关键字
+    'start': 'START',  # 'start' 关键字
+    'end': 'END',  # 'end' 关键字
+    'user_input': 'USER_INPUT',  # 'user_input' 变量
+    'go': 'GO',  # 'go' 关键字
+    'in': 'IN',  # 'in' 关键字，用于检查是否包含在列表或字符串中
+    'set': 'SET',  # 'set' 关键字，用于赋值
+}
+
 # 合并所有正则表达式
 master_regex = '|'.join(f'(?P<{pair[0]}>{pair[1]})' for pair in TOKEN_SPECIFICATIONS)
 
+# 预编译主正则，整个扫描过程只编译一次
+TOKEN_REGEX = re.compile(master_regex)
+
+# 词法分析器实际产生的所有token类型，NAME 会被细分为关键字、MODE 和 ID
+TOKEN_TYPES = [pair[0] for pair in TOKEN_SPECIFICATIONS if pair[0] != 'NAME'] + list(KEYWORDS.values()) + ['MODE', 'ID']
+
+# token类型与整数编码的对应关系，编码即类型在 TOKEN_TYPES 中的下标
+TOKEN_CODES = {type_: code for code, type_ in enumerate(TOKEN_TYPES)}
+
+# 模式名和标识符的值会被驻留（sys.intern），后续按模式名、变量名查字典时可以直接比较对象身份
+INTERNED_CODES = (TOKEN_CODES['MODE'], TOKEN_CODES['ID'])
+
+
+class TokenBuffer:
+    """ 紧凑的token缓冲区：类型编码和起止偏移量存放在 array('i') 列中，取值时才从源码切片 """
+
+    def __init__(self, code):
+        self.code = code
+        self.types = array('i')  # token类型编码
+        self.starts = array('i')  # token值在源码中的起始偏移量
+        self.ends = array('i')  # token值在源码中的结束偏移量
+
+    def append(self, type_code, start, end):
+        self.types.append(type_code)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def type_at(self, index):
+        """ 返回第 index 个token的类型名 """
+        return TOKEN_TYPES[self.types[index]]
+
+    def value_at(self, index):
+        """ 返回第 index 个token的值，此时才从源码中切片 """
+        value = self.code[self.starts[index]:self.ends[index]]
+        if self.types[index] in INTERNED_CODES:
+            value = sys.intern(value)
+        return value
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        return (self.type_at(index), self.value_at(index))
+
+    def __iter__(self):
+        """ 逐个生成 TokenView，可直接交给 Parser 消费，只有读取 token[1] 时才切片源码 """
+        for index in range(len(self.types)):
+            yield TokenView(self, index)
+
+
+class TokenView:
+    """ TokenBuffer 中一个token的惰性视图，用法与 (type, value) 元组相同 """
+    __slots__ = ('buffer', 'index')
+
+    def __init__(self, buffer, index):
+        self.buffer = buffer
+        self.index = index
+
+    def __getitem__(self, item):
+        if item == 0:
+            return self.buffer.type_at(self.index)
+        if item == 1:
+            return self.buffer.value_at(self.index)
+        return self.buffer[self.index][item]
+
+    def __len__(self):
+        return 2
+
+    def __iter__(self):
+        return iter(self.buffer[self.index])
+
+    def __eq__(self, other):
+        return tuple(self) == other
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return repr(tuple(self))
+
+
 class Lexer:
     def __init__(self, code):
         self.code = code
-        self.line_number = 1
-        self.position = 0
+        self.line_number = 1  # 当前行号（从1开始）
+        self.position = 0  # 当前列号（从0开始）
         self.tokens = []
+        self.positions = []  # tokenize 时记录每个token对应的 (行号, 列号)
+        self.names = {}  # 单词 -> (token类型, 驻留后的值)，同一个单词只分类一次
 
-    def tokenize(self):
-        line = self.code
-        while line:
-            match = re.match(master_regex, line)
-            if match:
-                type_ = match.lastgroup
-                value = match.group(type_)
-
-                if type_ == 'NEWLINE':
-                    self.line_number += 1
-                    self.position = 0
-                elif type_ == 'COMMENT':
-                    # 忽略注释，不做任何操作，直接跳到下一个
-                    line = line[match.end():]
-                    continue
-                elif type_ == 'STRING':
-                    # 如果是字符串，去掉双引号
-                    value = value[1:-1]  # 去除双引号
-                    self.tokens.append((type_, value))
-                elif type_ != 'SKIP':
-                    self.tokens.append((type_, value))
-
-                line = line[match.end():]
-            else:
+    def classify(self, word):
+        """ 通过一次查表得到单词的token类型和驻留后的值 """
+        entry = self.names.get(word)
+        if entry is None:
+            type_ = KEYWORDS.get(word)
+            if type_ is None:
+                # 全部由大写字母组成的单词是模式名，其余为标识符
+                type_ = 'MODE' if word.isalpha() and word.isupper() else 'ID'
+            entry = self.names[word] = (type_, sys.intern(word))
+        return entry
+
+    def scan(self):
+        """ 用一个移动的偏移量扫描源码，逐个生成 (type, start, end, word) 区间，只有单词才切片源码 """
+        code = self.code
+        length = len(code)
+        match_token = TOKEN_REGEX.match
+        classify = self.classify
+        pos = 0
+        line_number = self.line_number
+        line_start = 0  # 当前行首在源码中的偏移量
+
+        while pos < length:
+            match = match_token(code, pos)
+            if match is None:
+                self.line_number, self.position = line_number, pos - line_start
                 raise ValueError(f'Illegal character at line {self.line_number}, position {self.position}')
+
+            type_ = match.lastgroup
+            end = match.end()
+
+            if type_ == 'NAME':
+                # 单词只扫描一次，再查表区分关键字、模式名和标识符
+                type_, word = classify(code[pos:end])
+                self.line_number, self.position = line_number, pos - line_start
+                yield (type_, pos, end, word)
+            elif type_ == 'NEWLINE':
+                line_number += 1
+                line_start = end
+            elif type_ == 'STRING':
+                # 如果是字符串，区间不包含两侧的双引号
+                self.line_number, self.position = line_number, pos - line_start
+                yield (type_, pos + 1, end - 1, None)
+
+                # 字符串可以跨行，需要同步行号
+                newlines = code.count('\n', pos, end)
+                if newlines:
+                    line_number += newlines
+                    line_start = code.rindex('\n', pos, end) + 1
+            elif type_ != 'SKIP' and type_ != 'COMMENT':
+                # 注释和空白直接跳过
+                self.line_number, self.position = line_number, pos - line_start
+                yield (type_, pos, end, None)
+
+            pos = end
+
+        # 扫描结束后停在源码末尾
+        self.line_number, self.position = line_number, pos - line_start
+
+    def iter_tokens(self):
+        """ 惰性地逐个生成 (type, value) token """
+        code = self.code
+        for type_, start, end, word in self.scan():
+            yield (type_, code[start:end] if word is None else word)
+
+    def tokenize(self):
+        """ 一次性扫描全部源码，返回token列表 """
+        for token in self.iter_tokens():
+            self.tokens.append(token)
+            self.positions.append((self.line_number, self.position))  # 记录 (行号, 列号)
         return self.tokens
 
+    def tokenize_compact(self):
+        """ 一次性扫描全部源码，返回只保存类型编码和偏移量的 TokenBuffer """
+        buffer = TokenBuffer(self.code)
+        append = buffer.append
+        for type_, start, end, _ in self.scan():
+            append(TOKEN_CODES[type_], start, end)
+        return buffer
+
 # 接口方法
 def lex_script(code):
     lexer = Lexer(code)
-    return lexer.tokenize()
\ No newline at end of file
+    return lexer.tokenize()
+
+def lex_compact(code):
+    lexer = Lexer(code)
+    return lexer.tokenize_compact()
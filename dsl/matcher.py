@@ -0,0 +1,59 @@
+# Aho-Corasick 多模式匹配：把一个模式下所有分支的关键字编译成一个自动机，
+# 只需扫描一遍用户输入就能找到第一个（优先级最高的）命中的分支。
+#
+# 自动机只由列表、字典和整数组成，可以随编译结果一起用 marshal 写入磁盘缓存。
+
+
+def build_automaton(keyword_groups):
+    """ 构建自动机，keyword_groups 的第 i 项是第 i 个分支的关键字列表，下标越小优先级越高 """
+    no_match = len(keyword_groups)  # 表示没有分支命中
+    goto = [{}]  # 状态 -> {字符: 下一个状态}
+    output = [no_match]  # 状态 -> 在该状态结束的关键字中优先级最高的分支下标
+
+    for index, keywords in enumerate(keyword_groups):
+        for keyword in keywords:
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append(no_match)
+                state = next_state
+            output[state] = min(output[state], index)
+
+    # 按广度优先顺序计算失败指针，并把失败链上的输出合并到当前状态
+    fail = [0] * len(goto)
+    queue = list(goto[0].values())
+    for state in queue:
+        for char, next_state in goto[state].items():
+            fallback = fail[state]
+            while fallback and char not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[next_state] = goto[fallback].get(char, 0)
+            output[next_state] = min(output[next_state], output[fail[next_state]])
+            queue.append(next_state)
+
+    return (goto, fail, output, no_match)
+
+
+def first_match(automaton, text):
+    """ 扫描一遍文本，返回命中的优先级最高的分支下标，没有命中时返回 None """
+    goto, fail, output, no_match = automaton
+    best = output[0]  # 空字符串关键字总是命中
+    state = 0
+
+    for char in text:
+        if best == 0:
+            # 第一个分支已经命中，不可能再找到优先级更高的分支
+            break
+        transitions = goto[state]
+        while state and char not in transitions:
+            state = fail[state]
+            transitions = goto[state]
+        state = transitions.get(char, 0)
+        if output[state] < best:
+            best = output[state]
+
+    return best if best < no_match else None
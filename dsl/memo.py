@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+# 表示缓存中没有该键，缓存的回复本身可能是 None（没有分支命中）
+MISS = object()
+
+
+class ResponseCache:
+    """ 无状态分支的回复缓存：(模式编号, 用户输入) -> 回复，按 LRU 淘汰 """
+
+    # 只有不修改会话的结果才会被放入缓存：命中的分支没有 go/set 操作、回复没有占位符，
+    # 或者没有分支命中。是否可以缓存由 Program.step 判断。
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """ 返回缓存的回复，没有时返回 MISS """
+        response = self.entries.get(key, MISS)
+        if response is MISS:
+            self.misses += 1
+            return MISS
+        self.hits += 1
+        try:
+            self.entries.move_to_end(key)
+        except KeyError:  # 另一个线程刚好淘汰了这一项
+            pass
+        return response
+
+    def put(self, key, response):
+        self.entries[key] = response
+        if len(self.entries) > self.max_entries:
+            try:
+                self.entries.popitem(last=False)
+            except KeyError:
+                pass
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        """ 返回命中次数、未命中次数、命中率和当前条目数量 """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self.entries),
+        }
@@ -0,0 +1,36 @@
+import unicodedata
+
+
+class Normalizer:
+    """ 用户输入的规范化：NFKC、大小写折叠和合并空白，每条消息只进行一次 """
+
+    # 条件中的关键字在编译时用同一个规范化器处理（见 Program），
+    # 因此 "Balance" 与 "balance"、全角的 "１" 与半角的 "1" 可以互相匹配。
+
+    def __init__(self, nfkc=True, casefold=True, collapse_whitespace=True):
+        self.nfkc = nfkc  # 全角字母数字转换为半角，兼容字符转换为标准字符
+        self.casefold = casefold  # 忽略大小写
+        self.collapse_whitespace = collapse_whitespace  # 连续的空白合并为一个空格，并去掉首尾空白
+
+    def __call__(self, text):
+        if self.nfkc:
+            text = unicodedata.normalize('NFKC', text)
+        if self.casefold:
+            text = text.casefold()
+        if self.collapse_whitespace:
+            text = ' '.join(text.split())
+        return text
+
+    def __eq__(self, other):
+        return isinstance(other, Normalizer) and self.spec == other.spec
+
+    def __hash__(self):
+        return hash(self.spec)
+
+    def __repr__(self):
+        return 'Normalizer(nfkc={}, casefold={}, collapse_whitespace={})'.format(*self.spec)
+
+    @property
+    def spec(self):
+        """ 以元组形式返回配置，用于序列化 """
+        return (self.nfkc, self.casefold, self.collapse_whitespace)
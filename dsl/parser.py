@@ -3,20 +3,18 @@ from dsl.lexer import Lexer
 
 class Parser:
     def __init__(self, tokens):
-        self.tokens = tokens  # 存储所有的tokens（词法单元）
-        self.position = 0  # 当前token的位置
-        self.token = None  # 当前token
+        self.tokens = iter(tokens)  # token迭代器，可以是列表，也可以是 Lexer.iter_tokens() 生成器
+        self.position = 0  # 已读取的token数量
+        self.token = None  # 当前token，也是解析器唯一的前瞻token
         self.advance()  # 读取下一个token
         self.modes = set()  # 用于跟踪已定义的模式
         self.found_init = False  # 用于标记是否已经找到INIT模式
 
     def advance(self):
         """ 移动到下一个token """
-        if self.position < len(self.tokens):
-            self.token = self.tokens[self.position]  # 获取当前token
+        self.token = next(self.tokens, None)  # 如果已经到达tokens末尾，设置token为None
+        if self.token is not None:
             self.position += 1    # 移动到下一个token
-        else:
-            self.token = None  # 如果已经到达tokens末尾，设置token为None
 
     def parse(self):
         """ 解析整个脚本，从顶层开始 """
@@ -30,13 +28,7 @@ class Parser:
         if self.token[0] == 'START':
             self.advance()  # 跳过 'start' token
 
-            while self.token and self.token[0] != 'END':  # 直到遇到 'end' token
-                statement = self.statement()  # 解析单个语句
-                statements.append(statement)  # 将解析出来的语句添加到列表
-
-                # 如果是条件语句（if/elif/else），将其后续语句（go/set）也作为一部分加入
-                if statement['type'] in ['if', 'elif', 'else']:
-                    statements[-1]['next_statements'] = statement.pop('next_statements')
+            statements = self.statement_list()  # 直到遇到 'end' token
 
             # 期望最后是 'end' token
             if self.token[0] == 'END':
@@ -49,6 +41,20 @@ class Parser:
 
         return {'type': 'program', 'statements': statements}
 
+    def statement_list(self):
+        """ 解析连续的语句，直到遇到 'end' token 或tokens耗尽 """
+        statements = []   # 用于存储解析出的语句
+
+        while self.token and self.token[0] != 'END':  # 直到遇到 'end' token
+            statement = self.statement()  # 解析单个语句
+            statements.append(statement)  # 将解析出来的语句添加到列表
+
+            # 如果是条件语句（if/elif/else），将其后续语句（go/set）也作为一部分加入
+            if statement['type'] in ['if', 'elif', 'else']:
+                statements[-1]['next_statements'] = statement.pop('next_statements')
+
+        return statements
+
     def statement(self):
         """ 解析单个语句 """
         if self.token[0] == 'IF':
@@ -275,7 +281,7 @@ class Parser:
         if not self.found_init:
             raise SyntaxError("Missing 'INIT' mode in the script.")
 
-# 接口方法
+# 接口方法，tokens 可以是 lex_script 返回的列表，也可以是 Lexer.iter_tokens() 生成器
 def parse_script(tokens):
     parser = Parser(tokens)
     return parser.parse()
\ No newline at end of file
@@ -0,0 +1,203 @@
+import json
+import os
+import sqlite3
+import threading
+from dsl.program import Session
+
+# 会话的持久化记录：(会话编号, 模式名, 余额, 变量字典或 None, 等待中的输入或 None)
+# 模式按名称保存，脚本修改后模式编号变化也能正确恢复。
+
+
+def session_record(program, session_id, session):
+    """ 把会话转换为持久化记录 """
+    variables = dict(session.variables) if session.variables else None
+    return (session_id, program.mode_name(session), session.balance, variables, session.pending)
+
+
+def restore_session(program, record):
+    """ 从持久化记录恢复会话，记录中的模式在当前脚本中不存在时回到 INIT 模式 """
+    _, mode_name, balance, variables, pending = record
+    mode = program.mode_ids.get(mode_name, program.init_mode)
+    return Session(mode, balance, dict(variables) if variables else None, pending)
+
+
+class SQLiteBackend:
+    """ 把会话保存在本地 SQLite 数据库中，每批记录在一个事务中写入 """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # 写入在后台线程中进行，读取在处理消息的线程中进行，由 self.lock 保证同一时间只有一个线程使用连接
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'id TEXT PRIMARY KEY, mode TEXT NOT NULL, balance REAL NOT NULL, variables TEXT, pending TEXT)'
+        )
+        self.connection.commit()
+
+    def write_many(self, records):
+        rows = [(session_id, mode, balance, json.dumps(variables) if variables else None, pending)
+                for session_id, mode, balance, variables, pending in records]
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)', rows)
+
+    def load(self, session_id):
+        """ 读取一个会话的记录，不存在时返回 None """
+        with self.lock:
+            row = self.connection.execute('SELECT * FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        if row is None:
+            return None
+        session_id, mode, balance, variables, pending = row
+        return (session_id, mode, balance, json.loads(variables) if variables else None, pending)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class AppendOnlyBackend:
+    """ 把会话记录追加到 JSON-lines 文件，同一会话以最后一条记录为准 """
+
+    def __init__(self, path, sync=True):
+        self.path = path
+        self.sync = sync  # 每批写入后调用 fsync，保证写入的记录在系统崩溃后仍然存在
+        self.lock = threading.Lock()
+        self.index = {}  # 会话编号 -> 最新的记录
+        if os.path.exists(path):
+            valid_length = 0
+            with open(path, 'rb') as file:
+                for line in file:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError
+                        record = tuple(json.loads(line.decode('utf-8')))
+                    except ValueError:
+                        break
+                    self.index[record[0]] = record
+                    valid_length += len(line)
+            # 截掉崩溃时没有写完的最后一行，之后追加的记录才能从新的一行开始
+            if valid_length != os.path.getsize(path):
+                os.truncate(path, valid_length)
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def write_many(self, records):
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        with self.lock:
+            self.file.write(lines)
+            self.file.flush()
+            if self.sync:
+                os.fsync(self.file.fileno())
+            for record in records:
+                self.index[record[0]] = tuple(record)
+
+    def load(self, session_id):
+        """ 读取一个会话的记录，不存在时返回 None """
+        with self.lock:
+            return self.index.get(session_id)
+
+    def compact(self):
+        """ 重写文件，每个会话只保留最新的一条记录 """
+        with self.lock:
+            temporary = self.path + '.tmp'
+            with open(temporary, 'w', encoding='utf-8') as file:
+                for record in self.index.values():
+                    file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+            self.file.close()
+            os.replace(temporary, self.path)
+            self.file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class WriteBehindStore:
+    """ 内存中的会话表，修改过的会话由后台线程按时间间隔或数量阈值成批写入后端 """
+
+    def __init__(self, program, backend, flush_interval=1.0, max_dirty=1000):
+        self.program = program
+        self.backend = backend
+        self.flush_interval = flush_interval  # 崩溃时最多丢失这段时间内的修改
+        self.max_dirty = max_dirty  # 待写入的会话达到该数量时提前唤醒写入线程
+        self.sessions = {}  # 会话编号 -> Session
+        self.dirty = set()  # 修改后尚未写入的会话编号
+        self.lock = threading.Lock()  # 保护会话的修改和待写入集合
+        self.write_lock = threading.Lock()  # 保证各批记录按顺序写入，较旧的快照不会覆盖较新的
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.flushes = 0
+        self.failures = 0  # 写入后端失败的次数，每次失败都会发出 'persistence_error' 事件
+        self.writer = threading.Thread(target=self.write_loop, name='dsl-session-writer', daemon=True)
+        self.writer.start()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def cached(self, session_id):
+        """ 会话是否已经在内存中，为 False 时 get 需要读取磁盘 """
+        return session_id in self.sessions
+
+    def get(self, session_id):
+        """ 返回会话，内存中没有时从后端恢复，后端也没有时创建新会话 """
+        session = self.sessions.get(session_id)
+        if session is None:
+            record = self.backend.load(session_id)
+            session = self.program.new_session() if record is None else restore_session(self.program, record)
+            # 两个线程同时恢复同一个会话时只保留先放入的那个
+            session = self.sessions.setdefault(session_id, session)
+        return session
+
+    def step(self, session_id, user_input):
+        """ 处理一条消息并把会话标记为待写入，不等待磁盘写入 """
+        session = self.get(session_id)
+        with self.lock:
+            response = self.program.step(session, user_input)
+            self.dirty.add(session_id)
+            full = len(self.dirty) >= self.max_dirty
+        if full:
+            self.wakeup.set()
+        return response
+
+    def write_loop(self):
+        """ 后台线程：定时或在待写入的会话过多时写入，写入失败时在下一个间隔重试 """
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:  # 已在 flush 中报告，写入线程继续运行
+                pass
+
+    def flush(self):
+        """ 把所有待写入的会话在一个批次中写入后端，写入失败时这些会话重新标记为待写入 """
+        # 在 self.lock 内只做内存中的快照，磁盘写入在锁外进行，不阻塞处理消息的线程
+        with self.write_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                session_ids, self.dirty = self.dirty, set()
+                records = [session_record(self.program, session_id, self.sessions[session_id])
+                           for session_id in session_ids]
+            try:
+                self.backend.write_many(records)
+            except Exception as error:
+                # 待写入集合只保存会话编号，下次写入时重新生成快照，因此总是写入最新的状态
+                with self.lock:
+                    self.dirty.update(session_ids)
+                self.failures += 1
+                self.program.events.emit('persistence_error', error=repr(error), records=len(records))
+                raise
+            self.flushes += 1
+
+    def close(self):
+        """ 停止写入线程，写入剩余的修改并关闭后端 """
+        self.closed = True
+        self.wakeup.set()
+        self.writer.join()
+        try:
+            self.flush()
+        finally:
+            self.backend.close()
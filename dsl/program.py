@@ -0,0 +1,419 @@
+from string import Formatter
+from dsl.lexer import Lexer
+from dsl.parser import Parser
+from dsl.matcher import build_automaton, first_match
+from dsl.events import RingBufferSink
+from dsl.memo import MISS
+
+# 编译结果的格式版本，修改 build_program 的输出结构或检查规则时需要递增，使旧的编译缓存失效
+COMPILER_VERSION = 3
+
+def build_program(ast):
+    """ 将AST编译为可直接运行的程序：模式名 -> 该模式下的 if/elif/else 操作和关键字自动机 """
+    modes = {}
+    for statement in ast['statements']:
+        if statement['type'] == 'mode':
+            current_mode = statement['mode']
+            modes[current_mode] = {
+                'if_conditions': [],
+                'elif_conditions': [],
+                'else_condition': None
+            }
+        elif statement['type'] == 'if':
+            modes[current_mode]['if_conditions'].append(statement)
+        elif statement['type'] == 'elif':
+            modes[current_mode]['elif_conditions'].append(statement)
+        elif statement['type'] == 'else':
+            modes[current_mode]['else_condition'] = statement
+
+    # 所有 go 语句的目标模式必须存在，在编译时报告，而不是等到运行时跳转失败
+    for statement in ast['statements']:
+        for target in go_targets(statement):
+            if target not in modes:
+                raise SyntaxError(f"Unknown mode '{target}' in 'go' statement.")
+
+    # if/elif 分支按优先级排列，所有分支的关键字编译成一个 Aho-Corasick 自动机
+    for mode_operations in modes.values():
+        branches = mode_operations['if_conditions'] + mode_operations['elif_conditions']
+        mode_operations['branches'] = branches
+        mode_operations['matcher'] = build_automaton([condition['condition'] for condition in branches])
+    return modes
+
+def normalize_conditions(modes, normalizer):
+    """ 返回条件关键字经过规范化的 build_program 结果副本，并重新构建关键字自动机 """
+    normalized = {}
+    for name, mode_operations in modes.items():
+        copies = {}
+        for condition in mode_operations['branches']:
+            keywords = [normalizer(keyword) for keyword in condition['condition']]
+            for keyword, normalized_keyword in zip(condition['condition'], keywords):
+                if not normalized_keyword:
+                    raise SyntaxError(f"Condition '{keyword}' is empty after normalization.")
+            copies[id(condition)] = dict(condition, condition=keywords)
+        branches = [copies[id(condition)] for condition in mode_operations['branches']]
+        normalized[name] = dict(
+            mode_operations,
+            if_conditions=[copies[id(condition)] for condition in mode_operations['if_conditions']],
+            elif_conditions=[copies[id(condition)] for condition in mode_operations['elif_conditions']],
+            branches=branches,
+            matcher=build_automaton([condition['condition'] for condition in branches]),
+        )
+    return normalized
+
+def go_targets(statement):
+    """ 返回语句（包括条件分支的后续语句）中所有 go 的目标模式名 """
+    if statement['type'] == 'go':
+        return [statement['mode']]
+    return [next_statement['mode'] for next_statement in statement.get('next_statements', ())
+            if next_statement['type'] == 'go']
+
+def assigned_variables(modes):
+    """ 返回 build_program 结果中所有 set 语句赋值的变量名 """
+    variables = set()
+    for mode_operations in modes.values():
+        conditions = mode_operations['branches'] + [mode_operations['else_condition'] or {}]
+        for condition in conditions:
+            for statement in condition.get('next_statements', ()):
+                if statement['type'] == 'set':
+                    variables.add(statement['variable'])
+    return frozenset(variables)
+
+def compile_script(code):
+    """ 对脚本源码进行词法分析、语法分析和编译 """
+    lexer = Lexer(code)
+    parser = Parser(lexer.iter_tokens())
+    return build_program(parser.parse())
+
+
+# 会话等待输入的状态
+RECHARGE = 'recharge'  # 等待用户输入充值金额
+
+# 等待充值金额时，含有这些词的消息放弃充值
+CANCEL_WORDS = ('取消', '退出')
+
+
+# 分支后续语句编译后的操作类型
+GO = 'go'  # (GO, 目标模式编号, 模式名)，目标在编译时解析为编号
+SET_ADD = 'set_add'  # (SET_ADD, 变量名, 左操作数)，右操作数总是用户输入
+
+
+def compile_template(response, variables=()):
+    """ 把回复编译为模板，返回 (回复文本, 模板)；没有占位符时模板为 None，回复文本即为最终回复 """
+    # 模板为 (格式串, 变量名元组)，格式串中的占位符已改写为按位置引用，如 "{balance:.2f}" -> "{0:.2f}"。
+    # 只有 balance 和 variables 中的变量名（脚本中 set 赋值过的变量）是占位符，其余花括号内容按普通文本保留。
+    try:
+        parts = list(Formatter().parse(response))
+    except ValueError:
+        parts = [(response, None, None, None)]  # 花括号不成对，整个回复按普通文本处理
+
+    text = []
+    pieces = []
+    names = []
+    for literal, field, spec, conversion in parts:
+        text.append(literal)
+        pieces.append(literal.replace('{', '{{').replace('}', '}}'))
+        if field is None:
+            continue
+        placeholder = ('!' + conversion if conversion else '') + (':' + spec if spec else '')
+        if field != 'balance' and field not in variables:
+            # 不是变量的花括号内容（如 "{100}"、"{user_input}"）按普通文本保留
+            original = '{' + field + placeholder + '}'
+            text.append(original)
+            pieces.append(original.replace('{', '{{').replace('}', '}}'))
+            continue
+        # 格式说明和转换在编译时检查，而不是在处理消息时出错
+        if '{' in placeholder:
+            raise SyntaxError(f"Nested placeholder '{{{field}{placeholder}}}' in response '{response}'.")
+        try:
+            ('{0' + placeholder + '}').format(0.0)
+        except ValueError as error:
+            raise SyntaxError(f"Invalid placeholder '{{{field}{placeholder}}}' in response '{response}': {error}")
+        pieces.append('{' + str(len(names)) + placeholder + '}')
+        names.append(field)
+
+    text = ''.join(text)
+    if not names:
+        if '余额' not in text:
+            return text, None
+        # 兼容旧脚本：提到余额但没有占位符的回复在末尾追加保留2位小数的余额
+        pieces.append(' {0:.2f}')
+        names.append('balance')
+    return response, (''.join(pieces), tuple(names))
+
+
+class Branch:
+    """ 编译后的条件分支：回复内容、回复模板和命中后要执行的操作 """
+    __slots__ = ('response', 'template', 'effects', 'pure')
+
+    def __init__(self, condition, mode_ids, variables):
+        self.response, self.template = compile_template(condition['response'], variables)
+        effects = []
+        for statement in condition['next_statements']:
+            if statement['type'] == 'go':
+                effects.append((GO, mode_ids[statement['mode']], statement['mode']))
+            elif statement['type'] == 'set' and statement['expression']['type'] == 'addition':
+                # 仅当表达式类型为加法运算时才进行处理，其余赋值没有运行时效果
+                effects.append((SET_ADD, statement['variable'], statement['expression']['left']))
+        self.effects = tuple(effects)
+        # 没有 go/set 操作且回复是常量的分支不读取也不修改会话，回复只取决于模式和用户输入
+        self.pure = not self.effects and self.template is None
+
+
+class Mode:
+    """ 编译后的模式：关键字自动机、按优先级排列的 if/elif 分支和 else 分支 """
+    __slots__ = ('name', 'matcher', 'branches', 'else_branch')
+
+    def __init__(self, name, mode_operations, mode_ids, variables):
+        self.name = name
+        self.matcher = mode_operations['matcher']
+        self.branches = tuple(Branch(condition, mode_ids, variables) for condition in mode_operations['branches'])
+        else_condition = mode_operations['else_condition']
+        self.else_branch = Branch(else_condition, mode_ids, variables) if else_condition else None
+
+    def select(self, user_input):
+        """ 返回用户输入命中的分支，没有命中且没有 else 分支时返回 None """
+        index = first_match(self.matcher, user_input)
+        if index is not None:
+            return self.branches[index]
+        return self.else_branch
+
+
+class Session:
+    """ 单个用户的会话状态，只保存当前模式编号、余额、自定义变量和等待输入的状态 """
+    __slots__ = ('mode', 'balance', 'variables', 'pending')
+
+    def __init__(self, mode, balance=0.0, variables=None, pending=None):
+        self.mode = mode  # 当前模式在 Program.modes 中的编号
+        self.balance = balance
+        self.variables = variables  # 通过 set 语句赋值的变量，没有变量时为 None
+        self.pending = pending  # 会话正在等待的输入（如 RECHARGE），下一条消息用来完成它
+
+    def get(self, name):
+        """ 读取变量的值，未赋值的变量为0.0 """
+        if name == 'balance':
+            return self.balance
+        if self.variables is None:
+            return 0.0
+        return self.variables.get(name, 0.0)
+
+    def assign(self, name, value):
+        """ 给变量赋值 """
+        if name == 'balance':
+            self.balance = value
+        elif self.variables is None:
+            self.variables = {name: value}
+        else:
+            self.variables[name] = value
+
+
+class Program:
+    """ 只读的已编译程序，可以被任意多个会话共享 """
+
+    def __init__(self, modes, events=None, layout=None, memo=None, normalizer=None):
+        # modes 为 build_program 的结果，默认按定义顺序编号。
+        # layout 为各编号对应的模式名，热重载时用它让同名模式保持原来的编号（见 reload.py），
+        # 其中 None 表示已被删除的模式，处于该编号的会话按 INIT 模式处理。
+        # normalizer 为可选的输入规范化器（normalize.Normalizer），条件关键字在这里用它规范化一次。
+        if normalizer is not None:
+            modes = normalize_conditions(modes, normalizer)
+        self.data = modes
+        self.normalizer = normalizer
+        self.events = events if events is not None else RingBufferSink()  # 运行时诊断事件的接收器，见 events.py
+        self.layout = tuple(modes) if layout is None else tuple(layout)
+        self.mode_ids = {name: index for index, name in enumerate(self.layout) if name is not None}
+        self.mode_names = tuple('INIT' if name is None else name for name in self.layout)
+        variables = assigned_variables(modes)
+        compiled = {name: Mode(name, modes[name], self.mode_ids, variables) for name in modes}
+        self.modes = tuple(compiled[name] for name in self.mode_names)
+        self.init_mode = self.mode_ids['INIT']
+        self.memo = memo  # 可选的无状态分支回复缓存（memo.ResponseCache）
+
+    @classmethod
+    def from_source(cls, code, events=None, memo=None, normalizer=None):
+        """ 编译脚本源码 """
+        return cls(compile_script(code), events, memo=memo, normalizer=normalizer)
+
+    def new_session(self, balance=0.0):
+        """ 创建一个处于 INIT 模式的新会话 """
+        return Session(self.init_mode, balance)
+
+    def mode_name(self, session):
+        """ 返回会话当前所在模式的名称 """
+        return self.mode_names[session.mode]
+
+    def step(self, session, user_input):
+        """ 处理会话的一条用户输入，更新会话状态并返回回复 """
+        if self.normalizer is not None:
+            # 只规范化一次，之后的分支匹配、回复缓存和后续操作都使用规范化后的输入
+            user_input = self.normalizer(user_input)
+        if session.pending is not None:
+            # 会话正在等待输入，这条消息用来完成等待中的操作
+            return self.pending_handlers[session.pending](self, session, user_input)
+
+        memo = self.memo
+        if memo is not None:
+            key = (session.mode, user_input)
+            response = memo.get(key)
+            if response is not MISS:
+                return response
+
+        branch = self.modes[session.mode].select(user_input)
+        # 输入中含有 "充值" 时会进入充值流程，修改会话状态，不能缓存
+        if memo is not None and (branch is None or branch.pure) and '充值' not in user_input:
+            memo.put(key, None if branch is None else branch.response)
+        if branch is None:
+            return None
+        return self.respond(session, branch, user_input)
+
+    def process_batch(self, sessions, inputs):
+        """ 批量处理多个会话的消息，返回与输入顺序一致的回复列表 """
+        inputs = self.normalize_inputs(inputs)
+        responses = [None] * len(inputs)
+        if len(set(map(id, sessions))) == len(sessions):
+            # 每个会话只有一条消息，一轮即可处理完
+            self.step_group(sessions, inputs, range(len(inputs)), responses)
+            return responses
+
+        # 同一个会话的多条消息必须依次处理，每一轮中每个会话最多处理一条消息
+        remaining = range(len(inputs))
+        while remaining:
+            seen = set()
+            current = []
+            deferred = []
+            for index in remaining:
+                key = id(sessions[index])
+                if key in seen:
+                    deferred.append(index)
+                else:
+                    seen.add(key)
+                    current.append(index)
+            self.step_group(sessions, inputs, current, responses)
+            remaining = deferred
+
+        return responses
+
+    def normalize_inputs(self, inputs):
+        """ 规范化一批用户输入，没有规范化器时原样返回 """
+        if self.normalizer is None:
+            return inputs
+        return [self.normalizer(user_input) for user_input in inputs]
+
+    def step_group(self, sessions, inputs, indices, responses):
+        """ 按当前模式分组处理一轮消息，每个会话在本轮中只出现一次 """
+        groups = {}  # 模式编号 -> 消息下标列表
+        for index in indices:
+            session = sessions[index]
+            if session.pending is not None:
+                responses[index] = self.pending_handlers[session.pending](self, session, inputs[index])
+            else:
+                groups.setdefault(session.mode, []).append(index)
+
+        for mode_id, members in groups.items():
+            # 同一模式的消息共用一次模式查找，相同的输入只匹配一次，再按命中的分支分组
+            mode = self.modes[mode_id]
+            selected = {}  # 用户输入 -> 命中的分支
+            taken = {}  # 分支 -> 消息下标列表
+            for index in members:
+                user_input = inputs[index]
+                if user_input in selected:
+                    branch = selected[user_input]
+                else:
+                    branch = selected[user_input] = mode.select(user_input)
+                if branch is not None:
+                    if branch in taken:
+                        taken[branch].append(index)
+                    else:
+                        taken[branch] = [index]
+
+            for branch, taken_members in taken.items():
+                self.respond_group(sessions, inputs, branch, taken_members, responses)
+
+    def respond_group(self, sessions, inputs, branch, indices, responses):
+        """ 对命中同一分支的一组消息批量执行后续操作，并生成回复 """
+        for effect in branch.effects:
+            if effect[0] == GO:
+                target = effect[1]
+                for index in indices:
+                    sessions[index].mode = target
+            else:
+                for index in indices:
+                    self.apply(sessions[index], (effect,), inputs[index])
+
+        response = branch.response
+        template = branch.template
+        for index in indices:
+            session = sessions[index]
+            if '充值' in inputs[index]:
+                responses[index] = self.prompt_for_recharge(session)
+            elif template is not None:
+                responses[index] = self.render(session, template)
+            else:
+                responses[index] = response
+
+    def respond(self, session, branch, user_input):
+        """ 执行命中分支的后续操作，并生成回复 """
+        self.apply(session, branch.effects, user_input)
+
+        # 如果用户输入是 "充值"，跳转到充值处理流程
+        if '充值' in user_input:
+            return self.prompt_for_recharge(session)
+
+        # 没有占位符的回复直接返回编译好的常量
+        if branch.template is None:
+            return branch.response
+        return self.render(session, branch.template)
+
+    def render(self, session, template):
+        """ 用会话中的变量填充回复模板 """
+        format_string, names = template
+        return format_string.format(*[session.get(name) for name in names])
+
+    def apply(self, session, effects, user_input):
+        """ 执行分支的 go 和 set 操作 """
+        for effect in effects:
+            if effect[0] == GO:
+                session.mode = effect[1]
+            else:
+                _, variable, left = effect
+                # 确保只有数字才能参与加法运算
+                try:
+                    right = float(user_input)  # 这里是需要用户输入数字的地方
+                    session.assign(variable, session.get(left) + right)
+                except ValueError:
+                    # 如果是充值或其他非数字输入，跳过加法运算
+                    self.report_invalid_number(user_input)
+
+    def report_invalid_number(self, user_input):
+        """ 记录无法参与加法运算的用户输入，不在处理消息时输出到控制台 """
+        if '充值' in user_input:
+            message = "正在处理充值，请输入金额。"
+        else:
+            message = f"无效输入：'{user_input}'，无法进行加法运算。"
+        self.events.emit('invalid_number', user_input=user_input, message=message)
+
+    def prompt_for_recharge(self, session):
+        """ 提示用户输入充值金额，会话进入等待充值金额的状态 """
+        if self.mode_names[session.mode] != 'ACCOUNT':
+            return "无法进行充值操作。请先进入账户模式。"
+
+        session.pending = RECHARGE
+        return "请输入您所充值的金额（浮动数）："
+
+    def complete_recharge(self, session, user_input):
+        """ 检查充值金额的合法性，合法时完成充值，否则继续等待；输入取消词时放弃充值 """
+        if any(word in user_input for word in CANCEL_WORDS):
+            session.pending = None
+            return "已取消充值。"
+        try:
+            recharge_amount = float(user_input)
+        except ValueError:
+            return "输入无效，请确保您输入的是一个有效的数字，或输入“取消”放弃充值。"
+        if recharge_amount < 0:
+            return "金额不能为负，请重新输入。"
+
+        session.pending = None
+        session.balance += recharge_amount
+        return f"充值成功！您的新余额为 {session.balance:.2f} 元"
+
+    # 等待输入的状态 -> 用下一条消息完成它的处理函数
+    pending_handlers = {RECHARGE: complete_recharge}
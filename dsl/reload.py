@@ -0,0 +1,48 @@
+import threading
+from dsl.program import Program, compile_script
+
+
+def stable_layout(previous, modes):
+    """ 计算新版本的模式编号：同名模式保持原来的编号，删除的模式留下空位（None），新增的模式排在最后 """
+    layout = [name if name in modes else None for name in previous]
+    known = set(previous)
+    layout.extend(name for name in modes if name not in known)
+    return layout
+
+
+class ProgramHost:
+    """ 持有当前生效的程序，可以在服务运行时原子地替换为新版本的脚本 """
+
+    # 新版本中同名模式的编号不变，会话保存的模式编号在各个版本中含义相同，替换时不需要逐个迁移会话：
+    # 会话所在的模式被删除时，该编号在新版本中按 INIT 模式处理。
+    # 处理消息时只读取一次 self.program，已经开始处理的消息在旧版本上完成，不需要全局加锁。
+
+    def __init__(self, program):
+        self.program = program
+        self.version = 1
+        self.lock = threading.Lock()  # 只在替换程序时使用，保证并发的重载按顺序计算编号
+
+    def __getattr__(self, name):
+        # 其余属性和方法（new_session、mode_name、mode_ids 等）都来自当前版本的程序
+        return getattr(self.program, name)
+
+    def step(self, session, user_input):
+        """ 用当前版本的程序处理一条消息 """
+        return self.program.step(session, user_input)
+
+    def reload(self, code):
+        """ 编译新版本的脚本并替换当前程序，编译失败时抛出异常，当前程序保持不变 """
+        modes = compile_script(code)  # 耗时的编译在锁外进行
+        with self.lock:
+            current = self.program
+            # 新版本的回复可能不同，使用一个同样大小的新缓存
+            memo = None if current.memo is None else type(current.memo)(current.memo.max_entries)
+            program = Program(modes, current.events, stable_layout(current.layout, modes), memo, current.normalizer)
+            self.program = program
+            self.version += 1
+        return program
+
+    def reload_file(self, path):
+        """ 从文件重新加载脚本 """
+        with open(path, 'r', encoding='utf-8') as file:
+            return self.reload(file.read())
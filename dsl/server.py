@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import json
+import signal
+from dsl.program import Program
+from dsl.events import JsonLinesSink
+from dsl.persistence import WriteBehindStore, SQLiteBackend
+from dsl.sessions import SessionManager
+from dsl.reload import ProgramHost
+from dsl.memo import ResponseCache
+from dsl.normalize import Normalizer
+
+# 行协议：客户端每行发送 "<会话编号>\t<消息>"，服务器每行回复 "<会话编号>\t<回复>"
+# 没有制表符的行使用该连接自己的会话编号。回复中的换行符转义为 "\n"。
+#
+# HTTP 接口：POST /chat，请求体为 {"session": "...", "message": "..."}，
+# 返回 {"session": "...", "response": "..."}；GET /stats 返回服务器统计信息。
+
+# 读取一行或一个HTTP请求头的最大字节数，也是HTTP请求体和全部请求头的最大字节数
+LINE_LIMIT = 64 * 1024
+
+# 一个HTTP请求最多的请求头行数
+HEADER_LIMIT = 100
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 431: 'Request Header Fields Too Large', 503: 'Service Unavailable'}
+
+
+class ChatServer:
+    """ 基于 asyncio 的多会话聊天服务器，所有连接共享一个已编译的程序 """
+
+    def __init__(self, program, host='127.0.0.1', port=0, http_port=None, max_pending=64, store=None):
+        self.program = program
+        self.store = store  # 可选的会话存储（如 persistence.WriteBehindStore），为 None 时会话只保存在内存中
+        self.host = host
+        self.port = port  # 行协议端口，0 表示由系统分配
+        self.http_port = http_port  # HTTP 端口，None 表示不启动HTTP接口
+        self.max_pending = max_pending  # 每个连接最多排队等待处理的消息数量
+        self.sessions = {}  # 会话编号 -> Session
+        self.servers = []
+        self.connections = set()  # 正在处理的连接任务
+        self.idle = set()  # 正在等待下一条请求的读取任务，关闭服务器时取消
+        self.closing = False
+        self.connection_count = 0
+        self.message_count = 0
+
+    async def start(self):
+        """ 启动监听，返回实际绑定的 (行协议端口, HTTP端口) """
+        line_server = await asyncio.start_server(self.track(self.handle_line_client), self.host, self.port, limit=LINE_LIMIT)
+        self.servers.append(line_server)
+        self.port = line_server.sockets[0].getsockname()[1]
+
+        if self.http_port is not None:
+            http_server = await asyncio.start_server(self.track(self.handle_http_client), self.host, self.http_port, limit=LINE_LIMIT)
+            self.servers.append(http_server)
+            self.http_port = http_server.sockets[0].getsockname()[1]
+        return self.port, self.http_port
+
+    def track(self, handler):
+        """ 记录正在处理的连接，关闭服务器时等待它们结束 """
+        async def tracked(reader, writer):
+            task = asyncio.current_task()
+            self.connections.add(task)
+            self.connection_count += 1
+            try:
+                await handler(reader, writer)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                self.connections.discard(task)
+                writer.close()
+        return tracked
+
+    async def read_request(self, reader):
+        """ 等待客户端的下一行，关闭服务器时放弃等待并返回空字节串 """
+        task = asyncio.ensure_future(reader.readline())
+        self.idle.add(task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if self.closing and task.cancelled():
+                return b''
+            raise
+        finally:
+            self.idle.discard(task)
+
+    async def handle_message(self, session_id, message):
+        """ 处理一条消息，会话不存在时自动创建 """
+        if self.store is not None:
+            if hasattr(self.store, 'cached') and not self.store.cached(session_id):
+                # 换入会话需要读取磁盘，放到线程池中进行，不阻塞事件循环
+                await asyncio.get_running_loop().run_in_executor(None, self.store.get, session_id)
+            self.message_count += 1
+            return self.store.step(session_id, message)
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = self.program.new_session()
+        self.message_count += 1
+        return self.program.step(session, message)
+
+    async def handle_line_client(self, reader, writer):
+        """ 行协议连接：读取和处理分成两个任务，排队的消息超过上限时停止读取，形成背压 """
+        default_session = f'conn-{self.connection_count}'
+        queue = asyncio.Queue(maxsize=self.max_pending)
+
+        async def read_lines():
+            try:
+                while not self.closing:
+                    line = await self.read_request(reader)
+                    if not line:
+                        break
+                    await queue.put(line)  # 队列已满时在此等待，不再从套接字读取
+            except (ConnectionError, ValueError):  # 连接断开或单行超过 LINE_LIMIT
+                pass
+            await queue.put(None)
+
+        reading = asyncio.ensure_future(read_lines())
+        try:
+            while True:
+                line = await queue.get()
+                if line is None:
+                    break
+                text = line.decode('utf-8', errors='replace').rstrip('\r\n')
+                session_id, separator, message = text.partition('\t')
+                if not separator:
+                    session_id, message = default_session, text
+
+                response = await self.handle_message(session_id, message)
+                reply = '' if response is None else response.replace('\n', '\\n')
+                writer.write(f'{session_id}\t{reply}\n'.encode('utf-8'))
+                await writer.drain()  # 客户端读取太慢时在此等待
+        finally:
+            reading.cancel()
+
+    async def handle_http_client(self, reader, writer):
+        """ 最小的 HTTP/1.1 接口，支持 keep-alive """
+        while not self.closing:
+            try:
+                request_line = await self.read_request(reader)
+                if not request_line:
+                    break
+                headers = await self.read_headers(reader)
+            except ValueError:  # 请求行或请求头超过 LINE_LIMIT
+                await self.send_http(writer, 400, {'error': 'request line or header too long'}, False)
+                break
+            if headers is None:
+                await self.send_http(writer, 431, {'error': 'too many header fields'}, False)
+                break
+
+            parts = request_line.decode('latin-1').split()
+            if len(parts) != 3:
+                await self.send_http(writer, 400, {'error': 'malformed request line'}, False)
+                break
+            method, path, version = parts
+
+            try:
+                length = int(headers.get('content-length') or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                await self.send_http(writer, 400, {'error': 'invalid Content-Length'}, False)
+                break
+            if length > LINE_LIMIT:
+                await self.send_http(writer, 413, {'error': f'body larger than {LINE_LIMIT} bytes'}, False)
+                break
+            body = await reader.readexactly(length)
+            keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+            status, payload = await self.route_http(method, path, body)
+            await self.send_http(writer, status, payload, keep_alive and not self.closing)
+            if not keep_alive:
+                break
+
+    async def read_headers(self, reader):
+        """ 读取HTTP请求头，返回 小写的名称 -> 值，单行超过 LINE_LIMIT 时抛出 ValueError；
+        请求头超过 HEADER_LIMIT 行或总共超过 LINE_LIMIT 字节时返回 None """
+        headers = {}
+        count = 0
+        size = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            count += 1
+            size += len(line)
+            if count > HEADER_LIMIT or size > LINE_LIMIT:
+                return None
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    async def route_http(self, method, path, body):
+        """ 处理一个HTTP请求，返回 (状态码, JSON对象) """
+        if path == '/stats':
+            return 200, self.stats()
+        if path != '/chat':
+            return 404, {'error': 'not found'}
+        if method != 'POST':
+            return 405, {'error': 'use POST'}
+        if self.closing:
+            return 503, {'error': 'shutting down'}
+
+        try:
+            request = json.loads(body.decode('utf-8'))
+            session_id = str(request['session'])
+            message = str(request['message'])
+        except (ValueError, KeyError, TypeError):
+            return 400, {'error': 'expected JSON with "session" and "message"'}
+
+        return 200, {'session': session_id, 'response': await self.handle_message(session_id, message)}
+
+    async def send_http(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        head = (
+            f'HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n'
+            f'Content-Type: application/json; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    def stats(self):
+        """ 返回服务器统计信息 """
+        stats = {
+            'sessions': len(self.sessions if self.store is None else self.store),
+            'connections': len(self.connections),
+            'total_connections': self.connection_count,
+            'messages': self.message_count,
+        }
+        if hasattr(self.store, 'stats'):
+            stats['store'] = self.store.stats()
+        memo = getattr(self.program, 'memo', None)
+        if memo is not None:
+            stats['memo'] = memo.stats()
+        return stats
+
+    async def shutdown(self, timeout=5.0):
+        """ 优雅关闭：停止接受新连接，等待已接收的消息处理完毕，超时后强制断开 """
+        self.closing = True
+        for server in self.servers:
+            server.close()
+
+        # 空闲的连接直接结束，正在处理的连接在回复完已排队的消息后结束
+        for task in list(self.idle):
+            task.cancel()
+        if self.connections:
+            _, still_running = await asyncio.wait(set(self.connections), timeout=timeout)
+            for task in still_running:
+                task.cancel()
+            if still_running:
+                await asyncio.wait(still_running)
+
+        for server in self.servers:
+            await server.wait_closed()
+
+
+async def serve(program, host, port, http_port, store=None, script_path=None):
+    """ 启动服务器并运行到收到 SIGINT/SIGTERM 为止，收到 SIGHUP 时重新加载脚本 """
+    server = ChatServer(program, host, port, http_port, store=store)
+    port, http_port = await server.start()
+    print(f"Serving on {host}:{port}" + (f", HTTP on {host}:{http_port}" if http_port is not None else ""))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows 不支持
+            pass
+
+    def reload_script():
+        # 在线程池中编译新脚本，编译期间事件循环继续处理消息
+        try:
+            program.reload_file(script_path)
+            print(f"Reloaded {script_path} (version {program.version})")
+        except (OSError, SyntaxError, ValueError, TypeError) as error:
+            print(f"Reload of {script_path} failed, keeping version {program.version}: {error}")
+
+    if script_path is not None and isinstance(program, ProgramHost) and hasattr(signal, 'SIGHUP'):
+        loop.add_signal_handler(signal.SIGHUP, lambda: loop.run_in_executor(None, reload_script))
+    try:
+        await stop.wait()
+    finally:
+        await server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a DSL script to many concurrent sessions")
+    parser.add_argument('script', help="path of the DSL script")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help="line protocol port")
+    parser.add_argument('--http-port', type=int, default=None, help="HTTP/JSON port")
+    parser.add_argument('--event-log', default=None, help="append diagnostic events to this JSON-lines file")
+    parser.add_argument('--session-db', default=None, help="persist sessions to this SQLite database")
+    parser.add_argument('--max-resident', type=int, default=None,
+                        help="keep at most this many sessions in memory and spill the rest to --session-db")
+    parser.add_argument('--session-ttl', type=float, default=None, help="spill sessions idle for this many seconds")
+    parser.add_argument('--memo-size', type=int, default=0,
+                        help="cache up to this many responses of stateless branches (0 disables the cache)")
+    parser.add_argument('--normalize', action='store_true',
+                        help="apply NFKC, case folding and whitespace collapsing to messages and condition keywords")
+    args = parser.parse_args()
+    spill = args.max_resident is not None or args.session_ttl is not None
+    if spill and not args.session_db:
+        parser.error("--max-resident and --session-ttl require --session-db")
+    if args.max_resident is not None and args.max_resident < 1:
+        parser.error("--max-resident must be at least 1")
+    if args.session_ttl is not None and args.session_ttl <= 0:
+        parser.error("--session-ttl must be positive")
+
+    events = JsonLinesSink(args.event_log) if args.event_log else None
+    with open(args.script, 'r', encoding='utf-8') as file:
+        memo = ResponseCache(args.memo_size) if args.memo_size > 0 else None
+        normalizer = Normalizer() if args.normalize else None
+        program = ProgramHost(Program.from_source(file.read(), events, memo, normalizer))
+    store = None
+    if spill:
+        store = SessionManager(program, SQLiteBackend(args.session_db), args.max_resident or 100000, args.session_ttl)
+    elif args.session_db:
+        store = WriteBehindStore(program, SQLiteBackend(args.session_db))
+    try:
+        asyncio.run(serve(program, args.host, args.port, args.http_port, store, args.script))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if store is not None:
+            store.close()
+        program.events.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import OrderedDict
+from dsl.persistence import session_record, restore_session
+
+
+class SessionManager:
+    """ 限制常驻内存的会话数量：空闲的会话按 LRU 或 TTL 换出到磁盘，下一条消息到来时自动换入 """
+
+    # 与 persistence.WriteBehindStore 一样，所有磁盘写入都由后台线程完成：常驻会话的修改每隔
+    # flush_interval 秒成批写入，换出的会话先放在内存中，攒够 spill_batch 条时提前唤醒写入线程。
+    # 处理消息的线程只在换入不在内存中的会话时读取磁盘，聊天服务器会把这次读取放到线程池中（见 cached）。
+
+    def __init__(self, program, backend, max_resident=100000, ttl=None, spill_batch=1000, clock=time.monotonic,
+                 flush_interval=1.0):
+        if max_resident < 1:
+            raise ValueError(f"max_resident must be at least 1, got {max_resident}")
+        if ttl is not None and ttl <= 0:
+            raise ValueError(f"ttl must be positive, got {ttl}")
+        self.program = program
+        self.backend = backend  # 换出的会话写入的后端，如 persistence.SQLiteBackend
+        self.max_resident = max_resident  # 常驻内存的会话数量上限
+        self.ttl = ttl  # 空闲超过这么多秒的会话会被换出，None 表示只按数量换出
+        self.spill_batch = spill_batch  # 换出的会话攒够这么多条后提前唤醒写入线程
+        self.flush_interval = flush_interval  # 崩溃时最多丢失这段时间内的修改
+        self.clock = clock
+        self.spilled = {}  # 已换出但尚未写入后端的会话编号 -> 记录
+        self.writing = {}  # 正在写入后端的会话编号 -> 记录，写入完成前换入时从这里读取
+        self.resident = OrderedDict()  # 会话编号 -> [Session, 最后使用时间]，最久未使用的在最前面
+        self.dirty = set()  # 常驻会话中修改后尚未写入的会话编号，没有修改的会话换出时不需要写入
+        self.lock = threading.Lock()  # 保护以上各表和会话的修改
+        self.write_lock = threading.Lock()  # 保证各批记录按顺序写入，较旧的快照不会覆盖较新的
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.evictions = 0
+        self.reloads = 0
+        self.created = 0
+        self.flushes = 0
+        self.failures = 0  # 写入后端失败的次数，每次失败都会发出 'persistence_error' 事件
+        self.writer = threading.Thread(target=self.write_loop, name='dsl-session-spiller', daemon=True)
+        self.writer.start()
+
+    def __len__(self):
+        return len(self.resident)
+
+    def cached(self, session_id):
+        """ 会话是否已经在内存中，为 False 时 get 可能需要读取磁盘 """
+        with self.lock:
+            return session_id in self.resident or session_id in self.spilled or session_id in self.writing
+
+    def get(self, session_id):
+        """ 返回会话，已换出的会话从后端换入，没有记录时创建新会话 """
+        with self.lock:
+            session = self.lookup(session_id)
+            if session is not None:
+                return session
+
+        # 读取磁盘时不持有锁，不阻塞其他线程处理常驻的会话
+        record = self.backend.load(session_id)
+        with self.lock:
+            session = self.lookup(session_id)  # 其他线程可能已经换入了这个会话
+            if session is None:
+                if record is None:
+                    session = self.program.new_session()
+                    self.dirty.add(session_id)
+                    self.created += 1
+                else:
+                    session = restore_session(self.program, record)
+                    self.reloads += 1
+                self.admit(session_id, session)
+            return session
+
+    def lookup(self, session_id):
+        """ 在内存中查找会话，换出后尚未写入的会话直接换入，都没有时返回 None；调用时需持有 self.lock """
+        entry = self.resident.get(session_id)
+        if entry is not None:
+            self.resident.move_to_end(session_id)
+            entry[1] = self.clock()
+            if self.ttl is not None:
+                self.evict(session_id)
+            return entry[0]
+
+        record = self.spilled.pop(session_id, None) or self.writing.get(session_id)
+        if record is None:
+            return None
+        session = restore_session(self.program, record)
+        self.dirty.add(session_id)  # 这份记录可能还没有写入后端
+        self.reloads += 1
+        self.admit(session_id, session)
+        return session
+
+    def admit(self, session_id, session):
+        """ 把会话放入常驻表；调用时需持有 self.lock """
+        self.resident[session_id] = [session, self.clock()]
+        self.evict(session_id)
+
+    def step(self, session_id, user_input):
+        """ 处理一条消息，不等待磁盘写入 """
+        while True:
+            session = self.get(session_id)
+            with self.lock:
+                entry = self.resident.get(session_id)
+                if entry is not None and entry[0] is session:  # 取得会话后没有被其他线程换出
+                    self.dirty.add(session_id)
+                    return self.program.step(session, user_input)
+
+    def evict(self, keep=None):
+        """ 换出超过数量上限和空闲超时的会话，修改过的会话留在内存中等待写入线程写入；
+        keep 是正在换入或查找的会话，它不会被换出；调用时需持有 self.lock """
+        spilled = self.spilled
+        resident = self.resident
+        expired = None if self.ttl is None else self.clock() - self.ttl
+        while resident:
+            session_id, (session, last_used) = next(iter(resident.items()))
+            if session_id == keep:  # keep 是最近使用的会话，排到最前面时其他会话都已换出
+                break
+            if len(resident) <= self.max_resident and (expired is None or last_used > expired):
+                break
+            del resident[session_id]
+            if session_id in self.dirty:
+                self.dirty.discard(session_id)
+                spilled[session_id] = session_record(self.program, session_id, session)
+            self.evictions += 1
+        if len(spilled) >= self.spill_batch:
+            self.wakeup.set()
+
+    def write_loop(self):
+        """ 后台线程：定时换出空闲超时的会话，定时或在换出的会话攒够一批时写入，写入失败时在下一个间隔重试 """
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            if self.ttl is not None:  # 没有消息到来时空闲的会话也会按时换出
+                with self.lock:
+                    self.evict()
+            try:
+                self.flush()
+            except Exception:  # 已在 flush 中报告，写入线程继续运行
+                pass
+
+    def flush(self):
+        """ 把换出的会话和修改过的常驻会话在一个批次中写入后端 """
+        with self.write_lock:
+            with self.lock:
+                records = self.spilled
+                self.spilled = {}
+                for session_id in self.dirty:
+                    records[session_id] = session_record(self.program, session_id, self.resident[session_id][0])
+                self.dirty = set()
+                if not records:
+                    return
+                self.writing = records
+
+            try:
+                self.backend.write_many(list(records.values()))
+            except Exception as error:
+                with self.lock:
+                    for session_id, record in records.items():
+                        if session_id in self.resident:
+                            self.dirty.add(session_id)  # 内存中的会话是最新的状态
+                        else:
+                            self.spilled.setdefault(session_id, record)  # 已有的换出记录更新
+                    self.writing = {}
+                self.failures += 1
+                self.program.events.emit('persistence_error', error=repr(error), records=len(records))
+                raise
+            with self.lock:
+                self.writing = {}
+            self.flushes += 1
+
+    def stats(self):
+        """ 返回常驻会话数量和换出、换入、新建的次数 """
+        return {'resident': len(self.resident), 'evictions': self.evictions,
+                'reloads': self.reloads, 'created': self.created}
+
+    def close(self):
+        """ 停止写入线程，把所有修改过的会话写入后端并关闭后端 """
+        self.closed = True
+        self.wakeup.set()
+        self.writer.join()
+        try:
+            self.flush()
+        finally:
+            self.backend.close()
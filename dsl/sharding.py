@@ -0,0 +1,302 @@
+import gc
+import multiprocessing
+import os
+import threading
+import zlib
+from collections import deque
+from operator import itemgetter
+from dsl.program import Program
+
+# 发给工作进程的命令
+BATCH = 'batch'  # (BATCH, 脚本名, 路由计划编号, 会话编号列表或 None, 消息)，回复 ('ok', 回复列表)
+# 会话编号列表为 None 表示与该脚本在本分片上一批的路由计划相同，工作进程直接复用上一批的会话列表；
+# 消息为用 SEPARATOR 连接成的一个字符串，消息本身含有 SEPARATOR 时为消息列表
+STATS = 'stats'  # (STATS,)，回复 ('ok', 统计信息)
+CLOSE = 'close'  # (CLOSE,)，工作进程退出
+
+# 只传入一个脚本时使用的脚本名
+DEFAULT_SCRIPT = 'main'
+
+# 连接一个分片的所有消息时使用的分隔符
+SEPARATOR = '\x1f'
+
+# 会话编号 -> 分片 的缓存最多保存的编号数量，超出时清空重建
+ASSIGNMENT_CACHE_LIMIT = 1000000
+
+
+def shard_worker(scripts, connection):
+    """ 工作进程：持有分配到本分片的所有会话，按批处理消息 """
+    # scripts 为 脚本名 -> 源码或 Program，源码在工作进程中编译；
+    # 预派生模式下传入的是父进程已编译好的 Program，通过 fork 以写时复制的方式共享
+    programs = {name: script if isinstance(script, Program) else Program.from_source(script)
+                for name, script in scripts.items()}
+    compiled = sum(not isinstance(script, Program) for script in scripts.values())  # 本进程自己编译的脚本数量
+    sessions = {}  # (脚本名, 会话编号) -> Session
+    plans = {}  # 脚本名 -> (路由计划编号, 上一批的会话列表)
+    messages = 0
+
+    while True:
+        try:
+            command = connection.recv()
+        except EOFError:
+            break
+        if command[0] == CLOSE:
+            break
+
+        try:
+            if command[0] == BATCH:
+                _, name, plan_id, session_ids, inputs = command
+                program = programs[name]
+                if session_ids is None:
+                    cached_id, batch = plans[name]
+                    if cached_id != plan_id:
+                        raise RuntimeError(f"unknown routing plan {plan_id}")
+                else:
+                    batch = []
+                    for session_id in session_ids:
+                        key = (name, session_id)
+                        session = sessions.get(key)
+                        if session is None:
+                            session = sessions[key] = program.new_session()
+                        batch.append(session)
+                    plans[name] = (plan_id, batch)
+                if isinstance(inputs, str):
+                    inputs = inputs.split(SEPARATOR)
+                reply = program.process_batch(batch, inputs)
+                messages += len(inputs)
+            else:
+                reply = {'pid': os.getpid(), 'compiled': compiled, 'sessions': len(sessions), 'messages': messages}
+        except Exception as error:  # 把异常交给主进程抛出，工作进程继续运行
+            connection.send(('error', error))
+        else:
+            connection.send(('ok', reply))
+    connection.close()
+
+
+class PendingBatch:
+    """ 已提交给各分片但尚未收齐回复的一批消息 """
+
+    def __init__(self, size, shards):
+        self.responses = [None] * size
+        self.waiting = set(shards)  # 尚未回复的分片
+        self.error = None
+        self.done = threading.Event()
+        if not self.waiting:
+            self.done.set()
+
+
+class ShardedEngine:
+    """ 多进程分片运行时：每个会话编号按哈希固定分配到一个工作进程，会话状态只保存在该进程中 """
+
+    # submit 只发送消息，每个分片的回复由一个读取线程按发送顺序收取，collect 等待一批消息的回复收齐。
+    # submit、collect、stats 和 close 应当在同一个线程中调用，引擎本身不支持多个线程同时提交。
+
+    def __init__(self, scripts, num_shards=None, context=None):
+        # scripts 为单个脚本的源码，或 脚本名 -> 源码/Program 的字典
+        if not isinstance(scripts, dict):
+            scripts = {DEFAULT_SCRIPT: scripts}
+        self.script_names = tuple(scripts)
+        self.num_shards = num_shards or os.cpu_count() or 1
+        context = context or multiprocessing.get_context()
+        self.connections = []
+        self.workers = []
+        self.readers = []
+        self.lock = threading.Lock()  # 保护 depths 和各批次的 waiting，读取线程和提交线程都会修改它们
+        self.depths = [0] * self.num_shards  # 每个分片已发送但尚未收到回复的消息数量
+        self.assignments = {}  # 会话编号 -> 分片，每个编号只计算一次哈希
+        self.plan = None  # 最近一次的路由计划 (会话编号列表, 计划编号, 各分片的路由)
+        self.plan_count = 0
+        self.sent_plans = [{} for _ in range(self.num_shards)]  # 每个分片：脚本名 -> 上一批发送的路由计划编号
+        self.in_flight = [deque() for _ in range(self.num_shards)]  # 每个分片按发送顺序等待回复的 (批次, 消息下标列表, 消息数量)，统计请求的消息下标列表为 None
+        for shard in range(self.num_shards):
+            parent_end, child_end = context.Pipe()
+            worker = context.Process(target=shard_worker, args=(scripts, child_end), daemon=True)
+            worker.start()
+            child_end.close()
+            self.connections.append(parent_end)
+            self.workers.append(worker)
+        for shard in range(self.num_shards):
+            reader = threading.Thread(target=self.read_replies, args=(shard,), name=f'dsl-shard-reader-{shard}', daemon=True)
+            reader.start()
+            self.readers.append(reader)
+
+    @classmethod
+    def prefork(cls, scripts, num_shards=None):
+        """ 预派生模式：在父进程中一次性编译所有脚本，冻结垃圾回收器后再 fork 出工作进程。
+        fork 只复制调用线程，其他线程持有的锁在子进程中永远不会释放，所以调用时进程中只能有主线程：
+        需要在启动 JsonLinesSink、SessionManager、WriteBehindStore 等带后台线程的对象之前创建引擎 """
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise OSError("prefork mode requires the 'fork' start method")
+        if threading.active_count() != 1:
+            names = ', '.join(thread.name for thread in threading.enumerate() if thread is not threading.current_thread())
+            raise RuntimeError(f"prefork mode must fork before any other thread is started (running: {names})")
+        if not isinstance(scripts, dict):
+            scripts = {DEFAULT_SCRIPT: scripts}
+
+        # 按 gc 文档的建议，编译期间停用垃圾回收，避免 fork 前留下被回收后的空洞页
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            programs = {name: script if isinstance(script, Program) else Program.from_source(script)
+                        for name, script in scripts.items()}
+
+            # 把已编译的程序移入永久代，子进程中的垃圾回收不再遍历它们，也就不会改写它们所在的内存页
+            gc.collect()
+            gc.freeze()
+            engine = cls(programs, num_shards, multiprocessing.get_context('fork'))
+        finally:
+            # 工作进程已经 fork 出去，父进程恢复正常的垃圾回收，之前分配的对象仍然可以被回收
+            gc.unfreeze()
+            if enabled:
+                gc.enable()
+        return engine
+
+    def shard_of(self, session_id):
+        """ 返回会话编号所属的分片，同一个编号在任何进程中都得到相同的结果 """
+        return zlib.crc32(str(session_id).encode('utf-8')) % self.num_shards
+
+    def route(self, session_ids):
+        """ 返回会话编号列表的路由计划 (计划编号, [(分片, 消息下标列表, 会话编号列表, 取出消息的函数), ...])，
+        与上一批的会话编号完全相同时直接复用 """
+        session_ids = list(session_ids)
+        plan = self.plan
+        if plan is not None and plan[0] == session_ids:
+            return plan[1], plan[2]
+
+        assignments = self.assignments
+        if len(assignments) > ASSIGNMENT_CACHE_LIMIT:
+            assignments.clear()
+        groups = {}  # 分片 -> (消息下标列表, 会话编号列表)
+        for index, session_id in enumerate(session_ids):
+            shard = assignments.get(session_id)
+            if shard is None:
+                shard = assignments[session_id] = self.shard_of(session_id)
+            group = groups.get(shard)
+            if group is None:
+                group = groups[shard] = ([], [])
+            group[0].append(index)
+            group[1].append(session_id)
+
+        routes = []
+        for shard, (positions, shard_ids) in groups.items():
+            if len(positions) == 1:
+                position = positions[0]
+                select = lambda inputs, position=position: (inputs[position],)
+            else:
+                select = itemgetter(*positions)
+            routes.append((shard, positions, shard_ids, select))
+        self.plan_count += 1
+        self.plan = (session_ids, self.plan_count, routes)
+        return self.plan_count, routes
+
+    def submit(self, session_ids, inputs, script=DEFAULT_SCRIPT):
+        """ 把一批消息按分片拆开发给各个工作进程，不等待回复，返回 PendingBatch """
+        plan_id, routes = self.route(session_ids)
+        batch = PendingBatch(len(inputs), [route[0] for route in routes])
+        for shard, positions, shard_ids, select in routes:
+            shard_inputs = inputs if len(routes) == 1 else select(inputs)
+            # 一个分片的消息连接成一个字符串发送，序列化和反序列化都只处理一个对象
+            try:
+                payload = SEPARATOR.join(shard_inputs)
+                if payload.count(SEPARATOR) != len(positions) - 1:
+                    payload = list(shard_inputs)
+            except TypeError:
+                payload = list(shard_inputs)
+            # 同一个路由计划只在第一次发送会话编号
+            sent = self.sent_plans[shard]
+            shard_ids = None if sent.get(script) == plan_id else shard_ids
+            sent[script] = plan_id
+
+            # 先登记再发送，读取线程收到回复时一定能找到对应的批次
+            with self.lock:
+                self.depths[shard] += len(positions)
+            self.in_flight[shard].append((batch, positions, len(positions)))
+            self.connections[shard].send((BATCH, script, plan_id, shard_ids, payload))
+        return batch
+
+    def collect(self, batch):
+        """ 等待一批消息的回复收齐，返回与输入顺序一致的回复列表 """
+        batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.responses
+
+    def process_batch(self, session_ids, inputs, script=DEFAULT_SCRIPT):
+        """ 发送一批消息并等待回复，各个工作进程并行处理 """
+        return self.collect(self.submit(session_ids, inputs, script))
+
+    def read_replies(self, shard):
+        """ 读取线程：按发送顺序收取一个分片的回复，填入对应的批次 """
+        connection = self.connections[shard]
+        in_flight = self.in_flight[shard]
+        while True:
+            try:
+                status, reply = connection.recv()
+            except (EOFError, OSError):
+                break
+            batch, positions, size = in_flight.popleft()
+            if status == 'ok':
+                if positions is None:  # 统计请求的回复
+                    batch.responses[shard] = reply
+                elif len(positions) == len(batch.responses):  # 整批消息都在这个分片中
+                    batch.responses = reply
+                else:
+                    for position, response in zip(positions, reply):
+                        batch.responses[position] = response
+            self.finish(batch, shard, size, reply if status == 'error' else None)
+
+        # 工作进程已退出，尚未回复的批次以错误结束，避免 collect 一直等待
+        while in_flight:
+            batch, _, size = in_flight.popleft()
+            self.finish(batch, shard, size, EOFError(f"shard {shard} exited"))
+
+    def finish(self, batch, shard, size, error):
+        """ 记录一个分片对一批消息的回复 """
+        with self.lock:
+            self.depths[shard] -= size
+            if error is not None and batch.error is None:
+                batch.error = error
+            batch.waiting.discard(shard)
+            if not batch.waiting:
+                batch.done.set()
+
+    def step(self, session_id, user_input, script=DEFAULT_SCRIPT):
+        """ 处理单条消息 """
+        return self.process_batch([session_id], [user_input], script)[0]
+
+    def queue_depths(self):
+        """ 返回每个分片已发送但尚未收到回复的消息数量 """
+        with self.lock:
+            return list(self.depths)
+
+    def stats(self):
+        """ 返回每个分片的进程号、自己编译的脚本数量、会话数量和已处理的消息数量 """
+        # 统计请求与消息走同一个管道，在之前提交的批次处理完之后回复
+        batch = PendingBatch(self.num_shards, range(self.num_shards))
+        for shard, connection in enumerate(self.connections):
+            self.in_flight[shard].append((batch, None, 0))
+            connection.send((STATS,))
+        return self.collect(batch)
+
+    def close(self):
+        """ 通知所有工作进程退出并等待它们结束 """
+        for connection, worker, reader in zip(self.connections, self.workers, self.readers):
+            try:
+                connection.send((CLOSE,))
+            except OSError:
+                pass
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+            reader.join()  # 工作进程退出后读取线程收到 EOFError 结束
+            connection.close()
+        self.connections = []
+        self.workers = []
+        self.readers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,286 @@
+# 字节码后端：把已编译的程序降低为一个扁平的指令数组和常量池，由一个紧凑的分派循环执行。
+#
+# 每条指令占3个整数 (操作码, 参数a, 参数b)，全部存放在一个 array('i') 中：
+#   MATCH_ANY  a=关键字元组的常量下标  b=不命中时跳转的位置
+#   RESPOND    a=回复的常量下标        b=1 表示该常量是回复模板 (格式串, 变量名元组)
+#   GOTO_MODE  a=目标模式编号          b=模式名的常量下标
+#   SET_ADD    a=变量名的常量下标      b=左操作数的常量下标，右操作数为用户输入
+#   JUMP       a=跳转的位置
+#   NO_MATCH   没有分支命中，返回 None
+
+import marshal
+import time
+from array import array
+from dsl.program import Program, GO, SET_ADD as SET_ADD_EFFECT
+from dsl.events import RingBufferSink
+from dsl.normalize import Normalizer
+
+MATCH_ANY = 0
+RESPOND = 1
+GOTO_MODE = 2
+SET_ADD = 3
+JUMP = 4
+NO_MATCH = 5
+
+OPCODE_NAMES = ('MATCH_ANY', 'RESPOND', 'GOTO_MODE', 'SET_ADD', 'JUMP', 'NO_MATCH')
+
+# 序列化格式的版本，修改指令格式时需要递增
+VM_VERSION = 3
+
+INSTRUCTION_SIZE = 3
+
+
+class Assembler:
+    """ 生成指令并维护常量池，相同的常量只保存一次 """
+
+    def __init__(self):
+        self.code = array('i')
+        self.constants = []
+        self.constant_ids = {}
+        self.bodies = {}  # 分支体 (操作, 回复) -> 已生成的位置，相同的分支体用 JUMP 复用
+
+    def constant(self, value):
+        index = self.constant_ids.get(value)
+        if index is None:
+            index = self.constant_ids[value] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def emit(self, opcode, a=0, b=0):
+        """ 追加一条指令，返回它的位置 """
+        position = len(self.code)
+        self.code.extend((opcode, a, b))
+        return position
+
+    def patch(self, position, b):
+        """ 回填指令的参数b """
+        self.code[position + 2] = b
+
+    def branch(self, program, branch):
+        """ 生成命中分支后执行的指令 """
+        key = (branch.effects, branch.response)
+        if key in self.bodies:
+            self.emit(JUMP, self.bodies[key])
+            return
+        self.bodies[key] = len(self.code)
+
+        for effect in branch.effects:
+            if effect[0] == GO:
+                self.emit(GOTO_MODE, effect[1], self.constant(effect[2]))
+            elif effect[0] == SET_ADD_EFFECT:
+                self.emit(SET_ADD, self.constant(effect[1]), self.constant(effect[2]))
+        if branch.template is None:
+            self.emit(RESPOND, self.constant(branch.response), 0)
+        else:
+            self.emit(RESPOND, self.constant(branch.template), 1)
+
+
+def assemble(program):
+    """ 把 Program 降低为 (指令数组, 常量池, 各模式入口位置) """
+    assembler = Assembler()
+    entries = []
+    for mode in program.modes:
+        entries.append(len(assembler.code))
+        keyword_groups = [condition['condition'] for condition in program.data[mode.name]['branches']]
+        for branch, keywords in zip(mode.branches, keyword_groups):
+            test = assembler.emit(MATCH_ANY, assembler.constant(tuple(keywords)))
+            assembler.branch(program, branch)
+            assembler.patch(test, len(assembler.code))
+        if mode.else_branch is not None:
+            assembler.branch(program, mode.else_branch)
+        else:
+            assembler.emit(NO_MATCH)
+    return assembler.code, tuple(assembler.constants), tuple(entries)
+
+
+class OpcodeProfiler:
+    """ 统计每种操作码的执行次数和累计耗时 """
+
+    def __init__(self):
+        self.counts = [0] * len(OPCODE_NAMES)
+        self.times = [0.0] * len(OPCODE_NAMES)
+
+    def report(self):
+        """ 返回 操作码名 -> (执行次数, 累计秒数)，只包含执行过的操作码 """
+        return {OPCODE_NAMES[opcode]: (count, self.times[opcode])
+                for opcode, count in enumerate(self.counts) if count}
+
+
+class VMProgram:
+    """ 字节码程序，与 Program 共享会话格式，结果与 Program.step 一致 """
+
+    def __init__(self, program, code, constants, entries):
+        self.program = program  # 用于处理等待中的输入（如充值）
+        self.normalizer = program.normalizer  # 常量池中的关键字已经规范化，输入在 step 中规范化
+        self.code = code
+        self.constants = constants
+        self.entries = entries
+
+    @classmethod
+    def from_program(cls, program):
+        """ 从已编译的 Program（或 build_program 的结果）生成字节码 """
+        if not isinstance(program, Program):
+            program = Program(program)
+        return cls(program, *assemble(program))
+
+    @classmethod
+    def from_source(cls, code):
+        """ 编译脚本源码 """
+        return cls.from_program(Program.from_source(code))
+
+    def to_bytes(self):
+        """ 序列化为字节串，只包含指令、常量池、模式表和输入规范化的配置 """
+        normalizer = None if self.normalizer is None else self.normalizer.spec
+        return marshal.dumps((VM_VERSION, self.code.tobytes(), self.constants, self.entries,
+                              self.program.mode_names, normalizer))
+
+    @classmethod
+    def from_bytes(cls, data, events=None):
+        """ 从 to_bytes 的结果恢复字节码程序 """
+        version, *fields = marshal.loads(data)
+        if version != VM_VERSION:
+            raise ValueError(f"unsupported bytecode version {version}")
+        code_bytes, constants, entries, mode_names, normalizer = fields
+        code = array('i')
+        code.frombytes(code_bytes)
+        normalizer = None if normalizer is None else Normalizer(*normalizer)
+        return cls(BytecodeModes(mode_names, events, normalizer), code, constants, entries)
+
+    def new_session(self, balance=0.0):
+        """ 创建一个处于 INIT 模式的新会话 """
+        return self.program.new_session(balance)
+
+    def step(self, session, user_input):
+        """ 处理会话的一条用户输入，更新会话状态并返回回复 """
+        program = self.program
+        if self.normalizer is not None:
+            user_input = self.normalizer(user_input)
+        if session.pending is not None:
+            return program.pending_handlers[session.pending](program, session, user_input)
+
+        code = self.code
+        constants = self.constants
+        pc = self.entries[session.mode]
+        while True:
+            opcode = code[pc]
+            if opcode == MATCH_ANY:
+                for keyword in constants[code[pc + 1]]:
+                    if keyword in user_input:
+                        pc += INSTRUCTION_SIZE
+                        break
+                else:
+                    pc = code[pc + 2]
+            elif opcode == RESPOND:
+                if '充值' in user_input:
+                    return program.prompt_for_recharge(session)
+                if code[pc + 2]:
+                    return program.render(session, constants[code[pc + 1]])
+                return constants[code[pc + 1]]
+            elif opcode == GOTO_MODE:
+                session.mode = code[pc + 1]
+                pc += INSTRUCTION_SIZE
+            elif opcode == SET_ADD:
+                try:
+                    right = float(user_input)  # 这里是需要用户输入数字的地方
+                    session.assign(constants[code[pc + 1]], session.get(constants[code[pc + 2]]) + right)
+                except ValueError:
+                    program.report_invalid_number(user_input)
+                pc += INSTRUCTION_SIZE
+            elif opcode == JUMP:
+                pc = code[pc + 1]
+            else:
+                return None
+
+    def step_profiled(self, session, user_input, profiler):
+        """ 与 step 相同，同时把每条指令的执行次数和耗时记录到 profiler 中 """
+        if session.pending is not None:
+            return self.step(session, user_input)
+        if self.normalizer is not None:
+            user_input = self.normalizer(user_input)
+
+        # 逐条调用 execute 并计时，计时本身有额外开销，只用于分析各操作码的相对耗时
+        code = self.code
+        constants = self.constants
+        counts = profiler.counts
+        times = profiler.times
+        pc = self.entries[session.mode]
+        while True:
+            opcode = code[pc]
+            start = time.perf_counter()
+            result = self.execute(session, user_input, pc, code, constants)
+            times[opcode] += time.perf_counter() - start
+            counts[opcode] += 1
+            if result[0]:
+                return result[1]
+            pc = result[1]
+
+    def execute(self, session, user_input, pc, code, constants):
+        """ 执行一条指令，返回 (True, 回复) 或 (False, 下一条指令的位置) """
+        opcode = code[pc]
+        if opcode == MATCH_ANY:
+            if any(keyword in user_input for keyword in constants[code[pc + 1]]):
+                return False, pc + INSTRUCTION_SIZE
+            return False, code[pc + 2]
+        if opcode == RESPOND:
+            if '充值' in user_input:
+                return True, self.program.prompt_for_recharge(session)
+            if code[pc + 2]:
+                return True, self.program.render(session, constants[code[pc + 1]])
+            return True, constants[code[pc + 1]]
+        if opcode == GOTO_MODE:
+            session.mode = code[pc + 1]
+            return False, pc + INSTRUCTION_SIZE
+        if opcode == SET_ADD:
+            try:
+                right = float(user_input)
+                session.assign(constants[code[pc + 1]], session.get(constants[code[pc + 2]]) + right)
+            except ValueError:
+                self.program.report_invalid_number(user_input)
+            return False, pc + INSTRUCTION_SIZE
+        if opcode == JUMP:
+            return False, code[pc + 1]
+        return True, None
+
+    def disassemble(self):
+        """ 返回可读的指令列表，每行为 位置、操作码和参数的说明 """
+        labels = {entry: name for name, entry in zip(self.program.mode_names, self.entries)}
+        lines = []
+        for pc in range(0, len(self.code), INSTRUCTION_SIZE):
+            if pc in labels:
+                lines.append(f"{labels[pc]}:")
+            opcode, a, b = self.code[pc:pc + INSTRUCTION_SIZE]
+            name = OPCODE_NAMES[opcode]
+            if opcode == MATCH_ANY:
+                detail = f"{self.constants[a]!r} else -> {b}"
+            elif opcode == RESPOND:
+                if b:
+                    format_string, names = self.constants[a]
+                    detail = f"{format_string!r}.format({', '.join(names)})"
+                else:
+                    detail = repr(self.constants[a])
+            elif opcode == GOTO_MODE:
+                detail = f"{a} ({self.constants[b]})"
+            elif opcode == SET_ADD:
+                detail = f"{self.constants[a]} = {self.constants[b]} + user_input"
+            elif opcode == JUMP:
+                detail = f"-> {a}"
+            else:
+                detail = ""
+            lines.append(f"{pc:6d}  {name:<10} {detail}".rstrip())
+        return "\n".join(lines)
+
+
+class BytecodeModes(Program):
+    """ 从字节码恢复时使用的最小程序对象：只有模式名表，用于创建会话和处理充值流程 """
+
+    def __init__(self, mode_names, events=None, normalizer=None):
+        self.data = None
+        self.normalizer = normalizer
+        self.events = events if events is not None else RingBufferSink()
+        self.mode_names = tuple(mode_names)
+        self.mode_ids = {}
+        for index, name in enumerate(self.mode_names):
+            self.mode_ids.setdefault(name, index)  # 已删除的模式的编号也记为 INIT，只保留第一个编号
+        self.modes = ()
+        self.init_mode = self.mode_ids['INIT']
+        self.memo = None
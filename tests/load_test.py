@@ -0,0 +1,58 @@
+import argparse
+import asyncio
+import os
+import random
+import time
+from dsl.program import Program
+from dsl.server import ChatServer
+
+
+# 模拟一个行协议客户端：连续发送若干条消息，每条消息等待回复后再发送下一条
+async def simulate_client(host, port, client_id, num_messages, inputs, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(num_messages):
+            start_time = time.perf_counter()
+            writer.write(f"user-{client_id}\t{random.choice(inputs)}\n".encode('utf-8'))
+            await writer.drain()
+            await reader.readline()
+            latencies.append(time.perf_counter() - start_time)
+    finally:
+        writer.close()
+
+
+# 在本机启动服务器，并用大量并发客户端进行负载测试
+async def load_test(num_clients=2000, num_messages=20, max_connections=500):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'scripts', 'example1.dsl'), 'r', encoding='utf-8') as file:
+        program = Program.from_source(file.read())
+    server = ChatServer(program)
+    port, _ = await server.start()
+
+    inputs = ["你好", "账户", "余额", "退出", "商品", "名称", "查询", "商品A", "帮助"]
+    latencies = []
+    limit = asyncio.Semaphore(max_connections)  # 同时打开的连接数，避免超过系统的文件描述符上限
+
+    async def client(client_id):
+        async with limit:
+            await simulate_client('127.0.0.1', port, client_id, num_messages, inputs, latencies)
+
+    start_time = time.time()
+    await asyncio.gather(*(client(i) for i in range(num_clients)))
+    total_time = time.time() - start_time
+    await server.shutdown()
+
+    latencies.sort()
+    print("\nLoad Test Summary:")
+    print(f"Clients: {num_clients}, Messages: {len(latencies)}, Sessions: {len(server.sessions)}")
+    print(f"Throughput: {len(latencies) / total_time:.2f} messages/second")
+    print(f"Latency p50: {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p99: {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=20)
+    parser.add_argument('--connections', type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(load_test(args.clients, args.messages, args.connections))
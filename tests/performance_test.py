@@ -3,10 +3,23 @@ import string
 import time
 import psutil  # 用于获取系统资源占用信息
 import os
+import marshal
 import subprocess
 from dsl.lexer import Lexer
 from dsl.parser import Parser
 from dsl.interpreter import Interpreter
+from dsl.cache import CompileCache
+from dsl.program import Program
+from dsl.events import NullSink
+from dsl.columnar import ColumnarSessionStore
+from dsl.sharding import ShardedEngine
+from dsl.codegen import GeneratedProgram
+from dsl.vm import VMProgram, OpcodeProfiler
+from dsl.persistence import SQLiteBackend
+from dsl.sessions import SessionManager
+from dsl.memo import ResponseCache
+from dsl.normalize import Normalizer
+import tempfile
 
 
 # 生成一个长度为`length`的随机字符串
@@ -116,6 +129,302 @@ def performance_test(num_iterations=1000):
     print(f"Throughput: {throughput:.2f} requests/second")
 
 
+
+# 同一份脚本被多个会话使用时，比较每次编译与共享编译缓存的耗时
+def shared_script_test(num_sessions=1000):
+    dsl_code = generate_dsl()
+
+    start_time = time.time()
+    for _ in range(num_sessions):
+        lexer = Lexer(dsl_code)
+        tokens = lexer.tokenize()
+        parser = Parser(tokens)
+        interpreter = Interpreter(parser.parse())
+        interpreter.process_input(generate_random_user_input())
+    uncached_time = time.time() - start_time
+
+    cache = CompileCache()
+    start_time = time.time()
+    for _ in range(num_sessions):
+        interpreter = Interpreter.from_program(cache.get(dsl_code))
+        interpreter.process_input(generate_random_user_input())
+    cached_time = time.time() - start_time
+
+    print("\nShared Script Test Summary:")
+    print(f"Sessions: {num_sessions}")
+    print(f"Compile Every Session: {uncached_time:.4f} seconds")
+    print(f"Shared Compile Cache: {cached_time:.4f} seconds")
+    print(f"Cache Stats: {cache.stats()}")
+
+
+# 一个模式下有大量 elif 分支时，比较逐个分支检查与 Aho-Corasick 自动机的耗时
+def many_branches_test(num_branches=300, num_inputs=2000):
+    keywords = [generate_long_string(8) for _ in range(num_branches)]
+
+    dsl_code = "start\n    INIT\n"
+    dsl_code += f"        if \"{keywords[0]}\" in user_input then\n            response \"0\"\n"
+    for i, keyword in enumerate(keywords[1:], start=1):
+        dsl_code += f"        elif \"{keyword}\" in user_input then\n            response \"{i}\"\n"
+    dsl_code += "        else\n            response \"none\"\n    end\n"
+
+    interpreter = Interpreter(Parser(Lexer(dsl_code).iter_tokens()).parse())
+    branches = interpreter.program.data['INIT']['branches']
+    inputs = [generate_long_string(40) for _ in range(num_inputs)]
+
+    start_time = time.time()
+    for user_input in inputs:
+        for condition in branches:
+            if any(cond in user_input for cond in condition['condition']):
+                break
+    naive_time = time.time() - start_time
+
+    start_time = time.time()
+    for user_input in inputs:
+        interpreter.process_input(user_input)
+    automaton_time = time.time() - start_time
+
+    print("\nMany Branches Test Summary:")
+    print(f"Branches: {num_branches}, Inputs: {num_inputs}")
+    print(f"Branch-by-branch Scan: {naive_time:.4f} seconds")
+    print(f"Aho-Corasick Dispatch: {automaton_time:.4f} seconds")
+
+
+# 网关每个周期送来大量消息时，比较逐条处理与按模式分组批量处理的吞吐量
+def batch_test(num_sessions=10000, num_ticks=20):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'scripts', 'example1.dsl'), 'r', encoding='utf-8') as file:
+        program = Program.from_source(file.read(), events=NullSink())
+    inputs = ["你好", "账户", "余额", "退出", "商品", "名称", "查询", "商品A", "帮助"]
+    ticks = [[random.choice(inputs) for _ in range(num_sessions)] for _ in range(num_ticks)]
+
+    sessions = [program.new_session() for _ in range(num_sessions)]
+    start_time = time.time()
+    for messages in ticks:
+        for session, user_input in zip(sessions, messages):
+            program.step(session, user_input)
+    step_time = time.time() - start_time
+
+    sessions = [program.new_session() for _ in range(num_sessions)]
+    start_time = time.time()
+    for messages in ticks:
+        program.process_batch(sessions, messages)
+    batch_time = time.time() - start_time
+
+    total = num_sessions * num_ticks
+    print("\nBatch Test Summary:")
+    print(f"Messages: {total}")
+    print(f"Per-call Throughput: {total / step_time:.2f} messages/second")
+    print(f"Batch Throughput: {total / batch_time:.2f} messages/second")
+
+
+# 百万级会话使用列式存储时的内存占用和批处理吞吐量
+def columnar_test(num_sessions=1000000, batch_size=100000):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'scripts', 'example1.dsl'), 'r', encoding='utf-8') as file:
+        program = Program.from_source(file.read(), events=NullSink())
+    store = ColumnarSessionStore(program, capacity=num_sessions)
+    store.add_sessions(num_sessions)
+
+    columns = [store.modes, store.balance, store.pending] + list(store.variables.values())
+    memory = sum(column.nbytes for column in columns)
+
+    inputs = ["你好", "账户", "余额", "退出", "商品", "名称", "查询", "商品A", "帮助"]
+    session_ids = random.sample(range(num_sessions), batch_size)
+    messages = [random.choice(inputs) for _ in range(batch_size)]
+
+    start_time = time.time()
+    store.process_batch(session_ids, messages)
+    batch_time = time.time() - start_time
+
+    print("\nColumnar Test Summary:")
+    print(f"Sessions: {num_sessions}, Memory: {memory / num_sessions:.1f} bytes/session")
+    print(f"Batch Throughput: {batch_size / batch_time:.2f} messages/second")
+
+
+# 比较单进程与多进程分片运行时的吞吐量
+def sharded_test(num_sessions=10000, num_ticks=20, num_shards=None):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'scripts', 'example1.dsl'), 'r', encoding='utf-8') as file:
+        code = file.read()
+    program = Program.from_source(code)
+    inputs = ["你好", "账户", "余额", "退出", "商品", "名称", "查询", "商品A", "帮助"]
+    session_ids = [f"user{i}" for i in range(num_sessions)]
+    ticks = [[random.choice(inputs) for _ in range(num_sessions)] for _ in range(num_ticks)]
+
+    sessions = [program.new_session() for _ in range(num_sessions)]
+    start_time = time.time()
+    for messages in ticks:
+        program.process_batch(sessions, messages)
+    single_time = time.time() - start_time
+
+    with ShardedEngine(code, num_shards) as engine:
+        start_time = time.time()
+        for messages in ticks:
+            engine.process_batch(session_ids, messages)
+        sharded_time = time.time() - start_time
+        shards = engine.num_shards
+
+    total = num_sessions * num_ticks
+    print("\nSharded Test Summary:")
+    print(f"Messages: {total}, Shards: {shards}")
+    print(f"Single Process Throughput: {total / single_time:.2f} messages/second")
+    print(f"Sharded Throughput: {total / sharded_time:.2f} messages/second")
+
+
+# 比较各个工作进程自己编译脚本与预派生模式下的启动时间和每个工作进程独占的内存
+def prefork_test(num_scripts=20, num_shards=4):
+    scripts = {f"script{i}": generate_dsl() for i in range(num_scripts)}
+    results = {}
+    for label, start_engine in (("Compile In Workers", ShardedEngine), ("Prefork", ShardedEngine.prefork)):
+        start_time = time.time()
+        engine = start_engine(scripts, num_shards)
+        stats = engine.stats()  # 所有工作进程都准备好之后才会回复
+        startup_time = time.time() - start_time
+        memory = sum(psutil.Process(shard['pid']).memory_full_info().uss for shard in stats) / len(stats)
+        engine.close()
+        results[label] = (startup_time, memory)
+
+    print("\nPrefork Test Summary:")
+    print(f"Scripts: {num_scripts}, Workers: {num_shards}")
+    for label, (startup_time, memory) in results.items():
+        print(f"{label}: startup {startup_time:.4f} seconds, {memory / 1024 / 1024:.2f} MB unique memory per worker")
+
+
+# 比较 Program.step 与生成代码后端逐条处理消息的吞吐量
+def codegen_test(num_sessions=1000, num_ticks=100):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'scripts', 'example1.dsl'), 'r', encoding='utf-8') as file:
+        program = Program.from_source(file.read(), events=NullSink())
+    generated = GeneratedProgram(program)
+    inputs = ["你好", "账户", "余额", "退出", "商品", "名称", "查询", "商品A", "帮助"]
+    ticks = [[random.choice(inputs) for _ in range(num_sessions)] for _ in range(num_ticks)]
+
+    results = {}
+    for label, backend in (("Program.step", program), ("Generated Code", generated)):
+        sessions = [backend.new_session() for _ in range(num_sessions)]
+        step = backend.step
+        start_time = time.time()
+        for messages in ticks:
+            for session, user_input in zip(sessions, messages):
+                step(session, user_input)
+        results[label] = time.time() - start_time
+
+    total = num_sessions * num_ticks
+    print("\nCodegen Test Summary:")
+    print(f"Messages: {total}")
+    for label, elapsed in results.items():
+        print(f"{label} Throughput: {total / elapsed:.2f} messages/second")
+
+
+# 比较字节码后端与 Program 的吞吐量和编译结果大小，并输出各操作码的耗时分布
+def vm_test(num_sessions=1000, num_ticks=100):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'scripts', 'example1.dsl'), 'r', encoding='utf-8') as file:
+        program = Program.from_source(file.read(), events=NullSink())
+    vm = VMProgram.from_program(program)
+    inputs = ["你好", "账户", "余额", "退出", "商品", "名称", "查询", "商品A", "帮助"]
+    ticks = [[random.choice(inputs) for _ in range(num_sessions)] for _ in range(num_ticks)]
+
+    results = {}
+    for label, backend in (("Program.step", program), ("Bytecode VM", vm)):
+        sessions = [backend.new_session() for _ in range(num_sessions)]
+        step = backend.step
+        start_time = time.time()
+        for messages in ticks:
+            for session, user_input in zip(sessions, messages):
+                step(session, user_input)
+        results[label] = time.time() - start_time
+
+    profiler = OpcodeProfiler()
+    sessions = [vm.new_session() for _ in range(num_sessions)]
+    for session, user_input in zip(sessions, ticks[0]):
+        vm.step_profiled(session, user_input, profiler)
+
+    total = num_sessions * num_ticks
+    print("\nVM Test Summary:")
+    print(f"Messages: {total}")
+    for label, elapsed in results.items():
+        print(f"{label} Throughput: {total / elapsed:.2f} messages/second")
+    print(f"Compiled Size: nested dicts {len(marshal.dumps(program.data))} bytes, bytecode {len(vm.to_bytes())} bytes")
+    for name, (count, elapsed) in profiler.report().items():
+        print(f"{name}: {count} executions, {elapsed * 1000:.3f} ms")
+
+
+# 大量只偶尔发消息的用户：常驻内存的会话数量保持不变，其余换出到磁盘
+def session_manager_test(num_users=200000, num_messages=300000, max_resident=10000):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'scripts', 'example1.dsl'), 'r', encoding='utf-8') as file:
+        program = Program.from_source(file.read(), events=NullSink())
+    inputs = ["你好", "账户", "余额", "退出", "商品", "名称", "查询", "商品A", "帮助"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        manager = SessionManager(program, SQLiteBackend(os.path.join(directory, 'spill.db')), max_resident)
+        start_time = time.time()
+        for _ in range(num_messages):
+            manager.step(f"user{random.randrange(num_users)}", random.choice(inputs))
+        elapsed = time.time() - start_time
+        stats = manager.stats()
+        manager.close()
+
+    print("\nSession Manager Test Summary:")
+    print(f"Users: {num_users}, Messages: {num_messages}")
+    print(f"Throughput: {num_messages / elapsed:.2f} messages/second")
+    print(f"Stats: {stats}")
+
+
+# 用户反复发送少量常见消息时，比较使用回复缓存和逐条匹配的吞吐量
+def memo_test(num_branches=300, num_distinct=200, num_messages=200000):
+    keywords = [generate_long_string(8) for _ in range(num_branches)]
+    dsl_code = "start\n    INIT\n"
+    dsl_code += f"        if \"{keywords[0]}\" in user_input then\n            response \"0\"\n"
+    for i, keyword in enumerate(keywords[1:], start=1):
+        dsl_code += f"        elif \"{keyword}\" in user_input then\n            response \"{i}\"\n"
+    dsl_code += "        else\n            response \"none\"\n    end\n"
+
+    distinct = [generate_long_string(40) for _ in range(num_distinct)]
+    messages = [random.choice(distinct) for _ in range(num_messages)]
+    plain = Program.from_source(dsl_code, events=NullSink())
+    memo = ResponseCache()
+    cached = Program.from_source(dsl_code, events=NullSink(), memo=memo)
+
+    timings = {}
+    for name, program in (('Matching', plain), ('Memoized', cached)):
+        session = program.new_session()
+        start_time = time.time()
+        for message in messages:
+            program.step(session, message)
+        timings[name] = time.time() - start_time
+
+    print("\nMemo Test Summary:")
+    print(f"Branches: {num_branches}, Distinct Messages: {num_distinct}, Messages: {num_messages}")
+    for name, elapsed in timings.items():
+        print(f"{name}: {num_messages / elapsed:.2f} messages/second")
+    print(f"Cache: {memo.stats()}")
+
+
+# 比较启用输入规范化前后的吞吐量，规范化每条消息只进行一次
+def normalize_test(num_messages=200000):
+    with open(os.path.join(os.path.dirname(__file__), '..', 'scripts', 'example2.dsl'), 'r', encoding='utf-8') as file:
+        code = file.read()
+    inputs = ["1", "１", "Python编程", "ＰＹＴＨＯＮ编程", "退出", "  2 ", "借阅 Python编程"]
+    messages = [random.choice(inputs) for _ in range(num_messages)]
+
+    print("\nNormalize Test Summary:")
+    for name, normalizer in (('Raw', None), ('Normalized', Normalizer())):
+        program = Program.from_source(code, events=NullSink(), normalizer=normalizer)
+        session = program.new_session()
+        start_time = time.time()
+        for message in messages:
+            program.step(session, message)
+        elapsed = time.time() - start_time
+        print(f"{name}: {num_messages / elapsed:.2f} messages/second")
+
+
 if __name__ == '__main__':
     # 进行性能测试，模拟1000次迭代
     performance_test(num_iterations=1000)
+    shared_script_test(num_sessions=1000)
+    many_branches_test(num_branches=300)
+    batch_test(num_sessions=10000)
+    columnar_test(num_sessions=1000000)
+    sharded_test(num_sessions=10000)
+    prefork_test(num_scripts=20)
+    codegen_test(num_sessions=1000)
+    vm_test(num_sessions=1000)
+    session_manager_test(num_users=200000)
+    memo_test(num_branches=300)
+    normalize_test()
@@ -0,0 +1,146 @@
+import marshal
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from dsl.cache import DiskCache, CompileCache, CACHE_DIR_NAME
+from dsl.interpreter import Interpreter
+from dsl.program import compile_script
+
+code = """
+start
+INIT
+    if "你好" in user_input then
+        response "您好"
+    elif "账户" in user_input then
+        response "已转移至账户模式"
+        go ACCOUNT
+    else
+        response "抱歉，我没有理解您的问题"
+ACCOUNT
+    if "余额" in user_input then
+        response "您的余额为 "
+    else
+        response "抱歉，我没有理解您的问题"
+end
+"""
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.script_path = os.path.join(self.directory, 'bot.dsl')
+        with open(self.script_path, 'w', encoding='utf-8') as file:
+            file.write(code)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    # 测试第二次加载直接读取缓存，不再经过前端
+    def test_cache_hit_skips_front_end(self):
+        cache = DiskCache()
+        program = cache.compile(self.script_path)
+        self.assertEqual(compile_script(code), program.data)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, CACHE_DIR_NAME, 'bot.dslc')))
+
+        cache = DiskCache()
+        with patch('dsl.cache.compile_script', side_effect=AssertionError('front end should be skipped')):
+            cached = cache.compile(self.script_path)
+        self.assertEqual(program.data, cached.data)
+        self.assertEqual((1, 0), (cache.hits, cache.misses))
+
+        interpreter = Interpreter.from_program(cached, balance=20)
+        self.assertEqual("已转移至账户模式", interpreter.process_input('账户'))
+        self.assertEqual("您的余额为  20.00", interpreter.process_input('余额'))
+
+    # 测试脚本修改后缓存失效并自动重建
+    def test_stale_entry_is_rebuilt(self):
+        cache = DiskCache(cache_dir=os.path.join(self.directory, 'cache'))
+        cache.compile(self.script_path)
+
+        edited = code.replace('您好', '欢迎')
+        with open(self.script_path, 'w', encoding='utf-8') as file:
+            file.write(edited)
+
+        program = cache.compile(self.script_path)
+        self.assertEqual('欢迎', program.data['INIT']['if_conditions'][0]['response'])
+        self.assertEqual((0, 2), (cache.hits, cache.misses))
+
+        # 重建后的缓存可以再次命中
+        self.assertEqual(program.data, cache.compile(self.script_path).data)
+        self.assertEqual(1, cache.hits)
+
+    # 测试编译器版本变化或缓存文件损坏时重新编译
+    def test_invalid_entry_is_rebuilt(self):
+        cache = DiskCache()
+        cache.compile(self.script_path)
+
+        with patch('dsl.cache.COMPILER_VERSION', -1):
+            self.assertIsNone(cache.load(self.script_path, code))
+
+        with open(cache.path_for(self.script_path), 'wb') as file:
+            file.write(b'DSLC\x00garbage')
+        self.assertIsNone(cache.load(self.script_path, code))
+        self.assertEqual(compile_script(code), cache.compile(self.script_path).data)
+
+
+class TestCompileCache(unittest.TestCase):
+
+    # 测试同一份脚本的多个会话只编译一次
+    def test_sessions_share_one_compile(self):
+        cache = CompileCache()
+        with patch('dsl.cache.compile_script', wraps=compile_script) as compiler:
+            interpreters = [Interpreter.from_program(cache.get(code)) for _ in range(10)]
+        self.assertEqual(1, compiler.call_count)
+        self.assertIs(interpreters[0].program, interpreters[-1].program)
+        self.assertEqual({'entries': 1, 'hits': 9, 'misses': 1, 'evictions': 0}, {
+            key: value for key, value in cache.stats().items() if key != 'bytes'
+        })
+
+        # 会话之间的状态互不影响
+        self.assertEqual("已转移至账户模式", interpreters[0].process_input('账户'))
+        self.assertEqual("您好", interpreters[1].process_input('你好'))
+
+    # 测试按数量淘汰最久未使用的程序
+    def test_evicts_least_recently_used(self):
+        cache = CompileCache(max_entries=2)
+        scripts = [code.replace('您好', f'您好{i}') for i in range(3)]
+        cache.get(scripts[0])
+        cache.get(scripts[1])
+        cache.get(scripts[0])
+        cache.get(scripts[2])
+
+        stats = cache.stats()
+        self.assertEqual((2, 1), (stats['entries'], stats['evictions']))
+        cache.get(scripts[0])
+        self.assertEqual(2, cache.stats()['hits'])
+        cache.get(scripts[1])
+        self.assertEqual(4, cache.stats()['misses'])
+
+    # 测试按字节数淘汰
+    def test_byte_limit(self):
+        size = len(marshal.dumps(compile_script(code)))
+        cache = CompileCache(max_bytes=size * 2 - 1)
+        cache.get(code)
+        cache.get(code.replace('您好', '欢迎'))
+        stats = cache.stats()
+        self.assertEqual((1, 1), (stats['entries'], stats['evictions']))
+        self.assertLessEqual(stats['bytes'], cache.max_bytes)
+
+    # 测试显式失效
+    def test_invalidate(self):
+        cache = CompileCache()
+        cache.get(code)
+        cache.invalidate(code)
+        self.assertEqual((0, 0), (cache.stats()['entries'], cache.stats()['bytes']))
+        cache.get(code)
+        cache.get(code.replace('您好', '欢迎'))
+        cache.invalidate()
+        self.assertEqual(0, cache.stats()['entries'])
+        self.assertEqual(3, cache.stats()['misses'])
+
+
+if __name__ == '__main__':
+    unittest.main()
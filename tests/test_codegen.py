@@ -0,0 +1,82 @@
+import random
+import unittest
+from dsl.program import Program
+from dsl.codegen import GeneratedProgram, generate_source, INLINE_BRANCH_LIMIT
+
+code = """
+start
+INIT
+    if "你好" in user_input then
+        response "您好，很高兴为您服务"
+    elif "账户" in user_input then
+        response "已转移至账户模式"
+        go ACCOUNT
+    elif "帮助" in user_input then
+        response "请选择"
+        go HELP
+    else
+        response "抱歉，我没有理解您的问题"
+ACCOUNT
+    if "余额" in user_input then
+        response "您的余额为 "
+    elif "充值" in user_input then
+        response "请输入您所充值的金额"
+        set balance = balance + user_input
+    elif "积分" in user_input then
+        response "积分已增加，当前积分 {points}"
+        set points = points + user_input
+    elif "退出" in user_input then
+        response "您已退出账户模式"
+        go INIT
+HELP
+    else
+        response "已返回"
+        go INIT
+end
+"""
+
+
+class TestGeneratedProgram(unittest.TestCase):
+
+    def assert_same_as_program(self, code, words, rounds=300):
+        """ 随机输入下生成代码与 Program.step 的回复和会话状态一致 """
+        program = Program.from_source(code)
+        generated = GeneratedProgram(program)
+        rng = random.Random(11)
+        expected_session = program.new_session()
+        session = generated.new_session()
+        for _ in range(rounds):
+            text = rng.choice(words)
+            self.assertEqual(program.step(expected_session, text), generated.step(session, text))
+            self.assertEqual(
+                (expected_session.mode, expected_session.balance, expected_session.variables, expected_session.pending),
+                (session.mode, session.balance, session.variables, session.pending)
+            )
+
+    # 测试分支条件、跳转、set 和充值流程与 Program 一致
+    def test_matches_program(self):
+        self.assert_same_as_program(code, ['你好', '账户', '余额', '充值', '积分', '退出', '帮助', '12', '-3', '天气'])
+
+    # 测试分支很多时改用自动机选择分支
+    def test_many_branches(self):
+        lines = ["start", "INIT"]
+        for i in range(INLINE_BRANCH_LIMIT + 10):
+            lines.append(f'    {"if" if i == 0 else "elif"} "k{i}" in user_input then')
+            lines.append(f'        response "r{i}"')
+        lines.append("end")
+        many = "\n".join(lines)
+
+        self.assertIn("first_match", generate_source(Program.from_source(many)))
+        self.assertEqual("r7", GeneratedProgram.from_source(many).step(Program.from_source(many).new_session(), "k9 k7"))
+        self.assert_same_as_program(many, [f"k{i}" for i in range(30)] + ["k1 k20", "none"])
+
+    # 测试生成的源码直接包含回复常量和跳转目标的编号
+    def test_source_is_specialized(self):
+        source = generate_source(Program.from_source(code))
+        self.assertIn("'已转移至账户模式'", source)
+        self.assertIn("session.mode = 1  # go ACCOUNT", source)
+        self.assertNotIn("effects", source)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import random
+import unittest
+from dsl.program import Program
+from dsl.columnar import ColumnarSessionStore, np
+
+code = """
+start
+INIT
+    if "你好" in user_input then
+        response "您好，很高兴为您服务"
+    elif "账户" in user_input then
+        response "已转移至账户模式"
+        go ACCOUNT
+    else
+        response "抱歉，我没有理解您的问题"
+ACCOUNT
+    if "余额" in user_input then
+        response "您的余额为 "
+    elif "充值" in user_input then
+        response "请输入您所充值的金额"
+        set balance = balance + user_input
+    elif "积分" in user_input then
+        response "积分已增加，当前积分 {points}"
+        set points = points + user_input
+    elif "退出" in user_input then
+        response "您已退出账户模式"
+        go INIT
+    else
+        response "积分变为"
+        set points = points + user_input
+end
+"""
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestColumnarSessionStore(unittest.TestCase):
+
+    # 测试列的类型
+    def test_columns(self):
+        store = ColumnarSessionStore(Program.from_source(code), capacity=2)
+        ids = store.add_sessions(5, balance=3.0)
+        self.assertEqual([0, 1, 2, 3, 4], list(ids))
+        self.assertEqual(np.int32, store.modes.dtype)
+        self.assertEqual(np.float64, store.balance.dtype)
+        self.assertEqual(['points'], list(store.variables))
+        self.assertEqual(3.0, store.balance[4])
+
+    # 测试向量化批处理与逐条处理的结果和会话状态一致
+    def test_matches_step(self):
+        program = Program.from_source(code)
+        store = ColumnarSessionStore(program)
+        store.add_sessions(30)
+        sessions = [program.new_session() for _ in range(30)]
+
+        rng = random.Random(3)
+        words = ['你好', '账户', '余额', '充值', '积分', '退出', '12', '-3', '天气', '8.5']
+        for _ in range(30):
+            picks = [rng.randrange(30) for _ in range(60)]
+            inputs = [rng.choice(words) for _ in picks]
+
+            responses = store.process_batch(picks, inputs)
+            expected = [program.step(sessions[i], text) for i, text in zip(picks, inputs)]
+            self.assertEqual(expected, responses)
+
+        for session_id, session in enumerate(sessions):
+            stored = store.get_session(session_id)
+            self.assertEqual((session.mode, session.balance, session.pending),
+                             (stored.mode, stored.balance, stored.pending))
+            self.assertEqual(session.get('points'), stored.get('points'))
+
+    # 测试带转换标记和格式说明的模板与逐条处理的回复一致
+    def test_template_formats(self):
+        source = code.replace("当前积分 {points}", "当前积分 {points!r}，余额 {balance:>10.3f}，{points:+.1e}")
+        program = Program.from_source(source)
+        store = ColumnarSessionStore(program)
+        store.add_sessions(4)
+        sessions = [program.new_session() for _ in range(4)]
+
+        for inputs in (['账户'] * 4, ['积分', '充值', '积分', '退出'], ['7', '12.5', '积分', '积分'],
+                       ['积分', '积分', '积分', '积分']):
+            responses = store.process_batch(range(4), inputs)
+            expected = [program.step(session, text) for session, text in zip(sessions, inputs)]
+            self.assertEqual(expected, responses)
+        self.assertIn("当前积分 7.0，", responses[0])
+        self.assertNotIn("np.float64", ''.join(responses))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+from dsl.events import NullSink, RingBufferSink, JsonLinesSink
+from dsl.program import Program
+
+code = """
+start
+INIT
+    if "积分" in user_input then
+        response "积分已增加"
+        set points = points + user_input
+end
+"""
+
+
+class TestEvents(unittest.TestCase):
+
+    # 测试环形缓冲区只保留最近的事件
+    def test_ring_buffer(self):
+        sink = RingBufferSink(capacity=3)
+        for i in range(5):
+            sink.emit('test', index=i)
+        self.assertEqual(2, sink.dropped)
+        events = sink.drain()
+        self.assertEqual([2, 3, 4], [event['index'] for event in events])
+        self.assertEqual('test', events[0]['kind'])
+        self.assertEqual([], sink.drain())
+
+    # 测试 JSON-lines 接收器成批写入，关闭时写入剩余的事件
+    def test_json_lines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.jsonl')
+            sink = JsonLinesSink(path, batch_size=1000, flush_interval=60)
+            for i in range(10):
+                sink.emit('test', index=i, text='无效')
+            self.assertFalse(os.path.exists(path))  # 还没有达到批量大小，也没有到写入时间
+
+            sink.close()
+            with open(path, encoding='utf-8') as file:
+                events = [json.loads(line) for line in file]
+            self.assertEqual(list(range(10)), [event['index'] for event in events])
+            self.assertEqual('无效', events[0]['text'])
+            self.assertEqual(10, sink.written)
+
+    # 测试写入失败时事件放回缓冲区，写入线程继续运行并在之后写入
+    def test_json_lines_write_failure(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'events.jsonl')
+            os.mkdir(path)  # 路径是目录，打开文件失败
+            sink = JsonLinesSink(path, batch_size=1000, flush_interval=0.01)
+            sink.emit('test', index=0)
+            deadline = time.time() + 5
+            while sink.failures == 0 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(sink.writer.is_alive())
+            self.assertIsInstance(sink.last_error, OSError)
+
+            os.rmdir(path)
+            sink.emit('test', index=1)
+            while sink.written < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            sink.close()
+            with open(path, encoding='utf-8') as file:
+                self.assertEqual([0, 1], [json.loads(line)['index'] for line in file])
+
+    # 测试缓冲区达到上限后丢弃并计数新的事件，关闭时最后一次写入失败不抛出异常
+    def test_json_lines_max_buffer(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sink = JsonLinesSink(directory, flush_interval=60, max_buffer=3)  # 目录无法写入
+            for i in range(5):
+                sink.emit('test', index=i)
+            self.assertEqual([0, 1, 2], [event['index'] for event in sink.buffer])
+            self.assertEqual(2, sink.dropped)
+
+            with self.assertRaises(OSError):
+                sink.flush()
+            self.assertEqual([0, 1, 2], [event['index'] for event in sink.buffer])
+            self.assertEqual(1, sink.failures)
+
+            sink.close()
+            self.assertGreater(sink.failures, 1)  # 写入线程退出前和 close 中各尝试一次
+            self.assertIsInstance(sink.last_error, OSError)
+            self.assertFalse(sink.writer.is_alive())
+
+    # 测试处理消息时无效输入只记录为事件，不输出到控制台
+    def test_program_emits_events(self):
+        program = Program.from_source(code)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            program.step(program.new_session(), '积分')
+        self.assertEqual('', output.getvalue())
+
+        events = program.events.drain()
+        self.assertEqual(1, len(events))
+        self.assertEqual('invalid_number', events[0]['kind'])
+        self.assertEqual('积分', events[0]['user_input'])
+        self.assertEqual("无效输入：'积分'，无法进行加法运算。", events[0]['message'])
+
+    # 测试空接收器丢弃所有事件
+    def test_null_sink(self):
+        program = Program.from_source(code, events=NullSink())
+        self.assertEqual("积分已增加", program.step(program.new_session(), '积分'))
+
+
+if __name__ == '__main__':
+    unittest.main()
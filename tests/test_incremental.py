@@ -0,0 +1,101 @@
+import unittest
+from dsl.lexer import Lexer
+from dsl.parser import Parser
+from dsl.incremental import IncrementalParser
+
+
+# 生成包含大量模式的脚本
+def generate_script(num_modes, edited_mode=None):
+    code = "start\n"
+    code += "INIT\n"
+    code += "    if \"开始\" in user_input then\n"
+    code += "        response \"进入第一个模式\"\n"
+    code += "        go MODEA\n"
+    for i in range(num_modes):
+        name = 'MODE' + ''.join(chr(ord('A') + int(digit)) for digit in str(i))
+        reply = "已修改" if name == edited_mode else f"第{i}个模式"
+        code += f"# 第{i}个模式\n"
+        code += f"{name}\n"
+        code += f"    if \"{i}\" in user_input then\n"
+        code += f"        response \"{reply}\"\n"
+        code += f"        set val = {i}\n"
+        code += "    else\n"
+        code += "        response \"返回\"\n"
+        code += "        go INIT\n"
+    code += "end\n"
+    return code
+
+
+def full_parse(code):
+    return Parser(Lexer(code).tokenize()).parse()
+
+
+class TestIncrementalParser(unittest.TestCase):
+
+    # 测试增量解析的结果与完整解析一致
+    def test_same_ast_as_parser(self):
+        for path in ['scripts/example1.dsl', 'scripts/example2.dsl', 'scripts/example3.dsl']:
+            with open(path, 'r', encoding='utf-8') as file:
+                code = file.read()
+            self.assertEqual(full_parse(code), IncrementalParser().parse(code))
+
+    # 测试修改一行后只重新解析发生变化的模式块
+    def test_only_changed_block_is_reparsed(self):
+        parser = IncrementalParser()
+        code = generate_script(300)
+        parser.parse(code)
+        self.assertEqual(301, parser.parsed_blocks)
+
+        edited = generate_script(300, edited_mode='MODEBFA')
+        ast = parser.parse(edited)
+        self.assertEqual(1, parser.parsed_blocks)
+        self.assertEqual(300, parser.reused_blocks)
+        self.assertEqual(full_parse(edited), ast)
+
+        # 再改回去，旧的模式块已经不在缓存中
+        parser.parse(code)
+        self.assertEqual(1, parser.parsed_blocks)
+
+    # 测试模式块没有在语句边界结束时退回完整解析
+    def test_fallback_when_block_is_not_self_contained(self):
+        code = '''start
+INIT
+    if "a" in user_input then
+        response "a"
+        go
+TEMP
+end
+'''
+        self.assertEqual(full_parse(code), IncrementalParser().parse(code))
+
+    # 测试跨越模式名所在行的多行字符串
+    def test_fallback_on_multiline_string(self):
+        code = '''start
+INIT
+    if "a" in user_input then
+        response "第一行
+TEMP
+第三行"
+end
+'''
+        ast = IncrementalParser().parse(code)
+        self.assertEqual(full_parse(code), ast)
+        self.assertEqual('第一行\nTEMP\n第三行', ast['statements'][1]['response'])
+
+    # 测试错误与完整解析一致
+    def test_errors_match_parser(self):
+        duplicate = 'start\nINIT\nTEMP\nINIT\nend\n'
+        with self.assertRaises(SyntaxError):
+            IncrementalParser().parse(duplicate)
+
+        missing_init = 'start\nTEMP\nend\n'
+        with self.assertRaises(SyntaxError):
+            IncrementalParser().parse(missing_init)
+
+        missing_end = 'start\nINIT\n'
+        with self.assertRaises(TypeError):
+            IncrementalParser().parse(missing_end)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -221,5 +221,36 @@ class TestInterpreter(unittest.TestCase):
         self.assertEqual(response, "请输入天气查询来查询天气")
 
 
+    # 测试充值流程不会阻塞，金额由下一条消息提供
+    @patch('builtins.input', side_effect=AssertionError('process_input should not block on input()'))
+    def test_recharge_pending_input(self, mock_input):
+        lexer = Lexer(common_code)
+        tokens = lexer.tokenize()
+
+        parser = Parser(tokens)
+        ast = parser.parse()
+
+        interpreter = Interpreter(ast, balance=50)
+
+        # 不在账户模式时无法充值
+        response = interpreter.process_input('充值')
+        self.assertEqual(response, "无法进行充值操作。请先进入账户模式。")
+
+        interpreter.process_input('账户')
+        response = interpreter.process_input('充值')
+        self.assertEqual(response, "请输入您所充值的金额（浮动数）：")
+
+        # 非法金额会继续等待输入
+        response = interpreter.process_input('一百')
+        self.assertEqual(response, "输入无效，请确保您输入的是一个有效的数字，或输入“取消”放弃充值。")
+        response = interpreter.process_input('-5')
+        self.assertEqual(response, "金额不能为负，请重新输入。")
+
+        response = interpreter.process_input('25.5')
+        self.assertEqual(response, "充值成功！您的新余额为 75.50 元")
+
+        response = interpreter.process_input('余额')
+        self.assertEqual(response, "您的余额为  75.50")
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,7 @@
+import sys
+import time
 import unittest
-from dsl.lexer import Lexer
+from dsl.lexer import Lexer, TokenBuffer, TokenView
 
 class TestLexer(unittest.TestCase):
 
@@ -102,6 +104,114 @@ class TestLexer(unittest.TestCase):
         expected_tokens = [('IF', 'if'), ('ID', 'x'), ('ASSIGN', '='), ('NUMBER', '1')]
         self.assertEqual(expected_tokens, tokens)
 
+    # 测试token的行号和列号
+    def test_tokenize_positions(self):
+        code = 'start\nINIT\n    if "a\nb" in user_input then\n  end'
+        lexer = Lexer(code)
+        lexer.tokenize()
+        expected_positions = [(1, 0), (2, 0), (3, 4), (3, 7), (4, 3), (4, 6), (4, 17), (5, 2)]
+        self.assertEqual(expected_positions, lexer.positions)
+
+    # 测试未知字符被识别为 MISMATCH，且扫描结束时的行号和列号正确
+    def test_tokenize_mismatch_position(self):
+        lexer = Lexer('start\n  \x00')
+        tokens = lexer.tokenize()
+        self.assertEqual([('START', 'start'), ('MISMATCH', '\x00')], tokens)
+        self.assertEqual((2, 3), (lexer.line_number, lexer.position))
+
+    # 测试词法分析耗时随脚本长度线性增长
+    def test_tokenize_scales_linearly(self):
+        line = 'if "%s" in user_input then response "%s"\n' % ('a' * 200, 'b' * 200)
+
+        def best_time(code):
+            best = float('inf')
+            for _ in range(3):
+                start = time.perf_counter()
+                Lexer(code).tokenize()
+                best = min(best, time.perf_counter() - start)
+            return best
+
+        small = best_time(line * 500)
+        large = best_time(line * 4000)
+        # 规模扩大8倍，线性实现耗时约为8倍，平方级实现则接近64倍
+        self.assertLess(large / small, 24)
+
+    # 测试 iter_tokens 惰性生成token
+    def test_iter_tokens_is_lazy(self):
+        code = 'go INIT\n"unterminated'
+        lexer = Lexer(code)
+        tokens = lexer.iter_tokens()
+        # 只读取前两个token，不需要扫描整段源码
+        self.assertEqual(('GO', 'go'), next(tokens))
+        self.assertEqual(('MODE', 'INIT'), next(tokens))
+        self.assertEqual((1, 3), (lexer.line_number, lexer.position))
+        self.assertEqual([], lexer.tokens)
+        self.assertEqual([('QUOTE', '"'), ('ID', 'unterminated')], list(tokens))
+
+    # 测试紧凑token缓冲区与 tokenize 的结果一致
+    def test_tokenize_compact(self):
+        code = 'if "hello" in user_input then\n    response "done"  # 注释\n    set val = 10'
+        buffer = Lexer(code).tokenize_compact()
+
+        self.assertIsInstance(buffer, TokenBuffer)
+        self.assertEqual(Lexer(code).tokenize(), list(buffer))
+        self.assertEqual(11, len(buffer))
+
+        # 只保存整数列，字符串值按需从源码中切片
+        self.assertEqual('i', buffer.types.typecode)
+        self.assertEqual('STRING', buffer.type_at(1))
+        self.assertEqual('hello', buffer.value_at(1))
+        self.assertEqual(('NUMBER', '10'), buffer[10])
+
+    # 测试遍历缓冲区时只有读取值才切片源码
+    def test_token_view(self):
+        buffer = Lexer('if "hello" in user_input then').tokenize_compact()
+        sliced = []
+        value_at = buffer.value_at
+        buffer.value_at = lambda index: sliced.append(index) or value_at(index)
+
+        views = list(buffer)
+        self.assertIsInstance(views[0], TokenView)
+        self.assertEqual(['IF', 'STRING', 'IN', 'USER_INPUT', 'THEN'], [view[0] for view in views])
+        self.assertEqual([], sliced)
+        self.assertEqual('hello', views[1][1])
+        self.assertEqual([1], sliced)
+        self.assertEqual("('STRING', 'hello')", repr(views[1]))
+
+    # 测试以关键字开头的单词被识别为完整的标识符
+    def test_tokenize_keyword_prefix(self):
+        code = 'set index = gold + ending'
+        lexer = Lexer(code)
+        tokens = lexer.tokenize()
+        expected_tokens = [
+            ('SET', 'set'),
+            ('ID', 'index'),
+            ('ASSIGN', '='),
+            ('ID', 'gold'),
+            ('PLUS', '+'),
+            ('ID', 'ending')
+        ]
+        self.assertEqual(expected_tokens, tokens)
+
+    # 测试模式名必须全部由大写字母组成
+    def test_tokenize_mode_name(self):
+        code = 'go ACCOUNT Init END_MODE'
+        lexer = Lexer(code)
+        tokens = lexer.tokenize()
+        expected_tokens = [('GO', 'go'), ('MODE', 'ACCOUNT'), ('ID', 'Init'), ('ID', 'END_MODE')]
+        self.assertEqual(expected_tokens, tokens)
+
+    # 测试模式名和标识符被驻留，相同单词得到同一个对象
+    def test_tokenize_interned_names(self):
+        code = 'go ' + 'ACC' + 'OUNT' + '\ngo ACCOUNT\nset balance = balance + 1'
+        tokens = Lexer(code).tokenize()
+        self.assertIs(tokens[1][1], tokens[3][1])
+        self.assertIs(tokens[5][1], tokens[7][1])
+        self.assertIs(sys.intern('balance'), tokens[5][1])
+
+        buffer = Lexer(code).tokenize_compact()
+        self.assertIs(tokens[1][1], buffer.value_at(1))
+
 
 # 执行测试
 if __name__ == '__main__':
@@ -0,0 +1,61 @@
+import random
+import unittest
+from dsl.matcher import build_automaton, first_match
+
+
+# 逐个分支做子串检查，与原来的 if/elif 语义一致
+def naive_first_match(keyword_groups, text):
+    for index, keywords in enumerate(keyword_groups):
+        if any(keyword in text for keyword in keywords):
+            return index
+    return None
+
+
+class TestMatcher(unittest.TestCase):
+
+    # 测试返回第一个命中的分支
+    def test_first_branch_wins(self):
+        groups = [['余额'], ['充值'], ['退出', '余额查询']]
+        automaton = build_automaton(groups)
+        self.assertEqual(0, first_match(automaton, '我想查询余额'))
+        self.assertEqual(1, first_match(automaton, '充值之后退出'))
+        self.assertEqual(2, first_match(automaton, '退出'))
+        self.assertIsNone(first_match(automaton, '你好'))
+
+    # 测试互相重叠、互为前后缀的关键字
+    def test_overlapping_keywords(self):
+        groups = [['hers'], ['his'], ['she'], ['he']]
+        automaton = build_automaton(groups)
+        self.assertEqual(3, first_match(automaton, 'ahe'))
+        self.assertEqual(2, first_match(automaton, 'ushe'))
+        self.assertEqual(0, first_match(automaton, 'ushers'))
+        self.assertEqual(1, first_match(automaton, 'xhisx'))
+
+    # 测试空字符串关键字总是命中
+    def test_empty_keyword(self):
+        automaton = build_automaton([['a'], ['']])
+        self.assertEqual(1, first_match(automaton, 'xyz'))
+        self.assertEqual(1, first_match(automaton, ''))
+        self.assertEqual(0, first_match(automaton, 'xaz'))
+
+    # 测试没有分支时不会命中
+    def test_no_branches(self):
+        automaton = build_automaton([])
+        self.assertIsNone(first_match(automaton, 'anything'))
+
+    # 测试大量分支时与逐个检查的结果一致
+    def test_matches_naive_scan(self):
+        rng = random.Random(42)
+        alphabet = 'abc商品'
+        groups = [
+            [''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 3))]
+            for _ in range(300)
+        ]
+        automaton = build_automaton(groups)
+        for _ in range(500):
+            text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+            self.assertEqual(naive_first_match(groups, text), first_match(automaton, text), text)
+
+
+if __name__ == '__main__':
+    unittest.main()
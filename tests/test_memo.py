@@ -0,0 +1,125 @@
+import random
+import unittest
+from dsl.program import Program
+from dsl.memo import ResponseCache, MISS
+from dsl.reload import ProgramHost
+
+code = """
+start
+INIT
+    if "你好" in user_input then
+        response "您好，很高兴为您服务"
+    elif "账户" in user_input then
+        response "已转移至账户模式"
+        go ACCOUNT
+    elif "积分" in user_input then
+        response "当前积分 {points}"
+ACCOUNT
+    if "余额" in user_input then
+        response "您的余额为 "
+    elif "存入" in user_input then
+        response "已存入"
+        set points = points + user_input
+    elif "退出" in user_input then
+        response "您已退出账户模式"
+        go INIT
+    else
+        response "请问还需要什么帮助"
+end
+"""
+
+
+class TestResponseCache(unittest.TestCase):
+
+    # 测试 LRU 淘汰和命中率统计
+    def test_lru(self):
+        cache = ResponseCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', None)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)  # 淘汰最久未使用的 'b'
+        self.assertIs(MISS, cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual({'hits': 2, 'misses': 1, 'hit_rate': 2 / 3, 'entries': 2}, cache.stats())
+
+    # 测试缓存的 None 与未命中可以区分
+    def test_cached_none(self):
+        cache = ResponseCache()
+        cache.put('a', None)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(1, cache.stats()['hits'])
+
+
+class TestMemoizedProgram(unittest.TestCase):
+
+    def setUp(self):
+        self.memo = ResponseCache()
+        self.program = Program.from_source(code, memo=self.memo)
+
+    # 测试只有不修改会话的分支被标记为纯分支
+    def test_pure_branches(self):
+        init = self.program.modes[self.program.mode_ids['INIT']]
+        account = self.program.modes[self.program.mode_ids['ACCOUNT']]
+        self.assertEqual([True, False, False], [branch.pure for branch in init.branches])
+        self.assertEqual([False, False, False], [branch.pure for branch in account.branches])
+        self.assertTrue(account.else_branch.pure)
+
+    # 测试重复的消息直接从缓存中回复
+    def test_hits(self):
+        session = self.program.new_session()
+        for _ in range(3):
+            self.assertEqual("您好，很高兴为您服务", self.program.step(session, "你好"))
+            self.assertIsNone(self.program.step(session, "随便说说"))  # 没有 else 分支，结果 None 也会被缓存
+        self.assertEqual({'hits': 4, 'misses': 2, 'hit_rate': 4 / 6, 'entries': 2}, self.memo.stats())
+
+    # 测试修改会话或读取会话的分支不会被缓存
+    def test_stateful_not_cached(self):
+        session = self.program.new_session()
+        self.program.step(session, "账户")
+        self.program.step(session, "退出")
+        self.assertEqual("已转移至账户模式", self.program.step(session, "账户"))
+        self.assertEqual(self.program.mode_ids['ACCOUNT'], session.mode)
+        self.program.step(session, "存入")
+        self.program.step(session, "5")
+        self.assertEqual({(self.program.mode_ids['ACCOUNT'], "5")}, set(self.memo.entries))  # 只缓存了 else 分支
+        self.assertEqual("您的余额为  0.00", self.program.step(session, "余额"))
+        self.assertNotIn((session.mode, "余额"), self.memo.entries)
+
+    # 测试含有 "充值" 的输入和等待中的会话不使用缓存
+    def test_recharge_not_cached(self):
+        session = self.program.new_session()
+        self.program.step(session, "账户")
+        self.program.step(session, "随便")
+        self.assertEqual("请输入您所充值的金额（浮动数）：", self.program.step(session, "随便 充值"))
+        self.assertIsNotNone(session.pending)
+        self.assertEqual("充值成功！您的新余额为 3.00 元", self.program.step(session, "3"))
+        self.program.step(session, "随便")
+        self.assertEqual(1, self.memo.hits)
+        self.assertNotIn((session.mode, "随便 充值"), self.memo.entries)
+
+    # 测试使用缓存时的回复与不使用缓存时一致
+    def test_matches_uncached(self):
+        plain = Program.from_source(code)
+        inputs = ["你好", "账户", "余额", "存入", "12", "退出", "积分", "你好", "其他", "充值", "100"]
+        rng = random.Random(7)
+        cached_session, plain_session = self.program.new_session(), plain.new_session()
+        for _ in range(2000):
+            text = rng.choice(inputs)
+            self.assertEqual(plain.step(plain_session, text), self.program.step(cached_session, text))
+            self.assertEqual(plain_session.mode, cached_session.mode)
+            self.assertEqual(plain_session.balance, cached_session.balance)
+        self.assertGreater(self.memo.stats()['hit_rate'], 0.3)
+
+    # 测试热更新后使用新的缓存，不会返回旧版本的回复
+    def test_reload(self):
+        host = ProgramHost(self.program)
+        session = host.new_session()
+        host.step(session, "你好")
+        host.reload(code.replace("很高兴为您服务", "欢迎光临"))
+        self.assertEqual("您好，欢迎光临", host.step(session, "你好"))
+        self.assertIsNot(self.memo, host.memo)
+        self.assertEqual(self.memo.max_entries, host.memo.max_entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import random
+import unittest
+from dsl.program import Program, compile_script
+from dsl.normalize import Normalizer
+from dsl.memo import ResponseCache
+from dsl.reload import ProgramHost
+from dsl.codegen import GeneratedProgram
+from dsl.vm import VMProgram
+from dsl.columnar import ColumnarSessionStore
+
+code = """
+start
+INIT
+    if "1" in user_input then
+        response "您选择了查询书籍"
+        go QUERY
+    elif "Balance" in user_input then
+        response "您的余额为 "
+    elif "HELP  ME" in user_input then
+        response "请问需要什么帮助"
+QUERY
+    if "Python编程" in user_input then
+        response "书籍《Python编程》：可借阅"
+    elif "退出" in user_input then
+        response "您已退出书籍查询模式"
+        go INIT
+    else
+        response "没有找到该书籍"
+end
+"""
+
+
+class TestNormalizer(unittest.TestCase):
+
+    # 测试 NFKC、大小写折叠和合并空白
+    def test_normalize(self):
+        normalize = Normalizer()
+        self.assertEqual("1 python编程", normalize("  １\u3000\tＰｙｔｈｏｎ编程 "))
+        self.assertEqual("strasse", normalize("STRAßE"))
+        self.assertEqual("Ｂ  b", Normalizer(nfkc=False, casefold=False, collapse_whitespace=False)("Ｂ  b"))
+        self.assertEqual("ｂ b", Normalizer(nfkc=False)("Ｂ  B"))
+
+    # 测试配置可以比较和序列化
+    def test_spec(self):
+        self.assertEqual(Normalizer(casefold=False), Normalizer(*Normalizer(casefold=False).spec))
+        self.assertNotEqual(Normalizer(), Normalizer(casefold=False))
+
+
+class TestNormalizedProgram(unittest.TestCase):
+
+    def setUp(self):
+        self.program = Program.from_source(code, normalizer=Normalizer())
+
+    # 测试条件关键字在编译时规范化，原始的编译结果不被修改
+    def test_conditions(self):
+        data = compile_script(code)
+        program = Program(data, normalizer=Normalizer())
+        conditions = [condition['condition'] for condition in program.data['INIT']['branches']]
+        self.assertEqual([['1'], ['balance'], ['help me']], conditions)
+        self.assertEqual(['Balance'], data['INIT']['branches'][1]['condition'])
+        self.assertIs(program.data['INIT']['if_conditions'][0], program.data['INIT']['branches'][0])
+
+    # 测试大小写、全角半角和空白不同的输入命中同一个分支
+    def test_matching(self):
+        session = self.program.new_session()
+        self.assertEqual("您的余额为  0.00", self.program.step(session, "BALANCE"))
+        self.assertEqual("请问需要什么帮助", self.program.step(session, "help\n me"))
+        self.assertEqual("您选择了查询书籍", self.program.step(session, "１"))
+        self.assertEqual("书籍《Python编程》：可借阅", self.program.step(session, "ｐｙｔｈｏｎ编程"))
+
+        # 不使用规范化器时保持原来的行为
+        plain = Program.from_source(code)
+        session = plain.new_session()
+        self.assertIsNone(plain.step(session, "BALANCE"))
+        self.assertIsNone(plain.step(session, "１"))
+
+    # 测试规范化后为空的条件在编译时报错
+    def test_empty_condition(self):
+        with self.assertRaises(SyntaxError):
+            Program.from_source(code.replace('"HELP  ME"', '"   "'), normalizer=Normalizer())
+
+    # 测试回复缓存以规范化后的输入为键
+    def test_memo(self):
+        memo = ResponseCache()
+        program = Program.from_source(code, memo=memo, normalizer=Normalizer())
+        session = program.new_session()
+        for text in ["HELP ME", "help me", " Help  Me "]:
+            self.assertEqual("请问需要什么帮助", program.step(session, text))
+        self.assertEqual({(program.init_mode, "help me")}, set(memo.entries))
+        self.assertEqual(2, memo.hits)
+
+    # 测试各个后端的结果与 Program.step 一致
+    def test_backends(self):
+        inputs = ["１", "1", "BALANCE", "balance", "Help   me", "PYTHON编程", "退出", "其他", "充值", "ＡＢＣ"]
+        rng = random.Random(3)
+        messages = [rng.choice(inputs) for _ in range(500)]
+
+        expected = []
+        session = self.program.new_session()
+        for text in messages:
+            expected.append(self.program.step(session, text))
+
+        vm = VMProgram.from_program(self.program)
+        backends = [GeneratedProgram(self.program), vm, VMProgram.from_bytes(vm.to_bytes())]
+        for backend in backends:
+            session = backend.new_session()
+            self.assertEqual(expected, [backend.step(session, text) for text in messages])
+
+        sessions = [self.program.new_session()]
+        self.assertEqual(expected, [self.program.process_batch(sessions, [text])[0] for text in messages])
+        store = ColumnarSessionStore(self.program)
+        self.assertEqual(expected, [store.process_batch([0], [text])[0] for text in messages])
+
+    # 测试热更新后继续使用同一个规范化器
+    def test_reload(self):
+        host = ProgramHost(self.program)
+        host.reload(code.replace("Balance", "Money"))
+        self.assertIs(self.program.normalizer, host.normalizer)
+        self.assertEqual("您的余额为  0.00", host.step(host.new_session(), "MONEY"))
+
+
+if __name__ == '__main__':
+    unittest.main()
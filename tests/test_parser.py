@@ -260,5 +260,45 @@ class TestParser(unittest.TestCase):
 
         self.assertEqual(expected_ast, ast)
 
+    # 测试解析器直接消费 Lexer.iter_tokens() 生成器
+    def test_parse_token_stream(self):
+        code = """
+        start
+        INIT
+            if "hello" in user_input then
+                response "hello"
+                go INIT
+        end
+        """
+        expected_ast = Parser(Lexer(code).tokenize()).parse()
+
+        lexer = Lexer(code)
+        ast = Parser(lexer.iter_tokens()).parse()
+
+        self.assertEqual(expected_ast, ast)
+        self.assertEqual([], lexer.tokens)
+
+    # 测试解析器消费紧凑的 TokenBuffer
+    def test_parse_token_buffer(self):
+        code = """
+        start
+        INIT
+            if "hello" in user_input then
+                response "hello"
+                set val = 10
+        end
+        """
+        expected_ast = Parser(Lexer(code).tokenize()).parse()
+        buffer = Lexer(code).tokenize_compact()
+        sliced = []
+        value_at = buffer.value_at
+        buffer.value_at = lambda index: sliced.append(index) or value_at(index)
+        ast = Parser(buffer).parse()
+
+        self.assertEqual(expected_ast, ast)
+        # 只有解析器需要的值（模式名、字符串、变量名和数字）才从源码中切片
+        self.assertEqual(5, len(sliced))
+        self.assertLess(len(sliced), len(buffer))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,171 @@
+import os
+import tempfile
+import time
+import unittest
+from dsl.program import Program
+from dsl.persistence import SQLiteBackend, AppendOnlyBackend, WriteBehindStore, session_record, restore_session
+
+code = """
+start
+INIT
+    if "账户" in user_input then
+        response "已转移至账户模式"
+        go ACCOUNT
+ACCOUNT
+    if "余额" in user_input then
+        response "您的余额为 "
+    elif "充值" in user_input then
+        response "请输入您所充值的金额"
+    elif "积分" in user_input then
+        response "积分已增加"
+        set points = points + user_input
+    elif "退出" in user_input then
+        response "您已退出账户模式"
+        go INIT
+end
+"""
+
+
+class FlakyBackend(SQLiteBackend):
+    """ 前几次写入失败的后端，用于测试写入失败后的重试 """
+
+    def __init__(self, path, failures=1):
+        super().__init__(path)
+        self.failures = failures
+
+    def write_many(self, records):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        super().write_many(records)
+
+
+class TestPersistence(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.program = Program.from_source(code)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def check_restart(self, make_backend):
+        """ 写入后重新打开后端，会话的模式、余额、变量和等待状态都能恢复 """
+        store = WriteBehindStore(self.program, make_backend(), flush_interval=60)
+        store.step('alice', '账户')
+        store.step('alice', '充值')
+        store.step('alice', '25')
+        store.get('alice').assign('points', 3.0)
+        store.step('alice', '充值')  # 等待输入充值金额
+        store.step('bob', '账户')
+        store.close()
+
+        store = WriteBehindStore(self.program, make_backend(), flush_interval=60)
+        alice = store.get('alice')
+        self.assertEqual('ACCOUNT', self.program.mode_name(alice))
+        self.assertEqual(25.0, alice.balance)
+        self.assertEqual({'points': 3.0}, alice.variables)
+        self.assertEqual("充值成功！您的新余额为 30.00 元", store.step('alice', '5'))
+        self.assertEqual("您已退出账户模式", store.step('bob', '退出'))
+        self.assertEqual('INIT', self.program.mode_name(store.get('carol')))
+        store.close()
+
+    # 测试 SQLite 后端
+    def test_sqlite(self):
+        self.check_restart(lambda: SQLiteBackend(self.path('sessions.db')))
+
+    # 测试追加写入的文件后端，以及压缩后只保留最新记录
+    def test_append_only(self):
+        self.check_restart(lambda: AppendOnlyBackend(self.path('sessions.jsonl'), sync=False))
+
+        backend = AppendOnlyBackend(self.path('sessions.jsonl'), sync=False)
+        backend.compact()
+        backend.close()
+        with open(self.path('sessions.jsonl'), encoding='utf-8') as file:
+            self.assertEqual(2, len(file.readlines()))
+
+    # 测试崩溃时没有写完的最后一行被忽略
+    def test_append_only_torn_write(self):
+        backend = AppendOnlyBackend(self.path('sessions.jsonl'), sync=False)
+        backend.write_many([session_record(self.program, 'alice', self.program.new_session(balance=5.0))])
+        backend.close()
+        with open(self.path('sessions.jsonl'), 'a', encoding='utf-8') as file:
+            file.write('["bob", "ACC')
+
+        backend = AppendOnlyBackend(self.path('sessions.jsonl'), sync=False)
+        self.assertEqual(5.0, backend.load('alice')[2])
+        self.assertIsNone(backend.load('bob'))
+        backend.write_many([session_record(self.program, 'bob', self.program.new_session(balance=2.0))])
+        backend.close()
+
+        # 截掉残缺的行后，新追加的记录可以正常读取
+        backend = AppendOnlyBackend(self.path('sessions.jsonl'), sync=False)
+        self.assertEqual(2.0, backend.load('bob')[2])
+        backend.close()
+
+    # 测试处理消息时不写入磁盘，待写入的会话达到阈值时由后台线程成批写入
+    def test_write_behind(self):
+        backend = SQLiteBackend(self.path('sessions.db'))
+        store = WriteBehindStore(self.program, backend, flush_interval=60, max_dirty=3)
+        store.step('a', '账户')
+        store.step('a', '余额')
+        self.assertEqual(0, store.flushes)
+        self.assertIsNone(backend.load('a'))
+
+        store.step('b', '账户')
+        store.step('c', '账户')
+        deadline = time.time() + 5
+        while store.flushes == 0 and time.time() < deadline:  # 等待后台线程处理唤醒
+            time.sleep(0.01)
+        self.assertEqual(1, store.flushes)
+        self.assertEqual('ACCOUNT', backend.load('c')[1])
+        store.close()
+
+    # 测试写入失败时会话重新标记为待写入，错误通过事件报告，写入线程继续运行
+    def test_write_failure(self):
+        backend = FlakyBackend(self.path('sessions.db'))
+        store = WriteBehindStore(self.program, backend, flush_interval=0.01)
+        store.step('a', '账户')
+        deadline = time.time() + 5
+        while store.flushes == 0 and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(1, store.failures)
+        self.assertEqual(1, store.flushes)
+        self.assertTrue(store.writer.is_alive())
+        self.assertEqual('ACCOUNT', backend.load('a')[1])
+        events = [event for event in self.program.events.drain() if event['kind'] == 'persistence_error']
+        self.assertEqual(1, len(events))
+        self.assertIn('disk full', events[0]['error'])
+
+        # 重试时写入的是最新的状态
+        store.step('a', '退出')
+        store.close()
+        self.assertEqual('INIT', SQLiteBackend(self.path('sessions.db')).load('a')[1])
+
+    # 测试手动写入失败时抛出异常，之前的修改不会丢失
+    def test_flush_failure_keeps_dirty(self):
+        backend = FlakyBackend(self.path('sessions.db'))
+        store = WriteBehindStore(self.program, backend, flush_interval=60)
+        store.step('a', '账户')
+        with self.assertRaises(OSError):
+            store.flush()
+        self.assertEqual({'a'}, store.dirty)
+        store.step('a', '退出')
+        store.flush()
+        self.assertEqual('INIT', backend.load('a')[1])
+        store.close()
+
+    # 测试脚本中删除的模式恢复为 INIT
+    def test_removed_mode(self):
+        record = ('alice', 'REMOVED', 1.0, None, None)
+        session = restore_session(self.program, record)
+        self.assertEqual(self.program.init_mode, session.mode)
+        self.assertEqual(1.0, session.balance)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import random
+import sys
+import unittest
+from dsl.program import Program, Session, RECHARGE, CANCEL_WORDS, GO, compile_template
+
+code = """
+start
+INIT
+    if "你好" in user_input then
+        response "您好，很高兴为您服务"
+    elif "账户" in user_input then
+        response "已转移至账户模式"
+        go ACCOUNT
+    else
+        response "抱歉，我没有理解您的问题"
+ACCOUNT
+    if "余额" in user_input then
+        response "您的余额为 "
+    elif "充值" in user_input then
+        response "请输入您所充值的金额"
+        set balance = balance + user_input
+    elif "积分" in user_input then
+        response "积分已增加"
+        set points = points + user_input
+    elif "退出" in user_input then
+        response "您已退出账户模式"
+        go INIT
+end
+"""
+
+
+class TestProgram(unittest.TestCase):
+
+    # 测试多个会话共享同一个程序，状态互不影响
+    def test_sessions_share_program(self):
+        program = Program.from_source(code)
+        first = program.new_session()
+        second = program.new_session(balance=30)
+
+        self.assertEqual("已转移至账户模式", program.step(first, '账户'))
+        self.assertEqual('ACCOUNT', program.mode_name(first))
+        self.assertEqual('INIT', program.mode_name(second))
+
+        self.assertEqual("您的余额为  0.00", program.step(first, '余额'))
+        self.assertEqual("抱歉，我没有理解您的问题", program.step(second, '余额'))
+
+    # 测试没有命中分支且没有 else 时返回 None
+    def test_no_branch(self):
+        program = Program.from_source(code)
+        session = program.new_session()
+        program.step(session, '账户')
+        self.assertIsNone(program.step(session, '天气'))
+        self.assertEqual('ACCOUNT', program.mode_name(session))
+
+    # 测试 set 语句更新会话变量
+    def test_set_variable(self):
+        program = Program.from_source(code)
+        session = program.new_session()
+        program.step(session, '账户')
+        self.assertIsNone(session.variables)
+
+        program.step(session, '积分')  # 非数字输入，跳过加法运算
+        self.assertIsNone(session.variables)
+
+        # 数字输入本身不含关键字，这里直接调用分支
+        branch = program.modes[session.mode].branches[2]
+        program.respond(session, branch, '5')
+        program.respond(session, branch, '2.5')
+        self.assertEqual({'points': 7.5}, session.variables)
+
+    # 测试跳转到不存在的模式在编译时报错，跳转目标编译为模式编号
+    def test_go_targets_resolved(self):
+        with self.assertRaises(SyntaxError) as context:
+            Program.from_source(code.replace("go ACCOUNT", "go MISSING"))
+        self.assertIn("MISSING", str(context.exception))
+
+        program = Program.from_source(code)
+        effects = program.modes[program.mode_ids['INIT']].branches[1].effects
+        self.assertEqual(((GO, program.mode_ids['ACCOUNT'], 'ACCOUNT'),), effects)
+
+    # 测试回复编译为模板，没有占位符的回复保持为常量
+    def test_compile_template(self):
+        self.assertEqual(("已转移至账户模式", None), compile_template("已转移至账户模式"))
+        self.assertEqual(("a{b}c", None), compile_template("a{{b}}c"))
+        self.assertEqual(("价格{100}", None), compile_template("价格{100}"))
+        self.assertEqual(("半个{括号", None), compile_template("半个{括号"))
+        # 提到余额但没有占位符时追加余额，与旧版本的输出一致
+        self.assertEqual(("您的余额为 ", ("您的余额为  {0:.2f}", ('balance',))), compile_template("您的余额为 "))
+        self.assertEqual(("积分 {points}，余额 {balance:.1f}", ("积分 {0}，余额 {1:.1f}", ('points', 'balance'))),
+                         compile_template("积分 {points}，余额 {balance:.1f}", {'points'}))
+        # 只有 balance 和 set 赋值过的变量是占位符，其余花括号内容按普通文本保留
+        self.assertEqual(("输入 {user_input} 与 {word}", None), compile_template("输入 {user_input} 与 {word}", {'points'}))
+        self.assertEqual(("{points} 余额 {balance!r}", ("{{points}} 余额 {0!r}", ('balance',))),
+                         compile_template("{points} 余额 {balance!r}"))
+
+    # 测试非法的格式说明、转换和嵌套占位符在编译时报错
+    def test_invalid_template(self):
+        for response in ["bal {balance:xyz}", "{balance:>{w}}", "{balance!x}", "{points:d}"]:
+            with self.assertRaises(SyntaxError):
+                compile_template(response, {'points'})
+        with self.assertRaises(SyntaxError):
+            Program.from_source(code.replace('response "积分已增加"', 'response "积分 {points:xyz}"'))
+        # 不是变量的花括号内容不检查
+        self.assertEqual(("{word:xyz}", None), compile_template("{word:xyz}"))
+
+    # 测试不是变量的花括号内容原样输出
+    def test_literal_braces(self):
+        program = Program.from_source(code.replace('response "积分已增加"', 'response "{user_input} {points:.0f}"'))
+        session = program.new_session()
+        program.step(session, '账户')
+        self.assertEqual("{user_input} 0", program.step(session, '积分'))
+
+    # 测试回复模板使用会话中的变量
+    def test_response_template(self):
+        program = Program.from_source(code.replace('response "积分已增加"', 'response "积分 {points:.1f}，余额 {balance:.2f}"'))
+        session = program.new_session(balance=3)
+        program.step(session, '账户')
+        branch = program.modes[session.mode].branches[2]
+        self.assertEqual("积分 5.0，余额 3.00", program.respond(session, branch, '5'))
+        self.assertEqual("积分 0.0，余额 3.00", program.respond(program.new_session(balance=3), branch, 'x'))
+
+    # 测试会话对象足够小
+    def test_session_is_compact(self):
+        session = Session(0, 10.0)
+        self.assertFalse(hasattr(session, '__dict__'))
+        self.assertLessEqual(sys.getsizeof(session), 64)
+
+    # 测试等待输入的会话与其他会话交替处理
+    def test_pending_sessions_interleave(self):
+        program = Program.from_source(code)
+        sessions = [program.new_session() for _ in range(3)]
+        for session in sessions:
+            program.step(session, '账户')
+            self.assertEqual("请输入您所充值的金额（浮动数）：", program.step(session, '充值'))
+            self.assertEqual(RECHARGE, session.pending)
+
+        # 等待中的会话不影响其他会话
+        self.assertEqual("充值成功！您的新余额为 10.00 元", program.step(sessions[1], '10'))
+        self.assertIsNone(sessions[1].pending)
+        self.assertEqual("您的余额为  10.00", program.step(sessions[1], '余额'))
+        self.assertEqual("金额不能为负，请重新输入。", program.step(sessions[0], '-1'))
+        self.assertEqual("充值成功！您的新余额为 3.00 元", program.step(sessions[2], '3'))
+        self.assertEqual("充值成功！您的新余额为 1.00 元", program.step(sessions[0], '1'))
+
+    # 测试等待充值金额时可以取消，会话回到原来的模式
+    def test_cancel_recharge(self):
+        program = Program.from_source(code)
+        for word in CANCEL_WORDS:
+            session = program.new_session()
+            program.step(session, '账户')
+            program.step(session, '充值')
+            self.assertEqual("已取消充值。", program.step(session, word))
+            self.assertIsNone(session.pending)
+            self.assertEqual('ACCOUNT', program.mode_name(session))
+            self.assertEqual(0.0, session.balance)
+            self.assertEqual("您的余额为  0.00", program.step(session, '余额'))
+
+
+    # 测试批量处理与逐条处理的结果和会话状态一致
+    def test_process_batch_matches_step(self):
+        program = Program.from_source(code)
+        rng = random.Random(7)
+        words = ['你好', '账户', '余额', '充值', '积分', '退出', '12', '-3', '天气', '8.5']
+
+        batch_sessions = [program.new_session(balance=i) for i in range(20)]
+        step_sessions = [program.new_session(balance=i) for i in range(20)]
+        for _ in range(20):
+            # 同一个会话可以在一批中出现多次
+            picks = [rng.randrange(20) for _ in range(50)]
+            inputs = [rng.choice(words) for _ in picks]
+
+            responses = program.process_batch([batch_sessions[i] for i in picks], inputs)
+            expected = [program.step(step_sessions[i], text) for i, text in zip(picks, inputs)]
+            self.assertEqual(expected, responses)
+
+        for batch_session, step_session in zip(batch_sessions, step_sessions):
+            self.assertEqual(
+                (step_session.mode, step_session.balance, step_session.variables, step_session.pending),
+                (batch_session.mode, batch_session.balance, batch_session.variables, batch_session.pending)
+            )
+
+if __name__ == '__main__':
+    unittest.main()
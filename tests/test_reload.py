@@ -0,0 +1,151 @@
+import random
+import threading
+import unittest
+from dsl.program import Program
+from dsl.reload import ProgramHost, stable_layout
+from dsl.codegen import GeneratedProgram
+from dsl.vm import VMProgram
+from dsl.persistence import session_record
+
+code = """
+start
+INIT
+    if "账户" in user_input then
+        response "已转移至账户模式"
+        go ACCOUNT
+    elif "商品" in user_input then
+        response "已转移至商品模式"
+        go GOODS
+    else
+        response "抱歉，我没有理解您的问题"
+ACCOUNT
+    if "余额" in user_input then
+        response "您的余额为 "
+    elif "退出" in user_input then
+        response "您已退出账户模式"
+        go INIT
+GOODS
+    if "名称" in user_input then
+        response "商品A, 商品B"
+    elif "退出" in user_input then
+        response "您已退出商品模式"
+        go INIT
+end
+"""
+
+# 新版本：删除 GOODS，新增 HELP，修改 ACCOUNT 的回复，并调整模式的顺序
+new_code = """
+start
+HELP
+    else
+        response "帮助信息"
+        go INIT
+ACCOUNT
+    if "余额" in user_input then
+        response "当前余额 {balance:.1f}"
+    elif "退出" in user_input then
+        response "已退出"
+        go INIT
+INIT
+    if "账户" in user_input then
+        response "进入账户"
+        go ACCOUNT
+    elif "帮助" in user_input then
+        response "进入帮助"
+        go HELP
+    else
+        response "没有理解"
+end
+"""
+
+
+class TestReload(unittest.TestCase):
+
+    # 测试同名模式保持编号，删除的模式留下空位，新增的模式排在最后
+    def test_stable_layout(self):
+        self.assertEqual(['INIT', 'ACCOUNT', None, 'HELP'],
+                         stable_layout(('INIT', 'ACCOUNT', 'GOODS'), {'HELP': {}, 'ACCOUNT': {}, 'INIT': {}}))
+
+    # 测试替换程序后会话留在同名模式，所在模式被删除的会话回到 INIT
+    def test_sessions_survive_reload(self):
+        host = ProgramHost(Program.from_source(code))
+        in_account = host.new_session(balance=2)
+        in_goods = host.new_session()
+        in_init = host.new_session()
+        host.step(in_account, '账户')
+        host.step(in_goods, '商品')
+
+        old_program = host.program
+        host.reload(new_code)
+        self.assertEqual(2, host.version)
+        self.assertIsNot(old_program, host.program)
+
+        self.assertEqual('ACCOUNT', host.mode_name(in_account))
+        self.assertEqual("当前余额 2.0", host.step(in_account, '余额'))
+        self.assertEqual('INIT', host.mode_name(in_goods))
+        self.assertEqual("进入帮助", host.step(in_goods, '帮助'))
+        self.assertEqual('HELP', host.mode_name(in_goods))
+        self.assertEqual("没有理解", host.step(in_init, '商品'))
+        self.assertEqual(('x', 'INIT', 0.0, None, None), session_record(host, 'x', host.new_session()))
+
+        # 旧版本的程序仍然可以完成已经开始处理的消息
+        self.assertEqual("您的余额为  2.00", old_program.step(in_account, '余额'))
+
+    # 测试编译失败时保留当前程序
+    def test_failed_reload(self):
+        host = ProgramHost(Program.from_source(code))
+        with self.assertRaises(SyntaxError):
+            host.reload(code.replace("go ACCOUNT", "go MISSING"))
+        self.assertEqual(1, host.version)
+        self.assertEqual("已转移至账户模式", host.step(host.new_session(), '账户'))
+
+    # 测试带有空位的程序在其他后端上的结果一致
+    def test_backends_after_reload(self):
+        host = ProgramHost(Program.from_source(code))
+        program = host.reload(new_code)
+        generated = GeneratedProgram(program)
+        vm = VMProgram.from_bytes(VMProgram.from_program(program).to_bytes())
+        rng = random.Random(4)
+        words = ['账户', '余额', '退出', '帮助', '商品', '名称', '你好']
+        sessions = [program.new_session(), generated.new_session(), vm.new_session()]
+        for session in sessions:
+            session.mode = 2  # 已被删除的 GOODS
+        for _ in range(200):
+            text = rng.choice(words)
+            expected = program.step(sessions[0], text)
+            self.assertEqual(expected, generated.step(sessions[1], text))
+            self.assertEqual(expected, vm.step(sessions[2], text))
+
+    # 测试处理消息的同时反复重载
+    def test_reload_under_load(self):
+        host = ProgramHost(Program.from_source(code))
+        sessions = [host.new_session() for _ in range(50)]
+        errors = []
+        done = threading.Event()
+
+        def chat():
+            rng = random.Random(1)
+            words = ['账户', '余额', '退出', '帮助', '商品', '名称']
+            try:
+                while not done.is_set():
+                    host.step(rng.choice(sessions), rng.choice(words))
+            except Exception as error:
+                errors.append(error)
+
+        workers = [threading.Thread(target=chat) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for i in range(40):
+            host.reload(new_code if i % 2 == 0 else code)
+        done.set()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual(41, host.version)
+        self.assertEqual({'INIT': 0, 'ACCOUNT': 1}, {name: host.mode_ids[name] for name in ('INIT', 'ACCOUNT')})
+        self.assertEqual({'INIT', 'ACCOUNT', 'GOODS'}, set(host.mode_ids))
+
+
+if __name__ == '__main__':
+    unittest.main()
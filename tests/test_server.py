@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from dsl.program import Program
+from dsl.server import ChatServer, LINE_LIMIT, HEADER_LIMIT
+from dsl.persistence import WriteBehindStore, SQLiteBackend
+from dsl.sessions import SessionManager
+
+code = """
+start
+INIT
+    if "你好" in user_input then
+        response "您好，很高兴为您服务"
+    elif "账户" in user_input then
+        response "已转移至账户模式"
+        go ACCOUNT
+    else
+        response "抱歉，我没有理解您的问题"
+ACCOUNT
+    if "余额" in user_input then
+        response "您的余额为 "
+    elif "退出" in user_input then
+        response "您已退出账户模式"
+        go INIT
+end
+"""
+
+
+async def send_lines(port, lines):
+    """ 通过行协议发送若干行，返回收到的回复行 """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(''.join(line + '\n' for line in lines).encode('utf-8'))
+    await writer.drain()
+    replies = [(await reader.readline()).decode('utf-8').rstrip('\n') for _ in lines]
+    writer.close()
+    return replies
+
+
+async def post_json(port, path, payload):
+    """ 发送一个 HTTP 请求，返回 (状态码, JSON对象) """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    method = 'POST' if payload is not None else 'GET'
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n'
+                 f'Connection: close\r\n\r\n'.encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body.decode('utf-8'))
+
+
+async def send_raw(port, data):
+    """ 发送原始的HTTP请求字节，返回状态码，连接被关闭且没有回复时返回 None """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split()[1]) if response else None
+
+
+class TestChatServer(unittest.TestCase):
+
+    def run_with_server(self, scenario, **options):
+        """ 启动服务器运行测试场景，结束后关闭服务器 """
+        async def main():
+            server = ChatServer(Program.from_source(code), **options)
+            await server.start()
+            try:
+                return await scenario(server)
+            finally:
+                await server.shutdown(timeout=1)
+        return asyncio.run(main())
+
+    # 测试行协议按会话编号保存状态
+    def test_line_protocol(self):
+        async def scenario(server):
+            first = await send_lines(server.port, ['alice\t账户', 'bob\t你好', 'alice\t余额'])
+            second = await send_lines(server.port, ['bob\t余额', 'alice\t退出'])
+            return first, second
+
+        first, second = self.run_with_server(scenario)
+        self.assertEqual(['alice\t已转移至账户模式', 'bob\t您好，很高兴为您服务', 'alice\t您的余额为  0.00'], first)
+        # 会话状态在连接之间保留
+        self.assertEqual(['bob\t抱歉，我没有理解您的问题', 'alice\t您已退出账户模式'], second)
+
+    # 测试没有会话编号的行使用连接自己的会话
+    def test_connection_session(self):
+        async def scenario(server):
+            replies = await send_lines(server.port, ['账户', '余额'])
+            return replies, len(server.sessions)
+
+        replies, sessions = self.run_with_server(scenario)
+        self.assertEqual('已转移至账户模式', replies[0].split('\t')[1])
+        self.assertEqual('您的余额为  0.00', replies[1].split('\t')[1])
+        self.assertEqual(1, sessions)
+
+    # 测试 HTTP/JSON 接口
+    def test_http(self):
+        async def scenario(server):
+            chat = await post_json(server.http_port, '/chat', {'session': 's1', 'message': '账户'})
+            bad = await post_json(server.http_port, '/chat', {'message': '账户'})
+            missing = await post_json(server.http_port, '/missing', None)
+            stats = await post_json(server.http_port, '/stats', None)
+            return chat, bad, missing, stats
+
+        chat, bad, missing, stats = self.run_with_server(scenario, http_port=0)
+        self.assertEqual((200, {'session': 's1', 'response': '已转移至账户模式'}), chat)
+        self.assertEqual(400, bad[0])
+        self.assertEqual(404, missing[0])
+        self.assertEqual(1, stats[1]['sessions'])
+        self.assertEqual(1, stats[1]['messages'])
+
+    # 测试非法或过大的 Content-Length 以及过长的请求头得到错误回复
+    def test_http_bad_requests(self):
+        async def scenario(server):
+            port = server.http_port
+            statuses = []
+            for length in ['abc', '-5', str(LINE_LIMIT + 1)]:
+                statuses.append(await send_raw(port, f'POST /chat HTTP/1.1\r\nContent-Length: {length}\r\n\r\n'.encode()))
+            statuses.append(await send_raw(port, b'GET /stats HTTP/1.1\r\nX-Long: ' + b'a' * (LINE_LIMIT + 10) + b'\r\n\r\n'))
+            # 请求头行数过多，或每行都不超过上限但总字节数过多
+            many = ''.join(f'X-{i}: {i}\r\n' for i in range(HEADER_LIMIT + 1))
+            statuses.append(await send_raw(port, f'GET /stats HTTP/1.1\r\n{many}\r\n'.encode()))
+            large = ''.join(f'X-{i}: {"a" * 1000}\r\n' for i in range(70))
+            statuses.append(await send_raw(port, f'GET /stats HTTP/1.1\r\n{large}\r\n'.encode()))
+            # 服务器仍然可以处理正常的请求
+            statuses.append((await post_json(port, '/chat', {'session': 's', 'message': '你好'}))[0])
+            return statuses
+
+        self.assertEqual([400, 400, 413, 400, 431, 431, 200], self.run_with_server(scenario, http_port=0))
+
+    # 测试大量并发客户端
+    def test_many_clients(self):
+        async def scenario(server):
+            clients = [send_lines(server.port, [f'user{i}\t账户', f'user{i}\t余额']) for i in range(200)]
+            return await asyncio.gather(*clients), len(server.sessions)
+
+        results, sessions = self.run_with_server(scenario)
+        self.assertEqual(200, sessions)
+        for i, replies in enumerate(results):
+            self.assertEqual(f'user{i}\t您的余额为  0.00', replies[1])
+
+    # 测试使用持久化的会话存储，重启后会话状态仍然存在
+    def test_persistent_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sessions.db')
+            program = Program.from_source(code)
+
+            async def scenario(server):
+                return await send_lines(server.port, ['alice\t账户'])
+
+            store = WriteBehindStore(program, SQLiteBackend(path))
+            self.run_with_server(scenario, store=store)
+            store.close()
+
+            store = WriteBehindStore(program, SQLiteBackend(path))
+            self.assertEqual('ACCOUNT', program.mode_name(store.get('alice')))
+            store.close()
+
+    # 测试使用会话管理器时，换入会话的磁盘读取不在事件循环的线程中进行
+    def test_session_manager_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = SQLiteBackend(os.path.join(directory, 'sessions.db'))
+            readers = []
+            load = backend.load
+            backend.load = lambda session_id: (readers.append(threading.current_thread()), load(session_id))[1]
+            store = SessionManager(Program.from_source(code), backend, max_resident=2)
+
+            async def scenario(server):
+                lines = [f'user{i}\t账户' for i in range(5)] + ['user0\t余额']
+                return await send_lines(server.port, lines)
+
+            replies = self.run_with_server(scenario, store=store)
+            store.close()
+            self.assertEqual('user0\t您的余额为  0.00', replies[-1])
+            self.assertTrue(readers)
+            self.assertNotIn(threading.main_thread(), readers)
+
+    # 测试关闭服务器时已接收的消息仍然得到回复，之后不再接受新连接
+    def test_graceful_shutdown(self):
+        async def main():
+            server = ChatServer(Program.from_source(code), max_pending=4)
+            await server.start()
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            writer.write('a\t你好\n'.encode('utf-8'))
+            await writer.drain()
+            first = await reader.readline()
+
+            await server.shutdown(timeout=1)
+            rest = await reader.read()  # 服务器关闭连接
+            writer.close()
+            with self.assertRaises(OSError):
+                await asyncio.open_connection('127.0.0.1', server.port)
+            return first, rest, server.connections
+
+        first, rest, connections = asyncio.run(main())
+        self.assertEqual('a\t您好，很高兴为您服务\n', first.decode('utf-8'))
+        self.assertEqual(b'', rest)
+        self.assertEqual(set(), connections)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from dsl.program import Program
+from dsl.persistence import SQLiteBackend, session_record
+from dsl.sessions import SessionManager
+
+code = """
+start
+INIT
+    if "账户" in user_input then
+        response "已转移至账户模式"
+        go ACCOUNT
+ACCOUNT
+    if "余额" in user_input then
+        response "您的余额为 "
+    elif "充值" in user_input then
+        response "请输入您所充值的金额"
+    elif "退出" in user_input then
+        response "您已退出账户模式"
+        go INIT
+end
+"""
+
+
+class FakeClock:
+    """ 可以手动拨动的时钟 """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSessionManager(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.program = Program.from_source(code)
+        self.backend = SQLiteBackend(os.path.join(self.directory.name, 'spill.db'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # 测试超过数量上限时换出最久未使用的会话，再次使用时透明换入
+    def test_lru_eviction(self):
+        manager = SessionManager(self.program, self.backend, max_resident=2)
+        manager.step('a', '账户')
+        manager.step('a', '充值')
+        manager.step('a', '7')
+        manager.step('b', '账户')
+        manager.step('a', '余额')  # a 成为最近使用的会话
+        manager.step('c', '你好')
+        self.assertEqual(['a', 'c'], list(manager.resident))
+        self.assertEqual({'resident': 2, 'evictions': 1, 'reloads': 0, 'created': 3}, manager.stats())
+
+        self.assertEqual("您已退出账户模式", manager.step('b', '退出'))  # b 从磁盘换入
+        self.assertEqual(1, manager.stats()['reloads'])
+        self.assertEqual("您的余额为  7.00", manager.step('a', '余额'))
+        manager.close()
+
+    # 测试空闲超时的会话被换出
+    def test_ttl_eviction(self):
+        clock = FakeClock()
+        manager = SessionManager(self.program, self.backend, ttl=10, clock=clock)
+        manager.step('a', '账户')
+        clock.now = 5
+        manager.step('b', '账户')
+        clock.now = 12
+        manager.step('b', '余额')
+        self.assertEqual(['b'], list(manager.resident))
+        self.assertEqual(1, manager.evictions)
+        self.assertEqual('ACCOUNT', self.program.mode_name(manager.get('a')))
+        manager.close()
+
+    # 测试拒绝无法保留任何会话的设置
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            SessionManager(self.program, self.backend, ttl=0.0)
+        with self.assertRaises(ValueError):
+            SessionManager(self.program, self.backend, ttl=-1)
+        with self.assertRaises(ValueError):
+            SessionManager(self.program, self.backend, max_resident=0)
+
+    # 测试刚换入或刚使用的会话不会被自己触发的换出换掉，处理消息不会陷入死循环
+    def test_keeps_admitted_session(self):
+        ticks = iter(range(1000000))
+        # 每次读取时钟都前进 1 秒，任何会话在换出检查时都已超过 0.5 秒的空闲超时
+        manager = SessionManager(self.program, self.backend, max_resident=1, ttl=0.5, clock=lambda: next(ticks),
+                                 flush_interval=60)
+        results = []
+        worker = threading.Thread(target=lambda: results.extend(
+            [manager.step('a', '账户'), manager.step('b', '账户'), manager.step('a', '余额')]), daemon=True)
+        worker.start()
+        worker.join(5)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(["已转移至账户模式", "已转移至账户模式", "您的余额为  0.00"], results)
+        self.assertEqual(['a'], list(manager.resident))
+        manager.close()
+
+    # 测试没有消息到来时写入线程也会按时换出空闲超时的会话
+    def test_idle_sweep(self):
+        clock = FakeClock()
+        manager = SessionManager(self.program, self.backend, ttl=10, clock=clock, flush_interval=0.01)
+        manager.step('a', '账户')
+        clock.now = 20
+        deadline = time.time() + 5
+        while manager.resident and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([], list(manager.resident))
+        while self.backend.load('a') is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual('ACCOUNT', self.backend.load('a')[1])
+        manager.close()
+
+    # 测试大量只出现一次的用户不会使常驻会话数量增长，没有修改的会话换出时不再写入
+    def test_memory_stays_flat(self):
+        manager = SessionManager(self.program, self.backend, max_resident=100, spill_batch=1)
+        for i in range(2000):
+            manager.step(f'user{i}', '账户')
+        self.assertEqual(100, len(manager))
+        self.assertEqual(1900, manager.evictions)
+
+        for i in range(100):
+            manager.get(f'user{i}')  # 只读取，不修改
+        manager.flush()  # 写入被换出的 user1900 ~ user1999
+        written = []
+        write_many = self.backend.write_many
+        self.backend.write_many = lambda records: (written.extend(records), write_many(records))
+        for i in range(100, 200):
+            manager.get(f'user{i}')  # 换出的是刚才换入且没有修改的会话
+        self.assertEqual([], written)
+        self.assertEqual(200, manager.stats()['reloads'])
+        manager.close()
+
+    # 测试常驻会话的修改由后台线程定时写入，不需要等到换出或关闭
+    def test_resident_sessions_written(self):
+        manager = SessionManager(self.program, self.backend, flush_interval=0.01)
+        manager.step('a', '账户')
+        deadline = time.time() + 5
+        while self.backend.load('a') is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual('ACCOUNT', self.backend.load('a')[1])
+        self.assertEqual(['a'], list(manager.resident))
+        manager.close()
+
+    # 测试处理消息的线程不写入磁盘，换出的会话由写入线程写入
+    def test_spill_off_message_path(self):
+        writers = []
+        write_many = self.backend.write_many
+        self.backend.write_many = lambda records: (writers.append(threading.current_thread()), write_many(records))
+        manager = SessionManager(self.program, self.backend, max_resident=10, spill_batch=5, flush_interval=60)
+        for i in range(100):
+            manager.step(f'user{i}', '账户')
+        self.assertNotIn(threading.current_thread(), writers)
+        self.assertEqual('ACCOUNT', self.program.mode_name(manager.get('user0')))  # 从内存或磁盘换入
+        manager.close()
+        backend = SQLiteBackend(os.path.join(self.directory.name, 'spill.db'))
+        self.assertEqual('ACCOUNT', backend.load('user99')[1])
+        backend.close()
+
+    # 测试正在写入的会话换入时使用内存中的记录，而不是磁盘上的旧记录
+    def test_reload_while_writing(self):
+        manager = SessionManager(self.program, self.backend, flush_interval=60)
+        session = self.program.new_session(balance=9.0)
+        manager.writing = {'a': session_record(self.program, 'a', session)}
+        self.assertTrue(manager.cached('a'))
+        self.assertEqual(9.0, manager.get('a').balance)
+        self.assertIn('a', manager.dirty)
+        manager.writing = {}
+        manager.close()
+
+    # 测试写入失败时换出的会话和常驻会话都会在下次写入时重试
+    def test_write_failure(self):
+        write_many = self.backend.write_many
+        failures = [OSError("disk full")]
+
+        def flaky(records):
+            if failures:
+                raise failures.pop()
+            write_many(records)
+
+        self.backend.write_many = flaky
+        manager = SessionManager(self.program, self.backend, max_resident=1, flush_interval=60)
+        manager.step('a', '账户')
+        manager.step('b', '账户')  # a 被换出
+        with self.assertRaises(OSError):
+            manager.flush()
+        self.assertEqual({'a'}, set(manager.spilled))
+        self.assertEqual({'b'}, manager.dirty)
+        self.assertEqual(1, manager.failures)
+        self.assertEqual('persistence_error', self.program.events.drain()[-1]['kind'])
+
+        manager.flush()
+        self.assertEqual('ACCOUNT', self.backend.load('a')[1])
+        self.assertEqual('ACCOUNT', self.backend.load('b')[1])
+        manager.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
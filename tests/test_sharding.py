@@ -0,0 +1,143 @@
+import gc
+import multiprocessing
+import random
+import threading
+import unittest
+from dsl.program import Program
+from dsl.sharding import ShardedEngine
+
+code = """
+start
+INIT
+    if "你好" in user_input then
+        response "您好，很高兴为您服务"
+    elif "账户" in user_input then
+        response "已转移至账户模式"
+        go ACCOUNT
+    else
+        response "抱歉，我没有理解您的问题"
+ACCOUNT
+    if "余额" in user_input then
+        response "您的余额为 "
+    elif "充值" in user_input then
+        response "请输入您所充值的金额"
+        set balance = balance + user_input
+    elif "退出" in user_input then
+        response "您已退出账户模式"
+        go INIT
+end
+"""
+
+
+class TestShardedEngine(unittest.TestCase):
+
+    # 测试分片运行的结果与单进程逐条处理一致
+    def test_matches_single_process(self):
+        program = Program.from_source(code)
+        sessions = {}
+        rng = random.Random(5)
+        words = ['你好', '账户', '余额', '充值', '退出', '12', '-3', '天气']
+
+        with ShardedEngine(code, num_shards=3) as engine:
+            for _ in range(10):
+                session_ids = [f'user{rng.randrange(40)}' for _ in range(80)]
+                inputs = [rng.choice(words) for _ in session_ids]
+
+                expected = []
+                for session_id, text in zip(session_ids, inputs):
+                    session = sessions.setdefault(session_id, program.new_session())
+                    expected.append(program.step(session, text))
+                self.assertEqual(expected, engine.process_batch(session_ids, inputs))
+
+            stats = engine.stats()
+            self.assertEqual(len(sessions), sum(shard['sessions'] for shard in stats))
+            self.assertEqual(800, sum(shard['messages'] for shard in stats))
+            self.assertEqual([0, 0, 0], engine.queue_depths())
+
+    # 测试异步提交：回复收取之前可以观察到各分片的队列深度，多个批次可以按任意顺序收取
+    def test_queue_depths(self):
+        with ShardedEngine(code, num_shards=2) as engine:
+            session_ids = [f'user{i}' for i in range(50000)]
+            first = engine.submit(session_ids, ['账户'] * 50000)
+            second = engine.submit(session_ids[:10], ['余额'] * 10)
+            depths = engine.queue_depths()
+            self.assertGreater(sum(depths), 0)
+            self.assertLessEqual(sum(depths), 50010)
+
+            self.assertEqual(["您的余额为  0.00"] * 10, engine.collect(second))
+            self.assertEqual(["已转移至账户模式"] * 50000, engine.collect(first))
+            self.assertEqual([0, 0], engine.queue_depths())
+
+    # 测试同一个会话编号总是分配到同一个分片，状态保留在该分片中
+    def test_session_affinity(self):
+        with ShardedEngine(code, num_shards=4) as engine:
+            self.assertEqual(engine.shard_of('alice'), engine.shard_of('alice'))
+            self.assertEqual("已转移至账户模式", engine.step('alice', '账户'))
+            self.assertEqual("您的余额为  0.00", engine.step('alice', '余额'))
+            self.assertEqual("抱歉，我没有理解您的问题", engine.step('bob', '余额'))
+
+            stats = engine.stats()
+            self.assertEqual(2, sum(shard['sessions'] for shard in stats))
+            self.assertGreaterEqual(stats[engine.shard_of('alice')]['sessions'], 1)
+            self.assertEqual(4, len({shard['pid'] for shard in stats}))
+
+    # 测试路由计划：重复的会话编号列表复用上一批的路由，编号列表变化和消息中含有分隔符时结果不变
+    def test_routing_plan(self):
+        program = Program.from_source(code)
+        sessions = {}
+        batches = [
+            (['a', 'b', 'c', 'd'], ['账户', '你好', '账户', '天气']),
+            (['a', 'b', 'c', 'd'], ['余额', '账户', '充值', '你好']),
+            (['a', 'b', 'c', 'd'], ['余额', '余额', '5\x1f', '余额']),
+            (['d', 'c'], ['账户', '余额']),
+            (['a', 'b', 'c', 'd'], ['退出', '余额', '余额', '余额']),
+        ]
+        with ShardedEngine(code, num_shards=2) as engine:
+            for session_ids, inputs in batches:
+                expected = []
+                for session_id, text in zip(session_ids, inputs):
+                    session = sessions.setdefault(session_id, program.new_session())
+                    expected.append(program.step(session, text))
+                self.assertEqual(expected, engine.process_batch(session_ids, inputs))
+            self.assertEqual(3, engine.plan_count)
+            self.assertEqual({'a', 'b', 'c', 'd'}, set(engine.assignments))
+
+    # 测试预派生模式：工作进程直接使用父进程编译好的程序，多个脚本的会话互不影响
+    @unittest.skipIf('fork' not in multiprocessing.get_all_start_methods(), "fork is not available")
+    def test_prefork(self):
+        other = code.replace("您好，很高兴为您服务", "Hello")
+        with ShardedEngine.prefork({'zh': code, 'en': other}, num_shards=2) as engine:
+            self.assertEqual(('zh', 'en'), engine.script_names)
+            self.assertEqual("您好，很高兴为您服务", engine.step('alice', '你好', script='zh'))
+            self.assertEqual("Hello", engine.step('alice', '你好', script='en'))
+            self.assertEqual("已转移至账户模式", engine.step('alice', '账户', script='zh'))
+            self.assertEqual("抱歉，我没有理解您的问题", engine.step('alice', '余额', script='en'))
+
+            stats = engine.stats()
+            self.assertEqual([0, 0], [shard['compiled'] for shard in stats])
+            self.assertEqual(2, sum(shard['sessions'] for shard in stats))
+
+        # 父进程中的垃圾回收在 fork 之后恢复
+        self.assertEqual(0, gc.get_freeze_count())
+        self.assertTrue(gc.isenabled())
+
+        with ShardedEngine({'zh': code}, num_shards=1) as engine:
+            self.assertEqual(1, engine.stats()[0]['compiled'])
+
+    # 测试预派生模式拒绝在已有其他线程时 fork
+    @unittest.skipIf('fork' not in multiprocessing.get_all_start_methods(), "fork is not available")
+    def test_prefork_rejects_threads(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait, name='background-writer')
+        thread.start()
+        try:
+            with self.assertRaisesRegex(RuntimeError, 'background-writer'):
+                ShardedEngine.prefork(code, num_shards=1)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertTrue(gc.isenabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import random
+import unittest
+from dsl.program import Program
+from dsl.vm import VMProgram, OpcodeProfiler, JUMP, INSTRUCTION_SIZE
+
+code = """
+start
+INIT
+    if "你好" in user_input then
+        response "您好，很高兴为您服务"
+    elif "账户" in user_input then
+        response "已转移至账户模式"
+        go ACCOUNT
+    else
+        response "抱歉，我没有理解您的问题"
+ACCOUNT
+    if "余额" in user_input then
+        response "您的余额为 "
+    elif "充值" in user_input then
+        response "请输入您所充值的金额"
+        set balance = balance + user_input
+    elif "积分" in user_input then
+        response "积分已增加，当前积分 {points}"
+        set points = points + user_input
+    elif "退出" in user_input then
+        response "您已退出账户模式"
+        go INIT
+    else
+        response "抱歉，我没有理解您的问题"
+end
+"""
+
+words = ['你好', '账户', '余额', '充值', '积分', '退出', '12', '-3', '天气']
+
+
+class TestVM(unittest.TestCase):
+
+    def run_both(self, vm, program, rounds=300):
+        """ 随机输入下字节码与 Program.step 的回复和会话状态一致 """
+        rng = random.Random(2)
+        expected_session = program.new_session()
+        session = vm.new_session()
+        for _ in range(rounds):
+            text = rng.choice(words)
+            self.assertEqual(program.step(expected_session, text), vm.step(session, text))
+            self.assertEqual(
+                (expected_session.mode, expected_session.balance, expected_session.variables, expected_session.pending),
+                (session.mode, session.balance, session.variables, session.pending)
+            )
+
+    # 测试字节码与 Program 的执行结果一致
+    def test_matches_program(self):
+        program = Program.from_source(code)
+        self.run_both(VMProgram.from_program(program), program)
+
+    # 测试序列化后恢复的字节码仍然一致，且比嵌套字典小得多
+    def test_serialize(self):
+        program = Program.from_source(code)
+        data = VMProgram.from_program(program).to_bytes()
+        self.run_both(VMProgram.from_bytes(data), program)
+
+        import marshal
+        self.assertLess(len(data), len(marshal.dumps(program.data)) / 2)
+
+    # 测试相同的分支体只生成一次，通过 JUMP 复用
+    def test_shared_bodies(self):
+        vm = VMProgram.from_source(code)
+        opcodes = vm.code[::INSTRUCTION_SIZE]
+        self.assertEqual(1, list(opcodes).count(JUMP))
+        self.assertEqual(1, vm.constants.count("抱歉，我没有理解您的问题"))
+
+    # 测试反汇编输出
+    def test_disassemble(self):
+        text = VMProgram.from_source(code).disassemble()
+        self.assertIn("INIT:", text)
+        self.assertIn("ACCOUNT:", text)
+        self.assertIn("GOTO_MODE  1 (ACCOUNT)", text)
+        self.assertIn("SET_ADD    points = points + user_input", text)
+        self.assertIn("'您的余额为  {0:.2f}'.format(balance)", text)
+
+    # 测试按操作码统计执行次数
+    def test_profiler(self):
+        vm = VMProgram.from_source(code)
+        profiler = OpcodeProfiler()
+        session = vm.new_session()
+        self.assertEqual("已转移至账户模式", vm.step_profiled(session, '账户', profiler))
+        self.assertEqual("您的余额为  0.00", vm.step_profiled(session, '余额', profiler))
+
+        report = profiler.report()
+        self.assertEqual(3, report['MATCH_ANY'][0])
+        self.assertEqual(2, report['RESPOND'][0])
+        self.assertEqual(1, report['GOTO_MODE'][0])
+        self.assertNotIn('SET_ADD', report)
+
+
+if __name__ == '__main__':
+    unittest.main()
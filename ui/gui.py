@@ -3,9 +3,11 @@ import tkinter as tk
 from tkinter import scrolledtext
 from tkinter import messagebox
 from PIL import Image, ImageTk  # 导入Pillow库
-from dsl.lexer import Lexer
-from dsl.parser import Parser
 from dsl.interpreter import Interpreter
+from dsl.program import Program, build_program
+from dsl.incremental import IncrementalParser
+from dsl.cache import DiskCache
+from dsl.reload import stable_layout
 
 class ChatbotGUI:
     def __init__(self, root):
@@ -36,6 +38,12 @@ class ChatbotGUI:
         # 初始化解释器
         self.interpreter = None
 
+        # 增量前端，重新加载修改过的脚本时只解析发生变化的模式块
+        self.frontend = IncrementalParser()
+
+        # 磁盘编译缓存，脚本未修改时直接读取编译结果
+        self.cache = DiskCache()
+
         # 获取当前目录路径
         current_directory = os.path.dirname(__file__)
 
@@ -76,13 +84,8 @@ class ChatbotGUI:
             return
 
         if self.interpreter:
-            # 在账户模式下输入“充值”时，弹出充值对话框
-            if self.interpreter.context['current_mode'] == 'ACCOUNT' and "充值" in user_text:
-                self.prompt_for_recharge()  # 弹出充值窗口
-                response = None  # 不需要显示机器人回复
-            else:
-                # 获取机器人的回复
-                response = self.interpreter.process_input(user_text)  # 修改为process_input
+            # 获取机器人的回复，充值金额等待输入时由下一条消息完成
+            response = self.interpreter.process_input(user_text)
 
             # 显示用户输入和机器人回复（如果有）
             if response is not None:
@@ -153,11 +156,14 @@ class ChatbotGUI:
             self.chat_box.insert(tk.END, f"加载脚本: {script_file}\n")
             self.chat_box.config(state=tk.DISABLED)
 
-            # 从上下文中获取当前余额
-            balance = self.interpreter.context.get('balance', 0) if self.interpreter else 0
-
-            # 创建并执行脚本
-            self.interpreter = self.execute_script(script_code, balance)
+            program = self.execute_script(script_code, script_file)
+            if self.interpreter:
+                # 热重载：保留整个会话（当前模式、余额和变量），同名模式保持原来的编号，删除的模式按 INIT 处理
+                layout = stable_layout(self.interpreter.program.layout, program.data)
+                self.interpreter.program = Program(program.data, program.events, layout)
+            else:
+                # 第一次加载脚本时创建解释器和会话
+                self.interpreter = Interpreter.from_program(program)
 
     def load_script_from_file(self, file_path):
         """ 从脚本文件加载代码 """
@@ -167,50 +173,18 @@ class ChatbotGUI:
         with open(file_path, 'r', encoding='utf-8') as file:
             return file.read()
 
-    def execute_script(self, script_code, balance):
-        """ 执行DSL脚本并返回解释器 """
-        lexer = Lexer(script_code)
-        tokens = lexer.tokenize()
-
-        parser = Parser(tokens)
-        ast = parser.parse()
-
-        # 创建并返回解释器，传递余额
-        interpreter = Interpreter(ast, balance)
-        return interpreter
-
-    def prompt_for_recharge(self):
-        """ 提示用户输入充值金额，并检查其合法性 """
-
-        def submit_recharge():
+    def execute_script(self, script_code, script_file):
+        """ 编译DSL脚本并返回已编译的程序 """
+        program = self.cache.load(script_file, script_code)
+        if program is None:
+            # 缓存失效时只重新词法分析和解析发生变化的模式块
+            ast = self.frontend.parse(script_code)
+            program = Program(build_program(ast))
             try:
-                recharge_amount = float(recharge_entry.get())
-                if recharge_amount < 0:
-                    messagebox.showerror("错误", "金额不能为负！")
-                    return
-                self.chat_box.config(state=tk.NORMAL)
-                self.chat_box.insert(tk.END, f"充值成功！充值金额为: {recharge_amount:.2f} 元\n")
-                self.chat_box.config(state=tk.DISABLED)
-                self.interpreter.context['balance'] += recharge_amount  # 更新余额
-                recharge_window.destroy()
-            except ValueError:
-                messagebox.showerror("错误", "请输入一个有效的数字！")
-
-        recharge_window = tk.Toplevel(self.root)
-        recharge_window.title("充值金额")
-        recharge_window.geometry("300x150")
-
-        label = tk.Label(recharge_window, text="请输入充值金额：")
-        label.pack(pady=10)
-
-        recharge_entry = tk.Entry(recharge_window, width=20)
-        recharge_entry.pack(pady=5)
-
-        submit_button = tk.Button(recharge_window, text="提交", command=submit_recharge)
-        submit_button.pack(pady=10)
-
-        cancel_button = tk.Button(recharge_window, text="取消", command=recharge_window.destroy)
-        cancel_button.pack(pady=5)
+                self.cache.store(script_file, script_code, program)
+            except OSError:
+                pass
+        return program
 
 
 # 创建主程序窗口